@@ -0,0 +1,55 @@
+"""
+gunicorn settings, read automatically when gunicorn starts in this directory:
+
+    gunicorn would_you_rather.wsgi:application
+
+The app is loaded and warmed once in the master (polls/warmup.py), so
+workers fork with settings, URL resolvers and compiled templates already in
+memory and serve their first request warm.
+"""
+import gc
+import os
+
+
+bind = os.environ.get('GUNICORN_BIND', '127.0.0.1:8000')
+workers = int(os.environ.get('GUNICORN_WORKERS', '4'))
+threads = int(os.environ.get('GUNICORN_THREADS', '1'))
+preload_app = os.environ.get('GUNICORN_PRELOAD', '1') == '1'
+
+
+def on_starting(server):
+    # Votes update the voter's answered-question set in the cache
+    # (polls/answered.py); with a per-process cache the other workers would
+    # keep serving feeds from their stale copies, so run a single worker
+    if server.num_workers > 1:
+        os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'would_you_rather.settings')
+        from polls.caching import is_shared
+        if not is_shared():
+            server.log.warning(
+                'Starting 1 worker instead of %d: several workers need a shared cache '
+                '(set CACHE_BACKEND and CACHE_LOCATION, e.g. Redis or Memcached)',
+                server.num_workers,
+            )
+            server.num_workers = 1
+
+
+def when_ready(server):
+    # Move everything loaded so far out of the collector's reach, so its
+    # passes in the workers don't write to (and un-share) the master's pages
+    if preload_app:
+        gc.freeze()
+
+
+def post_fork(server, worker):
+    # Without preload the worker loads (and warms) the app itself, later
+    if preload_app:
+        from polls.warmup import after_fork
+        after_fork()
+
+
+def child_exit(server, worker):
+    # Fold the worker's metrics file into the exited-workers total (see polls/metrics.py)
+    directory = os.environ.get('METRICS_MULTIPROC_DIR')
+    if directory:
+        from polls.metrics import mark_process_dead
+        mark_process_dead(worker.pid, directory)
@@ -1,13 +1,39 @@
-from django.contrib import admin
+from django.contrib import admin, messages
+from django.contrib.admin import helpers
+from django.contrib.admin.views.main import ChangeList
 from django.contrib.auth.admin import UserAdmin as BaseUserAdmin
+from django.db import IntegrityError, transaction
+from django.db.models import Count
+from django.template.loader import render_to_string
+from django.template.response import TemplateResponse
+from django.urls import reverse
+from django.utils import timezone
 from django.utils.html import format_html
-from .models import User, Question, Answer
+from .forms import ReassignAuthorForm
+from .models import User, Question, Answer, VoteRollup, Task
+from . import jobs, moderation, purge, rollups, sharding
+
+
+def batch_link(batch):
+    """Link to the batch's tasks, where TaskAdmin shows how many parts are left"""
+    return format_html('<a href="{}?q={}">{}</a>', reverse('admin:polls_task_changelist'), batch, batch)
 
 
 # =========================
 # USER ADMIN
 # =========================
 
+class UserChangeList(ChangeList):
+    def get_results(self, request):
+        super().get_results(request)
+        # Answer counts for the whole page in one GROUP BY per shard, rather
+        # than a scatter-gather per row
+        self.result_list = list(self.result_list)
+        counts = sharding.answer_counts_by_user([user.id for user in self.result_list])
+        for user in self.result_list:
+            user.answers_count = counts.get(user.id, 0) + user.archived_answers
+
+
 @admin.register(User)
 class UserAdmin(BaseUserAdmin):
     """Custom User Admin with enhanced display and functionality"""
@@ -41,6 +67,14 @@ class UserAdmin(BaseUserAdmin):
         }),
     )
 
+    actions = ['purge_selected']
+
+    def get_queryset(self, request):
+        return super().get_queryset(request).annotate(questions_count=Count('questions'))
+
+    def get_changelist(self, request, **kwargs):
+        return UserChangeList
+
     def full_name(self, obj):
         if obj.first_name and obj.last_name:
             return f"{obj.first_name} {obj.last_name}"
@@ -58,25 +92,65 @@ class UserAdmin(BaseUserAdmin):
     avatar_preview.short_description = 'Avatar'
 
     def questions_asked(self, obj):
-        return format_html('<strong>{}</strong>', obj.questions.count())
+        return format_html('<strong>{}</strong>', obj.questions_count)
     questions_asked.short_description = 'Questions Asked'
 
     def questions_answered(self, obj):
-        return format_html('<strong>{}</strong>', obj.answers.count())
+        return format_html('<strong>{}</strong>', obj.answers_count)
     questions_answered.short_description = 'Questions Answered'
 
     def total_score_display(self, obj):
         return format_html(
             '<strong style="color: #667eea;">{}</strong>',
-            obj.total_score
+            obj.questions_count + obj.answers_count
         )
     total_score_display.short_description = 'Total Score'
 
+    @admin.action(description='Delete selected users and all their data (background)')
+    def purge_selected(self, request, queryset):
+        # Chunked raw deletes in the task queue (polls/purge.py) rather than
+        # the ORM collecting every answer in this request
+        # Queued before deactivating: the selection may be filtered on is_active
+        users = queryset.exclude(id=request.user.id)
+        batch, parts = moderation.queue_in_chunks(
+            jobs.purge_users, users.order_by('id').values_list('id', flat=True),
+            chunk_size=purge.IDS_PER_TASK,
+        )
+        deactivated = users.update(is_active=False)
+        self.message_user(request, format_html(
+            '{} user(s) deactivated and queued for deletion in {} part(s) as {}.',
+            deactivated, parts, batch_link(batch),
+        ))
+
 
 # =========================
 # QUESTION ADMIN
 # =========================
 
+class QuestionChangeList(ChangeList):
+    def get_results(self, request):
+        super().get_results(request)
+        # Vote counts for the whole page in one GROUP BY per shard (a join
+        # can't reach answers on the shard databases), not three per row
+        self.result_list = list(self.result_list)
+        counts = sharding.answer_counts_by_question([question.id for question in self.result_list])
+        for question in self.result_list:
+            live = counts.get(question.id, {})
+            question.page_votes = (
+                live.get('optionOne', 0) + question.archived_option_one_votes,
+                live.get('optionTwo', 0) + question.archived_option_two_votes,
+            )
+
+
+def vote_counts(question):
+    """(option one, option two, total) votes, from the changelist's page counts when there"""
+    if hasattr(question, 'page_votes'):
+        option_one, option_two = question.page_votes
+    else:
+        option_one, option_two = question.option_one_votes, question.option_two_votes
+    return option_one, option_two, option_one + option_two
+
+
 @admin.register(Question)
 class QuestionAdmin(admin.ModelAdmin):
     """Question Admin with enhanced features"""
@@ -89,20 +163,24 @@ class QuestionAdmin(admin.ModelAdmin):
         'total_votes_display',
         'option_one_percentage',
         'option_two_percentage',
+        'is_hidden',
     ]
 
-    list_filter = ['created_at', 'author']
+    list_filter = ['is_hidden', 'created_at', 'author']
     search_fields = ['option_one_text', 'option_two_text', 'author__username']
     date_hierarchy = 'created_at'
 
-    readonly_fields = ['created_at', 'vote_statistics']
+    readonly_fields = ['created_at', 'vote_statistics', 'vote_trend']
+    # Every action is a set-based UPDATE or queued background work, so
+    # "select all" on tens of thousands of rows never loads them
+    actions = ['hide_selected', 'unhide_selected', 'reassign_author', 'recompute_stats', 'purge_selected']
 
     fieldsets = (
         ('Question Details', {
-            'fields': ('author', 'option_one_text', 'option_two_text'),
+            'fields': ('author', 'option_one_text', 'option_two_text', 'is_hidden'),
         }),
         ('Metadata', {
-            'fields': ('created_at', 'vote_statistics'),
+            'fields': ('created_at', 'vote_statistics', 'vote_trend'),
         }),
     )
 
@@ -110,15 +188,19 @@ class QuestionAdmin(admin.ModelAdmin):
         return f"{obj.option_one_text[:30]}... or {obj.option_two_text[:30]}..."
     question_preview.short_description = 'Question'
 
+    def get_changelist(self, request, **kwargs):
+        return QuestionChangeList
+
     def total_votes_display(self, obj):
-        return format_html('<strong>{}</strong>', obj.total_votes)
+        return format_html('<strong>{}</strong>', vote_counts(obj)[2])
     total_votes_display.short_description = 'Total Votes'
 
     def option_one_percentage(self, obj):
-        if obj.total_votes == 0:
+        option_one, option_two, total = vote_counts(obj)
+        if total == 0:
             return '0%'
 
-        pct = f"{(obj.option_one_votes / obj.total_votes) * 100:.1f}%"
+        pct = f"{(option_one / total) * 100:.1f}%"
         return format_html(
             '<span style="color: #3298dc;">{}</span>',
             pct
@@ -126,10 +208,11 @@ class QuestionAdmin(admin.ModelAdmin):
     option_one_percentage.short_description = 'Option 1 %'
 
     def option_two_percentage(self, obj):
-        if obj.total_votes == 0:
+        option_one, option_two, total = vote_counts(obj)
+        if total == 0:
             return '0%'
 
-        pct = f"{(obj.option_two_votes / obj.total_votes) * 100:.1f}%"
+        pct = f"{(option_two / total) * 100:.1f}%"
         return format_html(
             '<span style="color: #48c774;">{}</span>',
             pct
@@ -155,6 +238,65 @@ class QuestionAdmin(admin.ModelAdmin):
         )
     vote_statistics.short_description = 'Vote Statistics'
 
+    def vote_trend(self, obj):
+        # Read from the rollup tables (see polls/rollups.py), not raw answers
+        return render_to_string('polls/admin_vote_trend.html', {
+            'hourly': rollups.trend(obj.id, VoteRollup.HOUR, buckets=48),
+            'daily': rollups.trend(obj.id, VoteRollup.DAY, buckets=30),
+        })
+    vote_trend.short_description = 'Vote Trend'
+
+    @admin.action(description='Hide selected questions')
+    def hide_selected(self, request, queryset):
+        updated = queryset.update(is_hidden=True)
+        self.message_user(request, f'{updated} question(s) hidden.')
+
+    @admin.action(description='Unhide selected questions')
+    def unhide_selected(self, request, queryset):
+        updated = queryset.update(is_hidden=False)
+        self.message_user(request, f'{updated} question(s) visible again.')
+
+    @admin.action(description='Reassign author of selected questions')
+    def reassign_author(self, request, queryset):
+        form = ReassignAuthorForm(request.POST if 'apply' in request.POST else None)
+        if form.is_valid():
+            author = form.cleaned_data['author']
+            updated = queryset.update(author=author)
+            self.message_user(request, f'{updated} question(s) reassigned to {author.username}.')
+            return None
+        # Intermediate page; posts back to the same filtered changelist URL
+        return TemplateResponse(request, 'polls/admin_reassign_author.html', {
+            **self.admin_site.each_context(request),
+            'title': 'Reassign author',
+            'opts': self.model._meta,
+            'form': form,
+            'count': queryset.count(),
+            'select_across': request.POST.get('select_across', '0'),
+            'selected': request.POST.getlist(helpers.ACTION_CHECKBOX_NAME),
+            'action_checkbox_name': helpers.ACTION_CHECKBOX_NAME,
+        })
+
+    @admin.action(description='Recompute vote stats of selected questions (background)')
+    def recompute_stats(self, request, queryset):
+        batch, parts = moderation.queue_in_chunks(
+            jobs.recompute_question_stats, queryset.order_by('id').values_list('id', flat=True)
+        )
+        self.message_user(request, format_html('Queued in {} part(s) as {}.', parts, batch_link(batch)))
+
+    @admin.action(description='Delete selected questions and their answers (background)')
+    def purge_selected(self, request, queryset):
+        # Hidden right away, so nobody votes on a question waiting to be deleted;
+        # queued first because the selection may be filtered on is_hidden
+        batch, parts = moderation.queue_in_chunks(
+            jobs.purge_questions, queryset.order_by('id').values_list('id', flat=True),
+            chunk_size=purge.IDS_PER_TASK,
+        )
+        hidden = queryset.update(is_hidden=True)
+        self.message_user(request, format_html(
+            '{} question(s) hidden and queued for deletion in {} part(s) as {}.',
+            hidden, parts, batch_link(batch),
+        ))
+
 
 # =========================
 # ANSWER ADMIN
@@ -181,6 +323,7 @@ class AnswerAdmin(admin.ModelAdmin):
 
     date_hierarchy = 'answered_at'
     readonly_fields = ['answered_at']
+    actions = ['recompute_question_stats', 'delete_in_background']
 
     fieldsets = (
         ('Answer Details', {
@@ -191,6 +334,69 @@ class AnswerAdmin(admin.ModelAdmin):
         }),
     )
 
+    def has_module_permission(self, request):
+        # With ANSWER_SHARDS the answers are spread over the shard databases,
+        # which one changelist can't page through
+        return not sharding.enabled() and super().has_module_permission(request)
+
+    def get_queryset(self, request):
+        sharding.check_unsharded('The answer admin')
+        return super().get_queryset(request)
+
     def question_preview(self, obj):
         return f"Q{obj.question.id}: {obj.question.option_one_text[:25]}..."
     question_preview.short_description = 'Question'
+
+    @admin.action(description="Recompute vote stats of the selected answers' questions (background)")
+    def recompute_question_stats(self, request, queryset):
+        question_ids = queryset.order_by('question_id').values_list('question_id', flat=True).distinct()
+        batch, parts = moderation.queue_in_chunks(jobs.recompute_question_stats, question_ids)
+        self.message_user(request, format_html('Queued in {} part(s) as {}.', parts, batch_link(batch)))
+
+    @admin.action(description='Delete selected answers (background)')
+    def delete_in_background(self, request, queryset):
+        # Chunked raw deletes that also take the votes out of rollups and trending
+        batch, parts = moderation.queue_in_chunks(
+            jobs.delete_answers, queryset.order_by('id').values_list('id', flat=True)
+        )
+        self.message_user(request, format_html('Queued in {} part(s) as {}.', parts, batch_link(batch)))
+
+
+# =========================
+# TASK ADMIN
+# =========================
+
+@admin.register(Task)
+class TaskAdmin(admin.ModelAdmin):
+    """Background task queue: inspect failures and retry them"""
+
+    list_display = ['id', 'name', 'status', 'attempts', 'run_at', 'locked_by', 'dedup_key']
+    list_filter = ['status', 'name']
+    search_fields = ['name', 'dedup_key']
+    readonly_fields = ['created_at', 'locked_at', 'locked_by', 'last_error']
+    actions = ['retry_now']
+
+    def changelist_view(self, request, extra_context=None):
+        # Searching for a batch label from queue_in_chunks shows how far it got
+        batch = request.GET.get('q', '').strip()
+        if moderation.BATCH_LABEL.fullmatch(batch):
+            remaining, failed = moderation.progress(batch)
+            self.message_user(
+                request, f'Batch {batch}: {remaining} part(s) queued or running, {failed} failed.',
+                messages.WARNING if failed else messages.INFO,
+            )
+        return super().changelist_view(request, extra_context)
+
+    @admin.action(description='Retry selected tasks now')
+    def retry_now(self, request, queryset):
+        try:
+            with transaction.atomic():
+                updated = queryset.exclude(status=Task.RUNNING).update(
+                    status=Task.PENDING, attempts=0, run_at=timezone.now(), locked_by=''
+                )
+        except IntegrityError:
+            self.message_user(
+                request, 'A task with the same dedup key is already queued.', messages.ERROR
+            )
+            return
+        self.message_user(request, f'{updated} task(s) queued.')
@@ -0,0 +1,233 @@
+import fcntl
+import json
+import os
+import tempfile
+import threading
+
+import numpy as np
+
+from django.conf import settings
+from django.db.models import Max
+
+from . import sharding
+from .models import ArchivedAnswer, Question, User
+
+
+WORD_BITS = 64
+BATCH_SIZE = 10000
+# Users compared per step in similar(), bounding its temporaries
+COMPARE_ROWS = 8192
+
+
+# Set bits in each byte value, for NumPy releases before 2.0 (no bitwise_count)
+BYTE_POPCOUNT = np.array([bin(i).count('1') for i in range(256)], dtype=np.uint8)
+
+
+def popcount_rows(words):
+    """Number of set bits in each row of a 2-D uint64 array"""
+    if hasattr(np, 'bitwise_count'):
+        return np.bitwise_count(words).sum(axis=1, dtype=np.int32)
+    return BYTE_POPCOUNT[words.view(np.uint8)].sum(axis=1, dtype=np.int32)
+
+
+class AgreementIndex:
+    """
+    Two packed bitsets per user, indexed [user_id, question_id // 64]:
+    `answered` has a bit per question the user voted on and `option_one` a
+    bit per question where they chose option one. Comparing one user with
+    everyone is a few AND/XOR operations plus a popcount per block of users.
+    """
+
+    def __init__(self, users=0, questions=0):
+        words = max(1, -(-questions // WORD_BITS))
+        self.answered = np.zeros((users, words), dtype=np.uint64)
+        self.option_one = np.zeros((users, words), dtype=np.uint64)
+        # Highest Answer.id folded in per database; newer rows are caught up
+        self.watermarks = {}
+
+    def _ensure_capacity(self, max_user_id, max_question_id):
+        users, words = self.answered.shape
+        need_users = max(users, max_user_id + 1)
+        need_words = max(words, max_question_id // WORD_BITS + 1)
+        if need_users == users and need_words == words:
+            return
+        # Exactly what's needed: catch_up() sizes for the highest ids up front
+        for name in ('answered', 'option_one'):
+            grown = np.zeros((need_users, need_words), dtype=np.uint64)
+            grown[:users, :words] = getattr(self, name)
+            setattr(self, name, grown)
+
+    def add_many(self, user_ids, question_ids, option_one):
+        """Set the bits for arrays of (user_id, question_id, chose option one)"""
+        if not len(user_ids):
+            return
+        user_ids = np.asarray(user_ids, dtype=np.int64)
+        question_ids = np.asarray(question_ids, dtype=np.int64)
+        option_one = np.asarray(option_one, dtype=bool)
+        self._ensure_capacity(int(user_ids.max()), int(question_ids.max()))
+
+        words = question_ids // WORD_BITS
+        bits = np.left_shift(np.uint64(1), (question_ids % WORD_BITS).astype(np.uint64))
+        # bitwise_or.at handles several answers landing in the same word
+        np.bitwise_or.at(self.answered, (user_ids, words), bits)
+        np.bitwise_or.at(self.option_one, (user_ids[option_one], words[option_one]), bits[option_one])
+
+    def catch_up(self, batch_size=BATCH_SIZE):
+        """Fold in answers created since the watermarks (primary key range scans)"""
+        highest = {
+            'user': User.objects.aggregate(id=Max('id'))['id'] or 0,
+            'question': Question.objects.aggregate(id=Max('id'))['id'] or 0,
+        }
+        self._ensure_capacity(highest['user'], highest['question'])
+        added = 0
+        for alias, rows in sharding.rows_after(
+            self.watermarks, ('user_id', 'question_id', 'option_selected'), batch_size
+        ):
+            ids, user_ids, question_ids, options = zip(*rows)
+            self.add_many(user_ids, question_ids, [option == 'optionOne' for option in options])
+            self.watermarks[alias] = ids[-1]
+            added += len(rows)
+        return added
+
+    def similar(self, user_id, limit=10, min_common=None):
+        """
+        (user_id, questions in common, share answered the same) for the users
+        who agree most with user_id, best first. Users with fewer than
+        min_common shared questions are skipped; their rates are noise.
+        """
+        if min_common is None:
+            min_common = settings.AGREEMENT_MIN_COMMON
+        if user_id >= self.answered.shape[0]:
+            return []
+        mine = np.array(self.answered[user_id])
+        if not mine.any():
+            return []
+        my_options = np.array(self.option_one[user_id])
+
+        found_ids, found_common, found_rate = [], [], []
+        for start in range(0, self.answered.shape[0], COMPARE_ROWS):
+            common_bits = self.answered[start:start + COMPARE_ROWS] & mine
+            common = popcount_rows(common_bits)
+            if start <= user_id < start + COMPARE_ROWS:
+                common[user_id - start] = 0
+            # Only users with enough overlap need the option comparison
+            candidates = np.flatnonzero(common >= min_common)
+            if not len(candidates):
+                continue
+            common = common[candidates]
+            # Different option where both answered: XOR of the option bits is 1
+            differ = common_bits[candidates] & (self.option_one[start + candidates] ^ my_options)
+            found_ids.append(start + candidates)
+            found_common.append(common)
+            found_rate.append((common - popcount_rows(differ)) / common)
+        if not found_ids:
+            return []
+
+        candidates, common, rate = map(np.concatenate, (found_ids, found_common, found_rate))
+        # Highest agreement first, more shared questions breaking ties
+        order = np.lexsort((-common, -rate))[:limit]
+        return [
+            (int(candidates[i]), int(common[i]), float(rate[i]))
+            for i in order
+        ]
+
+    def save(self, path):
+        """
+        Both bitsets as one .npy file that readers memory-map, replaced
+        atomically, with the watermarks beside it
+        """
+        directory = os.path.dirname(path)
+        os.makedirs(directory, exist_ok=True)
+        fd, tmp_path = tempfile.mkstemp(dir=directory, suffix='.npy')
+        with os.fdopen(fd, 'wb') as f:
+            np.save(f, np.stack([self.answered, self.option_one]))
+        fd, tmp_meta = tempfile.mkstemp(dir=directory, suffix='.json')
+        with os.fdopen(fd, 'w') as f:
+            json.dump({'watermarks': self.watermarks}, f)
+        os.replace(tmp_meta, meta_path(path))
+        os.replace(tmp_path, path)
+
+    @classmethod
+    def load(cls, path, mmap_mode=None):
+        """The saved index; mmap_mode='r' shares the pages between processes instead of copying"""
+        index = cls()
+        if os.path.exists(path):
+            bitsets = np.load(path, mmap_mode=mmap_mode)
+            index.answered, index.option_one = bitsets[0], bitsets[1]
+            with open(meta_path(path)) as f:
+                index.watermarks = sharding.load_watermarks(json.load(f)['watermarks'])
+        return index
+
+
+def index_path():
+    return os.path.join(settings.AGREEMENT_INDEX_DIR, 'bitsets.npy')
+
+
+def meta_path(path):
+    return os.path.splitext(path)[0] + '.json'
+
+
+_index = None
+_index_version = None
+_index_lock = threading.Lock()
+
+
+def get_index():
+    """
+    The index the worker last wrote, memory-mapped read-only and reloaded
+    when the file changes. None until one has been built: requests never
+    scan answers themselves.
+    """
+    global _index, _index_version
+    path = index_path()
+    try:
+        version = (path, os.stat(path).st_mtime_ns)
+    except FileNotFoundError:
+        return None
+    with _index_lock:
+        if _index is None or version != _index_version:
+            _index = AgreementIndex.load(path, mmap_mode='r')
+            _index_version = version
+        return _index
+
+
+def similar_players(user_id, limit=10):
+    index = get_index()
+    if index is None:
+        return []
+    return index.similar(user_id, limit=limit)
+
+
+def write_lock():
+    """
+    Held while a job rewrites the index, so an update never saves over a
+    rebuild it loaded before
+    """
+    os.makedirs(settings.AGREEMENT_INDEX_DIR, exist_ok=True)
+    lock = open(os.path.join(settings.AGREEMENT_INDEX_DIR, 'bitsets.lock'), 'w')
+    fcntl.flock(lock, fcntl.LOCK_EX)
+    return lock
+
+
+def build_index():
+    """Rebuild the bitsets from every answer, archived ones included, and persist them"""
+    with write_lock():
+        index = AgreementIndex()
+        archived = list(ArchivedAnswer.objects.values_list('user_id', 'question_id', 'option'))
+        if archived:
+            user_ids, question_ids, options = zip(*archived)
+            index.add_many(user_ids, question_ids, [option == ArchivedAnswer.OPTION_ONE for option in options])
+        index.catch_up()
+        index.save(index_path())
+    return index
+
+
+def update_index():
+    """Fold answers newer than the saved watermarks into the index file (built if missing)"""
+    if not os.path.exists(index_path()):
+        return build_index()
+    with write_lock():
+        index = AgreementIndex.load(index_path())
+        if index.catch_up():
+            index.save(index_path())
+    return index
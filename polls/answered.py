@@ -0,0 +1,213 @@
+import struct
+import time
+
+import numpy as np
+
+from django.conf import settings
+from django.core.cache import caches
+
+from . import sharding
+from .models import ArchivedAnswer
+
+
+# A vote waits this long for another request's update of the same set
+LOCK_WAIT = 1.0
+LOCK_POLL_INTERVAL = 0.01
+
+# Roaring layout: ids are split on their high 16 bits into containers. A
+# container holds the low 16 bits as a sorted uint16 array while small and
+# as a 65536-bit bitmap (1024 uint64 words) once that is more compact.
+ARRAY_MAX = 4096
+BITMAP_WORDS = 1024
+ARRAY, BITMAP = 0, 1
+HEADER = struct.Struct('<I')
+CONTAINER_HEADER = struct.Struct('<HBI')
+
+
+def bitmap_from_array(values):
+    words = np.zeros(BITMAP_WORDS, dtype=np.uint64)
+    values = values.astype(np.uint64)
+    np.bitwise_or.at(words, values >> np.uint64(6), np.uint64(1) << (values & np.uint64(63)))
+    return words
+
+
+def bitmap_contains(words, values):
+    values = values.astype(np.uint64)
+    return (words[values >> np.uint64(6)] >> (values & np.uint64(63))) & np.uint64(1) == 1
+
+
+class AnsweredSet:
+    """
+    Compressed set of question ids (a minimal roaring bitmap). A player with
+    a few hundred answers takes about 2 bytes per answer; membership for a
+    whole array of ids is one vectorized lookup per container.
+    """
+
+    def __init__(self, containers=None):
+        self.containers = containers or {}
+
+    @classmethod
+    def from_ids(cls, ids):
+        ids = np.unique(np.asarray(ids, dtype=np.uint32))
+        containers = {}
+        if len(ids):
+            highs = ids >> 16
+            keys, starts = np.unique(highs, return_index=True)
+            for key, low in zip(keys, np.split((ids & 0xFFFF).astype(np.uint16), starts[1:])):
+                containers[int(key)] = low if len(low) <= ARRAY_MAX else bitmap_from_array(low)
+        return cls(containers)
+
+    def __len__(self):
+        return sum(
+            int(np.unpackbits(container.view(np.uint8)).sum()) if container.dtype == np.uint64 else len(container)
+            for container in self.containers.values()
+        )
+
+    def __contains__(self, question_id):
+        container = self.containers.get(question_id >> 16)
+        if container is None:
+            return False
+        low = np.array([question_id & 0xFFFF], dtype=np.uint16)
+        if container.dtype == np.uint64:
+            return bool(bitmap_contains(container, low)[0])
+        i = np.searchsorted(container, low[0])
+        return i < len(container) and container[i] == low[0]
+
+    def contains_many(self, ids):
+        """Boolean mask: which of the ids are in the set"""
+        ids = np.asarray(ids, dtype=np.uint32)
+        mask = np.zeros(len(ids), dtype=bool)
+        highs = ids >> 16
+        for key, container in self.containers.items():
+            selected = np.flatnonzero(highs == key)
+            if not len(selected):
+                continue
+            low = (ids[selected] & 0xFFFF).astype(np.uint16)
+            if container.dtype == np.uint64:
+                mask[selected] = bitmap_contains(container, low)
+            else:
+                positions = np.minimum(np.searchsorted(container, low), len(container) - 1)
+                mask[selected] = container[positions] == low
+        return mask
+
+    def add_many(self, ids):
+        other = AnsweredSet.from_ids(ids)
+        for key, added in other.containers.items():
+            container = self.containers.get(key)
+            if container is None:
+                self.containers[key] = added
+                continue
+            if container.dtype == np.uint64 or added.dtype == np.uint64:
+                as_bitmap = [c if c.dtype == np.uint64 else bitmap_from_array(c) for c in (container, added)]
+                self.containers[key] = as_bitmap[0] | as_bitmap[1]
+            else:
+                merged = np.union1d(container, added).astype(np.uint16)
+                self.containers[key] = merged if len(merged) <= ARRAY_MAX else bitmap_from_array(merged)
+
+    def to_bytes(self):
+        parts = [HEADER.pack(len(self.containers))]
+        for key, container in sorted(self.containers.items()):
+            kind = BITMAP if container.dtype == np.uint64 else ARRAY
+            parts.append(CONTAINER_HEADER.pack(key, kind, len(container)))
+            parts.append(container.tobytes())
+        return b''.join(parts)
+
+    @classmethod
+    def from_bytes(cls, data):
+        (count,), offset = HEADER.unpack_from(data), HEADER.size
+        containers = {}
+        for _ in range(count):
+            key, kind, size = CONTAINER_HEADER.unpack_from(data, offset)
+            offset += CONTAINER_HEADER.size
+            dtype = np.uint64 if kind == BITMAP else np.uint16
+            nbytes = size * np.dtype(dtype).itemsize
+            containers[key] = np.frombuffer(data, dtype=dtype, count=size, offset=offset).copy()
+            offset += nbytes
+        return cls(containers)
+
+
+def get_cache():
+    # Sets are updated in place on each vote, so every web process must share
+    # the cache; gunicorn.conf.py runs a single worker otherwise
+    return caches[settings.AGGREGATE_CACHE]
+
+
+def cache_key(user_id):
+    return f'answered:{user_id}'
+
+
+def version_key(user_id):
+    return f'answered:{user_id}:version'
+
+
+def bump_version(cache, user_id):
+    """
+    Mark any set built before now as stale. A read that missed the cache and
+    is still loading from the database keeps the version it started with, so
+    the set it stores afterwards is ignored instead of hiding this write.
+    """
+    key = version_key(user_id)
+    try:
+        cache.incr(key)
+    except ValueError:
+        if not cache.add(key, 1, timeout=None):
+            cache.incr(key)
+
+
+def load(user_id):
+    """Every question id the user answered, archived answers included, from the database"""
+    ids = sharding.answered_question_ids(user_id)
+    ids += ArchivedAnswer.objects.filter(user_id=user_id).values_list('question_id', flat=True)
+    return AnsweredSet.from_ids(ids)
+
+
+def answered_set(user_id):
+    """The user's answered set from the cache, rebuilt from the database on a miss"""
+    cache = get_cache()
+    key = cache_key(user_id)
+    cached = cache.get_many([key, version_key(user_id)])
+    version = cached.get(version_key(user_id), 0)
+    entry = cached.get(key)
+    if entry is not None and entry[0] == version:
+        return AnsweredSet.from_bytes(entry[1])
+    answered = load(user_id)
+    cache.set(key, (version, answered.to_bytes()), timeout=settings.ANSWERED_SET_CACHE_SECONDS)
+    return answered
+
+
+def record_votes(user_id, question_ids):
+    """
+    Add new answers to the user's cached set. If there's no current set, the
+    version is bumped instead so a rebuild already under way isn't stored.
+    Updates of one set are serialized with a cache lock; if that can't be had
+    in time the set is marked stale and the next read rebuilds it.
+    """
+    cache = get_cache()
+    key = cache_key(user_id)
+    lock_key = f'{key}:lock'
+    deadline = time.monotonic() + LOCK_WAIT
+    while not cache.add(lock_key, 1, timeout=10):
+        if time.monotonic() >= deadline:
+            bump_version(cache, user_id)
+            return
+        time.sleep(LOCK_POLL_INTERVAL)
+    try:
+        cached = cache.get_many([key, version_key(user_id)])
+        version = cached.get(version_key(user_id), 0)
+        entry = cached.get(key)
+        if entry is None or entry[0] != version:
+            bump_version(cache, user_id)
+            return
+        answered = AnsweredSet.from_bytes(entry[1])
+        answered.add_many(question_ids)
+        cache.set(key, (version, answered.to_bytes()), timeout=settings.ANSWERED_SET_CACHE_SECONDS)
+    finally:
+        cache.delete(lock_key)
+
+
+def forget(user_ids):
+    """Drop cached sets, e.g. after answers are deleted"""
+    cache = get_cache()
+    for user_id in user_ids:
+        bump_version(cache, user_id)
+    cache.delete_many([cache_key(user_id) for user_id in user_ids])
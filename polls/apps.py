@@ -4,4 +4,14 @@ from django.apps import AppConfig
 class PollsConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'polls'
-    verbose_name = 'Would You Rather Polls'
\ No newline at end of file
+    verbose_name = 'Would You Rather Polls'
+
+    def ready(self):
+        from django.db.backends.signals import connection_created
+        from django.db.models.signals import post_migrate, pre_delete
+        from .models import Question, User
+        from .sharding import delete_shard_answers, relax_foreign_keys, relax_foreign_keys_after_migrate
+        connection_created.connect(relax_foreign_keys)
+        post_migrate.connect(relax_foreign_keys_after_migrate)
+        pre_delete.connect(delete_shard_answers, sender=User)
+        pre_delete.connect(delete_shard_answers, sender=Question)
@@ -0,0 +1,126 @@
+from collections import Counter, defaultdict
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import DEFAULT_DB_ALIAS, transaction
+from django.db.models import F, Q
+from django.utils import timezone
+
+from . import sharding
+from .models import User, Question, Answer, ArchivedAnswer
+
+
+QUESTION_BATCH_SIZE = 200
+# Stay well under SQLite's bound parameter limit for __in lookups
+IN_CHUNK_SIZE = 900
+
+
+def archive_batch(question_ids, now, using=DEFAULT_DB_ALIAS):
+    """
+    Move the answers on question_ids, all held in the `using` database, into
+    ArchivedAnswer, folding their counts into the frozen tallies. The archive
+    commits before the answers are deleted, by id, so a failure in between
+    leaves answers that are already archived: the next run deletes them
+    without counting them twice. Returns answers moved.
+    """
+    rows = list(
+        Answer.objects.using(using).filter(question_id__in=question_ids)
+        .values_list('id', 'user_id', 'question_id', 'option_selected', 'answered_at')
+    )
+    if not rows:
+        return 0
+
+    with transaction.atomic():
+        archived = set(
+            ArchivedAnswer.objects.filter(question_id__in=question_ids).values_list('user_id', 'question_id')
+        )
+        new_rows = [row for row in rows if (row[1], row[2]) not in archived]
+        ArchivedAnswer.objects.bulk_create(
+            [
+                ArchivedAnswer(
+                    user_id=user_id,
+                    question_id=question_id,
+                    option=ArchivedAnswer.OPTIONS[option_selected],
+                    answered_at=answered_at,
+                )
+                for _, user_id, question_id, option_selected, answered_at in new_rows
+            ],
+            batch_size=1000,
+        )
+
+        tallies = defaultdict(Counter)
+        per_user = Counter()
+        for _, user_id, question_id, option_selected, _ in new_rows:
+            tallies[question_id][option_selected] += 1
+            per_user[user_id] += 1
+
+        for question_id, counts in tallies.items():
+            Question.objects.filter(id=question_id).update(
+                archived_at=now,
+                archived_option_one_votes=F('archived_option_one_votes') + counts['optionOne'],
+                archived_option_two_votes=F('archived_option_two_votes') + counts['optionTwo'],
+            )
+
+        # Most users have one or two answers per batch: one UPDATE per distinct count
+        users_by_count = defaultdict(list)
+        for user_id, count in per_user.items():
+            users_by_count[count].append(user_id)
+        for count, user_ids in users_by_count.items():
+            for start in range(0, len(user_ids), IN_CHUNK_SIZE):
+                User.objects.filter(id__in=user_ids[start:start + IN_CHUNK_SIZE]).update(
+                    archived_answers=F('archived_answers') + count
+                )
+
+    # Only the rows archived above: votes cast since stay for the next run
+    answer_ids = [row[0] for row in rows]
+    with transaction.atomic(using=using):
+        for start in range(0, len(answer_ids), IN_CHUNK_SIZE):
+            Answer.objects.using(using).filter(id__in=answer_ids[start:start + IN_CHUNK_SIZE]).delete()
+    return len(rows)
+
+
+def archive_answers(older_than_days=None, batch_size=QUESTION_BATCH_SIZE, log=None):
+    """
+    Move answers on questions created more than older_than_days ago (default
+    ARCHIVE_AFTER_DAYS) out of the Answer table. Safe to re-run: votes cast
+    on archived questions since the last run are moved on the next one.
+    """
+    log = log or (lambda message: None)
+    if older_than_days is None:
+        older_than_days = settings.ARCHIVE_AFTER_DAYS
+    now = timezone.now()
+    cutoff = now - timedelta(days=older_than_days)
+
+    question_ids = list(
+        Question.objects.filter(created_at__lt=cutoff).order_by('id').values_list('id', flat=True)
+    )
+    moved = 0
+    for start in range(0, len(question_ids), batch_size):
+        for alias, batch in sharding.group_by_shard(question_ids[start:start + batch_size]).items():
+            moved += archive_batch(batch, now, alias)
+        log(f'Questions {min(start + batch_size, len(question_ids))}/{len(question_ids)}: {moved} answers archived')
+    return {'questions': len(question_ids), 'answers': moved}
+
+
+def answered_question_ids(user):
+    """
+    Subqueries of question ids the user answered: (live, archived). archived
+    is None when the user has nothing archived, sparing the extra lookup.
+    """
+    # Sharded answers can't be a subquery, and listing them could overflow an
+    # IN list; check candidates against answered.answered_set() instead
+    sharding.check_unsharded('answered_filter')
+    live = Answer.objects.filter(user=user).values_list('question_id', flat=True)
+    archived = None
+    if user.archived_answers:
+        archived = ArchivedAnswer.objects.filter(user=user).values_list('question_id', flat=True)
+    return live, archived
+
+
+def answered_filter(user, field='id'):
+    """Q matching rows whose `field` is a question the user answered, live or archived"""
+    live, archived = answered_question_ids(user)
+    condition = Q(**{f'{field}__in': live})
+    if archived is not None:
+        condition |= Q(**{f'{field}__in': archived})
+    return condition
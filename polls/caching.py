@@ -0,0 +1,140 @@
+import functools
+import logging
+import math
+import random
+import threading
+import time
+
+from django.conf import settings
+from django.core.cache import caches
+from django.core.cache.backends.locmem import LocMemCache
+from django.db import connection
+
+from . import metrics
+
+
+logger = logging.getLogger('polls.caching')
+
+# Longest a recompute may hold the lock before another request may try
+LOCK_TIMEOUT = 60
+# How long a request with nothing to serve waits for another one's recompute
+MISS_WAIT = 10.0
+MISS_POLL_INTERVAL = 0.05
+
+
+def get_cache():
+    return caches[settings.AGGREGATE_CACHE]
+
+
+def is_shared():
+    """Whether other processes see what this one writes to the cache"""
+    return not isinstance(get_cache(), LocMemCache)
+
+
+def store(cache, key, compute, ttl, stale_ttl):
+    started = time.perf_counter()
+    value = compute()
+    delta = time.perf_counter() - started
+    # (value, soft expiry, seconds it took to compute); kept stale_ttl past expiry
+    cache.set(key, (value, time.time() + ttl, delta), timeout=ttl + stale_ttl)
+    return value
+
+
+def refresh_in_background(cache, key, compute, ttl, stale_ttl):
+    lock_key = f'{key}:lock'
+
+    def run():
+        try:
+            store(cache, key, compute, ttl, stale_ttl)
+        except Exception:
+            logger.exception('Background refresh of %s failed', key)
+        finally:
+            cache.delete(lock_key)
+            connection.close()
+
+    threading.Thread(target=run, name=f'refresh {key}', daemon=True).start()
+
+
+def fetch(key, compute, ttl, stale_ttl=None, beta=1.0, name=None):
+    """
+    compute() through the cache, without a stampede when the value expires:
+
+    - Probabilistic early refresh (XFetch): while the value is fresh, each
+      read refreshes it with a probability that grows as expiry nears and
+      with how long compute() took, so usually one request renews it before
+      it expires at all.
+    - Stale-while-revalidate: an expired value is kept stale_ttl longer and
+      served while a background thread recomputes it.
+    - Single flight: a lock (cache.add) lets one request recompute; the rest
+      serve the stale value, or on a cold miss wait briefly for the winner.
+
+    With the default LocMemCache all of this is per process; point CACHES at
+    a shared backend (Memcached, Redis) to make the lock cross-process.
+    """
+    cache = get_cache()
+    name = name or key.split(':', 1)[0]
+    if stale_ttl is None:
+        stale_ttl = settings.CACHE_STALE_SECONDS
+    lock_key = f'{key}:lock'
+
+    entry = cache.get(key)
+    now = time.time()
+    if entry is not None:
+        value, expires_at, delta = entry
+        fresh = now < expires_at
+        metrics.record_cache(name, fresh)
+        # 1 - random() is in (0, 1], so the log is finite and <= 0
+        early = now - delta * beta * math.log(1.0 - random.random()) >= expires_at
+        if (not fresh or early) and cache.add(lock_key, 1, timeout=LOCK_TIMEOUT):
+            refresh_in_background(cache, key, compute, ttl, stale_ttl)
+        return value
+
+    metrics.record_cache(name, False)
+    if cache.add(lock_key, 1, timeout=LOCK_TIMEOUT):
+        try:
+            return store(cache, key, compute, ttl, stale_ttl)
+        finally:
+            cache.delete(lock_key)
+
+    deadline = now + MISS_WAIT
+    while time.time() < deadline:
+        time.sleep(MISS_POLL_INTERVAL)
+        entry = cache.get(key)
+        if entry is not None:
+            return entry[0]
+    # The recompute is taking too long or its process died; don't hang
+    return compute()
+
+
+def cached(name, ttl, stale_ttl=None, key=None, beta=1.0):
+    """
+    Decorator running a function through fetch(). key(*args, **kwargs)
+    returns the part of the cache key that varies with the arguments; leave
+    it out for functions without any. Works on views too, for responses
+    that can be shared (not streaming ones), e.g. per user:
+
+        @cached('profile_page', ttl=60, key=lambda request: request.user.pk)
+        def profile_view(request):
+            ...
+
+    The wrapper's invalidate(*args, **kwargs) drops the cached value.
+    """
+    def cache_key(*args, **kwargs):
+        return f'{name}:{key(*args, **kwargs)}' if key else name
+
+    def decorator(func):
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            return fetch(
+                cache_key(*args, **kwargs),
+                lambda: func(*args, **kwargs),
+                ttl,
+                stale_ttl,
+                beta,
+                name,
+            )
+
+        wrapper.invalidate = lambda *args, **kwargs: get_cache().delete(cache_key(*args, **kwargs))
+        return wrapper
+
+    return decorator
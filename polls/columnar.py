@@ -0,0 +1,223 @@
+import json
+import os
+import tempfile
+
+import numpy as np
+
+from django.conf import settings
+
+from . import sharding
+from .models import ArchivedAnswer
+
+
+# column name -> dtype; one file per column, rows aligned by position
+COLUMNS = {
+    'user_id': np.int32,
+    'question_id': np.int32,
+    'option': np.uint8,  # 1 = optionOne, 2 = optionTwo
+}
+OPTION_CODES = {'optionOne': 1, 'optionTwo': 2}
+META_FILE = 'meta.json'
+BATCH_SIZE = 100000
+
+
+def store_dir():
+    return str(settings.COLUMNAR_DIR)
+
+
+def column_path(name, directory=None):
+    return os.path.join(directory or store_dir(), f'{name}.bin')
+
+
+def read_meta(directory=None):
+    path = os.path.join(directory or store_dir(), META_FILE)
+    if not os.path.exists(path):
+        return {'rows': 0, 'watermarks': {}}
+    with open(path) as f:
+        meta = json.load(f)
+    # Stores written before sharding kept a single watermark
+    if 'watermarks' not in meta:
+        meta['watermarks'] = sharding.load_watermarks(meta.pop('watermark'))
+    return meta
+
+
+def write_meta(meta, directory=None):
+    directory = directory or store_dir()
+    fd, tmp_path = tempfile.mkstemp(dir=directory, suffix='.tmp')
+    with os.fdopen(fd, 'w') as f:
+        json.dump(meta, f)
+    os.replace(tmp_path, os.path.join(directory, META_FILE))
+
+
+def append_rows(rows, directory):
+    """Append (user_id, question_id, option_code) rows to the column files"""
+    if not rows:
+        return 0
+    data = np.array(rows, dtype=np.int64)
+    for i, (name, dtype) in enumerate(COLUMNS.items()):
+        with open(column_path(name, directory), 'ab') as f:
+            f.write(data[:, i].astype(dtype).tobytes())
+            f.flush()
+            os.fsync(f.fileno())
+    return len(rows)
+
+
+def truncate_to(rows, directory):
+    """Drop bytes past `rows` left behind by an append that didn't finish"""
+    for name, dtype in COLUMNS.items():
+        path = column_path(name, directory)
+        size = rows * np.dtype(dtype).itemsize
+        if os.path.exists(path) and os.path.getsize(path) > size:
+            os.truncate(path, size)
+        elif not os.path.exists(path):
+            open(path, 'wb').close()
+
+
+def update(directory=None, batch_size=BATCH_SIZE):
+    """
+    Append answers newer than the watermarks (Answer.id, per database) to the
+    column files.
+    meta.json is only rewritten after the data is on disk, so a crash
+    mid-append leaves extra bytes that the next run cuts off.
+    """
+    directory = directory or store_dir()
+    os.makedirs(directory, exist_ok=True)
+    meta = read_meta(directory)
+    truncate_to(meta['rows'], directory)
+
+    appended = 0
+    for alias, batch in sharding.rows_after(
+        meta['watermarks'], ('user_id', 'question_id', 'option_selected'), batch_size
+    ):
+        appended += append_rows(
+            [(user_id, question_id, OPTION_CODES[option]) for _, user_id, question_id, option in batch],
+            directory,
+        )
+        meta = {'rows': meta['rows'] + len(batch), 'watermarks': {**meta['watermarks'], alias: batch[-1][0]}}
+        write_meta(meta, directory)
+    return appended
+
+
+def rebuild(directory=None, batch_size=BATCH_SIZE):
+    """
+    Write the store from scratch, archived answers included, into a fresh
+    directory and swap it in. Needed after answers are deleted.
+    """
+    directory = directory or store_dir()
+    parent = os.path.dirname(directory.rstrip(os.sep))
+    os.makedirs(parent, exist_ok=True)
+    build_dir = tempfile.mkdtemp(dir=parent, prefix='.columnar-')
+    truncate_to(0, build_dir)
+
+    rows = 0
+    archived = ArchivedAnswer.objects.values_list('user_id', 'question_id', 'option')
+    chunk = []
+    for row in archived.iterator(chunk_size=batch_size):
+        chunk.append(row)
+        if len(chunk) >= batch_size:
+            rows += append_rows(chunk, build_dir)
+            chunk = []
+    rows += append_rows(chunk, build_dir)
+    write_meta({'rows': rows, 'watermarks': {}}, build_dir)
+    update(build_dir, batch_size)
+
+    if os.path.exists(directory):
+        old_dir = directory.rstrip(os.sep) + '.old'
+        os.replace(directory, old_dir)
+        os.replace(build_dir, directory)
+        for name in os.listdir(old_dir):
+            os.remove(os.path.join(old_dir, name))
+        os.rmdir(old_dir)
+    else:
+        os.replace(build_dir, directory)
+    return read_meta(directory)
+
+
+class AnswerStore:
+    """
+    Read-only, memory-mapped view of the column files. Group-bys are
+    np.bincount over the id columns, so queries never touch the database.
+    """
+
+    def __init__(self, directory=None):
+        directory = directory or store_dir()
+        self.meta = read_meta(directory)
+        rows = self.meta['rows']
+        for name, dtype in COLUMNS.items():
+            if rows:
+                column = np.memmap(column_path(name, directory), dtype=dtype, mode='r', shape=(rows,))
+            else:
+                column = np.zeros(0, dtype=dtype)
+            setattr(self, name, column)
+
+    def __len__(self):
+        return self.meta['rows']
+
+    def question_counts(self):
+        """(total votes, option one votes) per question id, as arrays indexed by id"""
+        size = int(self.question_id.max()) + 1 if len(self) else 0
+        totals = np.bincount(self.question_id, minlength=size)
+        option_one = np.bincount(self.question_id, weights=self.option == 1, minlength=size)
+        return totals, option_one.astype(np.int64)
+
+    def polarization(self, min_votes=10, limit=10):
+        """
+        Questions ranked by how evenly votes split: 1.0 is 50/50, 0.0 is
+        unanimous. Returns (most_polarizing, least_polarizing) lists of
+        (question_id, votes, option_one_share, score).
+        """
+        totals, option_one = self.question_counts()
+        question_ids = np.flatnonzero(totals >= min_votes)
+        if not len(question_ids):
+            return [], []
+        share = option_one[question_ids] / totals[question_ids]
+        score = 1.0 - np.abs(2.0 * share - 1.0)
+        order = np.argsort(-score, kind='stable')
+
+        def rows(indices):
+            return [
+                (int(question_ids[i]), int(totals[question_ids[i]]), float(share[i]), float(score[i]))
+                for i in indices
+            ]
+        return rows(order[:limit]), rows(order[::-1][:limit])
+
+    def user_counts(self):
+        size = int(self.user_id.max()) + 1 if len(self) else 0
+        return np.bincount(self.user_id, minlength=size)
+
+    def agreement(self, user_id, min_common=5, limit=10):
+        """
+        Users who most often picked the same option as user_id on questions
+        both answered. Returns (other_user_id, common, agreement_rate) tuples.
+        """
+        mine = self.user_id == user_id
+        if not mine.any():
+            return []
+        # option this user picked per question id (0 = didn't answer)
+        picked = np.zeros(int(self.question_id.max()) + 1, dtype=np.uint8)
+        picked[self.question_id[mine]] = self.option[mine]
+
+        theirs = (picked[self.question_id] != 0) & ~mine
+        users = self.user_id[theirs]
+        same = self.option[theirs] == picked[self.question_id[theirs]]
+        common = np.bincount(users)
+        agreed = np.bincount(users, weights=same, minlength=len(common))
+
+        candidates = np.flatnonzero(common >= min_common)
+        if not len(candidates):
+            return []
+        rate = agreed[candidates] / common[candidates]
+        order = np.lexsort((-common[candidates], -rate))[:limit]
+        return [
+            (int(candidates[i]), int(common[candidates[i]]), float(rate[i]))
+            for i in order
+        ]
+
+    def summary(self):
+        return {
+            'answers': len(self),
+            'watermark': max(self.meta['watermarks'].values(), default=0),
+            'users': int(np.count_nonzero(self.user_counts())),
+            'questions': int(np.count_nonzero(self.question_counts()[0])),
+            'option_one_share': float((self.option == 1).mean()) if len(self) else 0.0,
+        }
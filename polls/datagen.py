@@ -0,0 +1,185 @@
+import itertools
+import random
+from datetime import timedelta
+
+from django.contrib.auth.hashers import make_password
+from django.db import connections, transaction
+from django.db.models import Max
+from django.utils import timezone
+
+from .models import User, Question, Answer
+from .sharding import shard_for
+
+
+# Every generated account shares this password (same as create_initial_users)
+DEFAULT_PASSWORD = 'password123'
+
+ACTIVITIES = [
+    'fly', 'become invisible', 'travel to the past', 'travel to the future',
+    'talk to animals', 'speak every language', 'read minds', 'predict the weather',
+    'breathe underwater', 'never sleep', 'teleport', 'live forever', 'eat only pizza',
+    'give up coffee', 'work from a beach', 'climb Everest', 'sing like a pro',
+    'play any instrument', 'run a marathon', 'cook like a chef',
+]
+
+QUALIFIERS = [
+    'every day', 'for a year', 'once a week', 'whenever you want', 'for one hour',
+    'but only at night', 'in front of a crowd', 'without telling anyone',
+    'with your best friend', 'on Mondays',
+]
+
+
+def zipf_weights(n, s, rng):
+    """
+    Zipf weights (1 / rank^s) shuffled over n items, so the most popular
+    question or most active user isn't always the lowest id.
+    """
+    weights = [1.0 / (rank ** s) for rank in range(1, n + 1)]
+    rng.shuffle(weights)
+    return list(itertools.accumulate(weights))
+
+
+def option_text(rng):
+    return f"{rng.choice(ACTIVITIES)} {rng.choice(QUALIFIERS)}".capitalize()
+
+
+def batched(iterable, size):
+    iterator = iter(iterable)
+    while batch := list(itertools.islice(iterator, size)):
+        yield batch
+
+
+def answer_insert_sql(connection):
+    meta = Answer._meta
+    qn = connection.ops.quote_name
+    columns = [meta.get_field(name).column for name in ('user', 'question', 'option_selected', 'answered_at')]
+    return 'INSERT INTO {} ({}) VALUES ({})'.format(
+        qn(meta.db_table),
+        ', '.join(qn(column) for column in columns),
+        ', '.join(['%s'] * len(columns)),
+    )
+
+
+def generate_dataset(users=100, questions=500, answers=5000, seed=None,
+                     batch_size=5000, skew=1.1, days=90, prefix='player', log=None):
+    """
+    Bulk-load users, questions and answers with Zipf-distributed question
+    popularity and user activity. Returns a dict with the created counts.
+    """
+    rng = random.Random(seed)
+    log = log or (lambda message: None)
+    now = timezone.now()
+
+    # Hashing is deliberately slow, so do it once and share the result
+    password_hash = make_password(DEFAULT_PASSWORD)
+    offset = (User.objects.aggregate(Max('id'))['id__max'] or 0) + 1
+
+    user_ids = []
+    for batch in batched(range(offset, offset + users), batch_size):
+        objs = [
+            User(
+                username=f'{prefix}{n}',
+                email=f'{prefix}{n}@example.com',
+                password=password_hash,
+                date_joined=now - timedelta(days=days),
+            )
+            for n in batch
+        ]
+        with transaction.atomic():
+            User.objects.bulk_create(objs, batch_size=batch_size)
+        user_ids.extend(obj.pk for obj in objs)
+        log(f'Users: {len(user_ids)}/{users}')
+
+    if None in user_ids:
+        # Backends without RETURNING support don't set primary keys
+        user_ids = list(User.objects.filter(
+            username__startswith=prefix, id__gte=offset
+        ).order_by('id').values_list('id', flat=True))
+
+    if not user_ids:
+        return {'users': 0, 'questions': 0, 'answers': 0}
+
+    user_weights = zipf_weights(len(user_ids), skew, rng)
+
+    question_rows = []  # (id, created_at, option one bias)
+    for batch in batched(range(questions), batch_size):
+        authors = rng.choices(user_ids, cum_weights=user_weights, k=len(batch))
+        objs = [
+            Question(
+                author_id=author_id,
+                option_one_text=option_text(rng),
+                option_two_text=option_text(rng),
+                created_at=now - timedelta(seconds=rng.uniform(0, days * 86400)),
+            )
+            for author_id in authors
+        ]
+        with transaction.atomic():
+            Question.objects.bulk_create(objs, batch_size=batch_size)
+        question_rows.extend((obj.pk, obj.created_at, rng.betavariate(2, 2)) for obj in objs)
+        log(f'Questions: {len(question_rows)}/{questions}')
+
+    if question_rows and question_rows[0][0] is None:
+        created = Question.objects.filter(author_id__in=user_ids).order_by('id')
+        question_rows = [
+            (pk, created_at, rng.betavariate(2, 2))
+            for pk, created_at in created.values_list('id', 'created_at')
+        ]
+
+    if not question_rows:
+        return {'users': len(user_ids), 'questions': 0, 'answers': 0}
+
+    # Each (user, question) pair can only be answered once
+    answers = min(answers, len(user_ids) * len(question_rows))
+    question_weights = zipf_weights(len(question_rows), skew, rng)
+    n_questions = len(question_rows)
+    seen = set()
+    created_answers = 0
+
+    # Answers dominate the row count, so they skip model instantiation and go
+    # straight to executemany; the ORM costs ~10x the actual insert here. Rows
+    # go to the database their question's answers live in (see sharding.py),
+    # whose answer table must exist: run rebalance_answers first when sharded.
+    attempts = 0
+
+    while created_answers < answers and attempts < 200:
+        attempts += 1
+        want = min(batch_size * 20, answers - created_answers)
+        user_sample = rng.choices(range(len(user_ids)), cum_weights=user_weights, k=want)
+        question_sample = rng.choices(range(n_questions), cum_weights=question_weights, k=want)
+
+        pairs = []
+        for u, q in zip(user_sample, question_sample):
+            key = u * n_questions + q
+            if key not in seen:
+                seen.add(key)
+                pairs.append((u, q))
+
+        # Sorted inserts keep the (user, question) index writes sequential
+        pairs.sort()
+        rows_by_database = {}
+        for u, q in pairs:
+            question_id, created_at, bias = question_rows[q]
+            rows_by_database.setdefault(shard_for(question_id), []).append((
+                user_ids[u],
+                question_id,
+                'optionOne' if rng.random() < bias else 'optionTwo',
+                created_at + (now - created_at) * rng.random(),
+            ))
+        for alias, rows in rows_by_database.items():
+            connection = connections[alias]
+            adapt_datetime = connection.ops.adapt_datetimefield_value
+            insert_sql = answer_insert_sql(connection)
+            with transaction.atomic(using=alias), connection.cursor() as cursor:
+                for batch in batched(rows, batch_size):
+                    cursor.executemany(insert_sql, [
+                        (user_id, question_id, option, adapt_datetime(answered_at))
+                        for user_id, question_id, option, answered_at in batch
+                    ])
+                    created_answers += len(batch)
+        log(f'Answers: {created_answers}/{answers}')
+
+    return {
+        'users': len(user_ids),
+        'questions': len(question_rows),
+        'answers': created_answers,
+    }
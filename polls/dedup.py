@@ -0,0 +1,244 @@
+import hashlib
+import os
+import pickle
+import random
+import re
+import tempfile
+import threading
+import time
+from collections import defaultdict
+
+import numpy as np
+
+from django.conf import settings
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+
+from .models import Question
+
+
+NUM_PERMUTATIONS = 64
+BANDS = 16  # 16 bands x 4 rows: candidates from roughly 50% similarity upwards
+ROWS_PER_BAND = NUM_PERMUTATIONS // BANDS
+SHINGLE_SIZE = 4
+# 32-bit shingle hashes times 31-bit coefficients stay within uint64
+MERSENNE_PRIME = (1 << 31) - 1
+
+# Fixed seed so signatures stay comparable across processes and restarts
+_rng = random.Random(20260119)
+PERM_A = np.array(
+    [_rng.randrange(1, MERSENNE_PRIME) for _ in range(NUM_PERMUTATIONS)], dtype=np.uint64
+)[:, None]
+PERM_B = np.array(
+    [_rng.randrange(0, MERSENNE_PRIME) for _ in range(NUM_PERMUTATIONS)], dtype=np.uint64
+)[:, None]
+
+NON_WORD_RE = re.compile(r'[^a-z0-9]+')
+
+# Seconds between checks for questions created by other processes; this
+# process's own saves are indexed straight away (question_saved)
+CATCH_UP_INTERVAL = 10
+
+
+def normalize(text):
+    return NON_WORD_RE.sub(' ', text.lower()).strip()
+
+
+def shingles(option_one_text, option_two_text):
+    """
+    Character shingles of each option. Options are shingled separately, so
+    "A or B" and "B or A" produce the same set.
+    """
+    result = set()
+    for text in (normalize(option_one_text), normalize(option_two_text)):
+        if len(text) <= SHINGLE_SIZE:
+            result.add(text)
+        else:
+            result.update(text[i:i + SHINGLE_SIZE] for i in range(len(text) - SHINGLE_SIZE + 1))
+    return result
+
+
+def signature(option_one_text, option_two_text):
+    """MinHash signature: all permutations applied to all shingles in one array op"""
+    hashes = np.fromiter(
+        (
+            int.from_bytes(hashlib.blake2b(s.encode(), digest_size=4).digest(), 'little')
+            for s in shingles(option_one_text, option_two_text)
+        ),
+        dtype=np.uint64,
+    )
+    if not len(hashes):
+        return (0,) * NUM_PERMUTATIONS
+    return tuple(((PERM_A * hashes + PERM_B) % MERSENNE_PRIME).min(axis=1).tolist())
+
+
+def similarity(sig_a, sig_b):
+    """Estimated Jaccard similarity of two signatures"""
+    return sum(1 for a, b in zip(sig_a, sig_b) if a == b) / NUM_PERMUTATIONS
+
+
+class QuestionIndex:
+    """MinHash signatures of every question, bucketed per LSH band"""
+
+    def __init__(self):
+        self.signatures = {}
+        self.buckets = [defaultdict(set) for _ in range(BANDS)]
+        # Highest question id folded in; newer rows are caught up from the database
+        self.watermark = 0
+
+    @staticmethod
+    def _bands(sig):
+        for band in range(BANDS):
+            yield band, sig[band * ROWS_PER_BAND:(band + 1) * ROWS_PER_BAND]
+
+    def add(self, question_id, sig):
+        self.remove(question_id)
+        self.signatures[question_id] = sig
+        for band, key in self._bands(sig):
+            self.buckets[band][key].add(question_id)
+        self.watermark = max(self.watermark, question_id)
+
+    def remove(self, question_id):
+        sig = self.signatures.pop(question_id, None)
+        if sig is None:
+            return
+        for band, key in self._bands(sig):
+            bucket = self.buckets[band].get(key)
+            if bucket is not None:
+                bucket.discard(question_id)
+                if not bucket:
+                    del self.buckets[band][key]
+
+    def query(self, sig, threshold):
+        """(question_id, similarity) pairs at or above threshold, best first"""
+        candidates = set()
+        for band, key in self._bands(sig):
+            candidates.update(self.buckets[band].get(key, ()))
+        matches = [
+            (question_id, similarity(sig, self.signatures[question_id]))
+            for question_id in candidates
+        ]
+        return sorted(
+            (match for match in matches if match[1] >= threshold),
+            key=lambda match: match[1],
+            reverse=True,
+        )
+
+    def catch_up(self, batch_size=5000):
+        """Fold in questions created since the watermark (a primary key range scan)"""
+        added = 0
+        while True:
+            rows = list(
+                Question.objects.filter(id__gt=self.watermark)
+                .order_by('id')
+                .values_list('id', 'option_one_text', 'option_two_text')[:batch_size]
+            )
+            for question_id, option_one_text, option_two_text in rows:
+                self.add(question_id, signature(option_one_text, option_two_text))
+            added += len(rows)
+            if len(rows) < batch_size:
+                return added
+
+    def save(self, path):
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(path), suffix='.tmp')
+        with os.fdopen(fd, 'wb') as f:
+            pickle.dump({'watermark': self.watermark, 'signatures': self.signatures}, f,
+                        protocol=pickle.HIGHEST_PROTOCOL)
+        os.replace(tmp_path, path)
+
+    @classmethod
+    def load(cls, path):
+        index = cls()
+        if os.path.exists(path):
+            with open(path, 'rb') as f:
+                data = pickle.load(f)
+            for question_id, sig in data['signatures'].items():
+                index.add(question_id, sig)
+            index.watermark = data['watermark']
+        return index
+
+
+def index_path():
+    return os.path.join(settings.DEDUP_INDEX_DIR, 'questions.minhash')
+
+
+_index = None
+_index_lock = threading.Lock()
+_last_catch_up = 0.0
+
+
+def get_index():
+    """The process-wide index, loaded from disk and caught up with new questions"""
+    global _index, _last_catch_up
+    with _index_lock:
+        if _index is None:
+            _index = QuestionIndex.load(index_path())
+            _last_catch_up = 0.0
+        if time.monotonic() - _last_catch_up >= CATCH_UP_INTERVAL:
+            _index.catch_up()
+            _last_catch_up = time.monotonic()
+        return _index
+
+
+# Connected on import, which is always before an index is loaded
+@receiver(post_save, sender=Question)
+def question_saved(sender, instance, **kwargs):
+    """(Re)index a created or edited question in this process's index, if loaded"""
+    with _index_lock:
+        if _index is not None:
+            _index.add(instance.id, signature(instance.option_one_text, instance.option_two_text))
+
+
+@receiver(post_delete, sender=Question)
+def question_deleted(sender, instance, **kwargs):
+    with _index_lock:
+        if _index is not None:
+            _index.remove(instance.id)
+
+
+def find_duplicates(option_one_text, option_two_text, threshold=None):
+    """
+    Visible questions that look like near-duplicates, best match first.
+    Candidates are checked against their current text, so a question
+    edited in another process since it was indexed is re-signed here.
+    """
+    if threshold is None:
+        threshold = settings.DUPLICATE_QUESTION_THRESHOLD
+    index = get_index()
+    sig = signature(option_one_text, option_two_text)
+    with _index_lock:
+        matches = index.query(sig, threshold)
+    if not matches:
+        return []
+
+    questions = Question.objects.in_bulk([question_id for question_id, _ in matches])
+    results = []
+    with _index_lock:
+        for question_id, score in matches:
+            question = questions.get(question_id)
+            if question is None:
+                # Deleted since it was indexed
+                index.remove(question_id)
+                continue
+            current = signature(question.option_one_text, question.option_two_text)
+            if current != index.signatures.get(question_id):
+                index.add(question_id, current)
+                score = similarity(sig, current)
+                if score < threshold:
+                    continue
+            if not question.is_hidden:
+                results.append((question, score))
+    return sorted(results, key=lambda match: match[1], reverse=True)
+
+
+def build_index():
+    """Rebuild the index over every question and persist it"""
+    global _index, _last_catch_up
+    index = QuestionIndex()
+    index.catch_up()
+    index.save(index_path())
+    with _index_lock:
+        _index = index
+        _last_catch_up = time.monotonic()
+    return index
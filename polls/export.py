@@ -0,0 +1,129 @@
+import csv
+import io
+import json
+import zlib
+
+from django.db.models import Q
+
+from . import sharding
+from .models import Question, Answer, ArchivedAnswer
+
+
+ANSWER_FIELDS = ['id', 'user_id', 'question_id', 'option_selected', 'answered_at', 'archived']
+QUESTION_FIELDS = ['id', 'author_id', 'option_one_text', 'option_two_text', 'created_at']
+
+FORMATS = {
+    'csv': 'text/csv',
+    'jsonl': 'application/x-ndjson',
+}
+
+DEFAULT_CHUNK_SIZE = 5000
+
+OPTION_NAMES = {code: name for name, code in ArchivedAnswer.OPTIONS.items()}
+
+
+def iter_pages(queryset, fields, chunk_size=DEFAULT_CHUNK_SIZE):
+    """
+    Yield lists of value tuples in primary key order. Each page is its own
+    short keyset query (id > last seen id) rather than one cursor held open
+    for the whole export, which on SQLite would keep a read lock for minutes
+    and block writers.
+    """
+    last_id = 0
+    while True:
+        page = list(
+            queryset.filter(id__gt=last_id)
+            .order_by('id')
+            .values_list(*fields)[:chunk_size]
+        )
+        if not page:
+            return
+        yield page
+        if len(page) < chunk_size:
+            return
+        last_id = page[-1][0]
+
+
+def iter_archived_pages(chunk_size=DEFAULT_CHUNK_SIZE):
+    """Archived answers in (user_id, question_id) key pages, shaped like ANSWER_FIELDS"""
+    last = None
+    while True:
+        archived = ArchivedAnswer.objects.order_by('user_id', 'question_id')
+        if last is not None:
+            archived = archived.filter(Q(user_id__gt=last[0]) | Q(user_id=last[0], question_id__gt=last[1]))
+        page = list(archived.values_list('user_id', 'question_id', 'option', 'answered_at')[:chunk_size])
+        if not page:
+            return
+        # Archived answers have no id of their own
+        yield [
+            (None, user_id, question_id, OPTION_NAMES[option], answered_at, True)
+            for user_id, question_id, option, answered_at in page
+        ]
+        if len(page) < chunk_size:
+            return
+        last = page[-1][:2]
+
+
+def answer_pages(chunk_size=DEFAULT_CHUNK_SIZE):
+    """Live answers from every database holding them (see sharding.py), then archived ones"""
+    for alias in sharding.answer_databases():
+        for page in iter_pages(Answer.objects.using(alias), ANSWER_FIELDS[:-1], chunk_size):
+            yield [row + (False,) for row in page]
+    yield from iter_archived_pages(chunk_size)
+
+
+def question_pages(chunk_size=DEFAULT_CHUNK_SIZE):
+    return iter_pages(Question.objects.all(), QUESTION_FIELDS, chunk_size)
+
+
+# name -> (exported columns, pages of rows)
+EXPORTS = {
+    'answers': (ANSWER_FIELDS, answer_pages),
+    'questions': (QUESTION_FIELDS, question_pages),
+}
+
+
+def _csv_chunks(fields, pages):
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    writer.writerow(fields)
+    yield buffer.getvalue()
+    for page in pages:
+        buffer.seek(0)
+        buffer.truncate()
+        writer.writerows(
+            [value.isoformat() if hasattr(value, 'isoformat') else value for value in row]
+            for row in page
+        )
+        yield buffer.getvalue()
+
+
+def _jsonl_chunks(fields, pages):
+    for page in pages:
+        yield ''.join(
+            json.dumps(dict(zip(fields, row)), default=lambda value: value.isoformat()) + '\n'
+            for row in page
+        )
+
+
+def _gzip(chunks):
+    # wbits=31 writes a gzip header and trailer around the deflate stream
+    compressor = zlib.compressobj(6, zlib.DEFLATED, 31)
+    for chunk in chunks:
+        data = compressor.compress(chunk)
+        if data:
+            yield data
+    yield compressor.flush()
+
+
+def export_stream(name, fmt='csv', compress=False, chunk_size=DEFAULT_CHUNK_SIZE):
+    """Bytes of a full table export, generated page by page in constant memory"""
+    fields, read_pages = EXPORTS[name]
+    pages = read_pages(chunk_size)
+    text_chunks = _csv_chunks(fields, pages) if fmt == 'csv' else _jsonl_chunks(fields, pages)
+    chunks = (chunk.encode() for chunk in text_chunks)
+    return _gzip(chunks) if compress else chunks
+
+
+def export_filename(name, fmt, compress):
+    return f"{name}.{fmt}{'.gz' if compress else ''}"
@@ -1,7 +1,9 @@
 from django import forms
+from django.conf import settings
 from django.contrib.auth.forms import UserCreationForm, AuthenticationForm
 from django.core.exceptions import ValidationError
 from .models import Question, Answer, User
+from . import dedup
 
 
 class UserSignupForm(UserCreationForm):
@@ -125,6 +127,28 @@ class QuestionForm(forms.ModelForm):
         if not text or len(text.strip()) < 3:
             raise ValidationError('Option two must be at least 3 characters long.')
         return text.strip()
+    
+    def clean(self):
+        cleaned_data = super().clean()
+        # Set when DUPLICATE_QUESTION_MODE is 'warn' so the view can tell the author
+        self.duplicate_of = None
+        
+        option_one = cleaned_data.get('option_one_text')
+        option_two = cleaned_data.get('option_two_text')
+        mode = settings.DUPLICATE_QUESTION_MODE
+        if mode == 'off' or not option_one or not option_two:
+            return cleaned_data
+        
+        matches = dedup.find_duplicates(option_one, option_two)
+        if matches:
+            if mode == 'reject':
+                raise ValidationError(
+                    'A very similar question already exists: "%(question)s"',
+                    code='duplicate',
+                    params={'question': matches[0][0]},
+                )
+            self.duplicate_of = matches[0][0]
+        return cleaned_data
 
 
 class AnswerForm(forms.ModelForm):
@@ -140,4 +164,16 @@ class AnswerForm(forms.ModelForm):
         }
         labels = {
             'option_selected': '',
-        }
\ No newline at end of file
+        }
+
+
+class ReassignAuthorForm(forms.Form):
+    """Intermediate form for the reassign author admin action"""
+    author = forms.CharField(max_length=150, label='New author', help_text='Username of the new author')
+    
+    def clean_author(self):
+        username = self.cleaned_data['author'].strip()
+        author = User.objects.filter(username=username).first()
+        if author is None:
+            raise ValidationError(f'No user named "{username}".')
+        return author
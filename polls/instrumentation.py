@@ -0,0 +1,151 @@
+import contextvars
+import time
+from collections import Counter
+from contextlib import ExitStack, contextmanager
+
+from django.db import connections
+
+
+# Stats for the request (or benchmark call) currently being measured
+_active_stats = contextvars.ContextVar('polls_request_stats', default=None)
+_template_timer_installed = False
+_compile_timer_installed = False
+
+
+class RequestStats:
+    """
+    Query and render timings for one unit of work. Also usable directly as a
+    connection.execute_wrapper.
+    """
+
+    def __init__(self, slow_query_ms=None):
+        self.slow_query_ms = slow_query_ms
+        self.query_count = 0
+        self.db_time = 0.0
+        self.render_time = 0.0
+        self.compile_time = 0.0
+        self.total_time = 0.0
+        self.sql_counts = Counter()
+        self.slow_queries = []
+        self._render_depth = 0
+        self._compile_depth = 0
+
+    def __call__(self, execute, sql, params, many, context):
+        start = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            elapsed = time.perf_counter() - start
+            self.query_count += 1
+            self.db_time += elapsed
+            # Same SQL text with different params is the N+1 signature
+            self.sql_counts[sql] += 1
+            if self.slow_query_ms is not None and elapsed * 1000 >= self.slow_query_ms:
+                self.slow_queries.append((elapsed, sql))
+
+    @property
+    def duplicate_queries(self):
+        """SQL statements executed more than once, most repeated first"""
+        return [(sql, n) for sql, n in self.sql_counts.most_common() if n > 1]
+
+
+def install_template_timer():
+    """
+    Wrap the Django template backend so rendering time is attributed to the
+    active RequestStats. Costs one context variable lookup when nothing is
+    being measured.
+    """
+    global _template_timer_installed
+    if _template_timer_installed:
+        return
+
+    from django.template.backends.django import Template
+
+    original_render = Template.render
+
+    def render(self, context=None, request=None):
+        stats = _active_stats.get()
+        if stats is None:
+            return original_render(self, context, request)
+
+        # Nested renders (e.g. render_to_string inside a view) count once
+        stats._render_depth += 1
+        start = time.perf_counter()
+        try:
+            return original_render(self, context, request)
+        finally:
+            stats._render_depth -= 1
+            if stats._render_depth == 0:
+                stats.render_time += time.perf_counter() - start
+
+    Template.render = render
+    _template_timer_installed = True
+
+
+def install_compile_timer():
+    """
+    Wrap the ORM's SQL compilers so the time spent turning querysets into
+    SQL (as_sql) is attributed to the active RequestStats
+    """
+    global _compile_timer_installed
+    if _compile_timer_installed:
+        return
+
+    from django.db.models.sql import compiler
+
+    def timed(original_as_sql):
+        def as_sql(self, *args, **kwargs):
+            stats = _active_stats.get()
+            if stats is None:
+                return original_as_sql(self, *args, **kwargs)
+
+            # Subqueries compile inside their outer query; count the outer one
+            stats._compile_depth += 1
+            start = time.perf_counter()
+            try:
+                return original_as_sql(self, *args, **kwargs)
+            finally:
+                stats._compile_depth -= 1
+                if stats._compile_depth == 0:
+                    stats.compile_time += time.perf_counter() - start
+
+        return as_sql
+
+    for name in ('SQLCompiler', 'SQLInsertCompiler', 'SQLDeleteCompiler',
+                 'SQLUpdateCompiler', 'SQLAggregateCompiler'):
+        cls = getattr(compiler, name)
+        if 'as_sql' in vars(cls):
+            cls.as_sql = timed(cls.as_sql)
+    _compile_timer_installed = True
+
+
+@contextmanager
+def measure(slow_query_ms=None, stats=None):
+    """
+    Record queries on every configured database, template render and SQL
+    compile time. Pass the stats of an earlier measure() to add to them,
+    e.g. for the chunks of a streamed response body.
+    """
+    install_template_timer()
+    install_compile_timer()
+    if stats is None:
+        stats = RequestStats(slow_query_ms=slow_query_ms)
+    token = _active_stats.set(stats)
+    start = time.perf_counter()
+    try:
+        with ExitStack() as stack:
+            for alias in connections:
+                stack.enter_context(connections[alias].execute_wrapper(stats))
+            yield stats
+    finally:
+        stats.total_time += time.perf_counter() - start
+        _active_stats.reset(token)
+
+
+def percentile(values, pct):
+    """Nearest-rank percentile of a list of numbers"""
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    index = max(0, min(len(ordered) - 1, round(pct / 100 * len(ordered) + 0.5) - 1))
+    return ordered[index]
@@ -0,0 +1,129 @@
+import logging
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import transaction
+from django.utils import timezone
+
+from . import rollups, sharding, trending
+from .models import Answer
+from .tasks import task
+
+
+logger = logging.getLogger('polls.jobs')
+
+REFRESH_VOTE_AGGREGATES_KEY = 'refresh_vote_aggregates'
+REBUILD_ANSWER_STORE_KEY = 'rebuild_answer_store'
+BUILD_AGREEMENT_INDEX_KEY = 'build_agreement_index'
+UPDATE_AGREEMENT_INDEX_KEY = 'update_agreement_index'
+
+
+@task
+def refresh_vote_aggregates():
+    """
+    Fold new answers into the vote rollups and trending scores. Queued after
+    votes with a dedup key, so a burst of votes results in one run.
+    """
+    rollups.update()
+    trending.update()
+    update_agreement_index.delay(
+        dedup_key=UPDATE_AGREEMENT_INDEX_KEY, countdown=settings.AGREEMENT_UPDATE_SECONDS
+    )
+    # Answers younger than the rollup lag were left for later; come back for them
+    cutoff = timezone.now() - timedelta(seconds=settings.ROLLUP_LAG_SECONDS)
+    if sharding.exists(Answer.objects.filter(answered_at__gt=cutoff)):
+        queue_vote_aggregates()
+
+
+def queue_vote_aggregates():
+    refresh_vote_aggregates.delay(
+        dedup_key=REFRESH_VOTE_AGGREGATES_KEY, countdown=settings.ROLLUP_LAG_SECONDS
+    )
+
+
+def queue_vote_aggregates_after_votes():
+    """
+    For views that just saved votes: queue the refresh once they commit.
+    The votes stand either way, so a failure to queue is logged rather than
+    shown to the voter; the next vote queues the refresh again.
+    """
+    def queue():
+        try:
+            queue_vote_aggregates()
+        except Exception:
+            logger.exception('Could not queue the vote aggregate refresh')
+
+    transaction.on_commit(queue)
+
+
+@task
+def build_recommendations():
+    # Imported here so web processes that only queue tasks don't load scipy
+    from . import recommender
+    recommender.rebuild()
+
+
+@task
+def archive_answers():
+    from . import archive
+    archive.archive_answers()
+
+
+@task
+def update_answer_store():
+    from . import columnar
+    columnar.update()
+
+
+@task
+def rebuild_answer_store():
+    from . import columnar
+    columnar.rebuild()
+
+
+@task
+def build_agreement_index():
+    from . import agreement
+    agreement.build_index()
+
+
+@task
+def update_agreement_index():
+    from . import agreement
+    agreement.update_index()
+
+
+@task
+def purge_users(user_ids, batch=None, part=None, parts=None):
+    from . import moderation, purge
+    for user_id in user_ids:
+        purge.purge_user(user_id)
+    moderation.log_part(batch, part, parts)
+    if part == parts:
+        purge.queue_index_rebuilds()
+
+
+@task
+def purge_questions(question_ids, batch=None, part=None, parts=None):
+    from . import moderation, purge
+    for question_id in question_ids:
+        purge.purge_question(question_id)
+    moderation.log_part(batch, part, parts)
+    if part == parts:
+        purge.queue_index_rebuilds()
+
+
+@task
+def recompute_question_stats(question_ids, batch=None, part=None, parts=None):
+    from . import moderation
+    moderation.recompute_question_stats(question_ids)
+    moderation.log_part(batch, part, parts)
+
+
+@task
+def delete_answers(answer_ids, batch=None, part=None, parts=None):
+    from . import moderation, purge
+    purge.delete_answers(answer_ids)
+    moderation.log_part(batch, part, parts)
+    if part == parts:
+        purge.queue_index_rebuilds()
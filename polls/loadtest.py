@@ -0,0 +1,333 @@
+import http.client
+import multiprocessing
+import os
+import random
+import re
+import socket
+import subprocess
+import sys
+import time
+import urllib.parse
+from collections import Counter, defaultdict
+from http.cookies import SimpleCookie
+
+
+# Journeys a simulated user picks from, and how often by default
+DEFAULT_MIX = 'home=5,vote=3,leaderboard=1,login=1'
+
+# Paths on the server under test, as in polls/urls.py
+DEFAULT_PATHS = {
+    'login': '/',
+    'logout': '/logout/',
+    'home': '/home/',
+    'question': '/question/{}/',
+    'leaderboard': '/leaderboard/',
+}
+
+CSRF_INPUT = re.compile(rb'name="csrfmiddlewaretoken" value="([^"]+)"')
+QUESTION_LINK = re.compile(rb'href="/question/(\d+)/"')
+# question_detail_view catches a failed save and re-renders the form with this
+VOTE_NOT_SAVED = b'An error occurred while saving your answer.'
+DATABASE_LOCKED = b'database is locked'
+
+# Retried once on a fresh connection (the server closed a keep-alive one)
+RECONNECT_ERRORS = (http.client.RemoteDisconnected, BrokenPipeError, ConnectionResetError)
+
+
+class Session:
+    """One simulated browser: a keep-alive connection and its cookies"""
+
+    def __init__(self, host, port, timeout=30.0):
+        self.host = host
+        self.port = port
+        self.timeout = timeout
+        self.cookies = {}
+        self.connection = None
+
+    def connect(self):
+        if self.connection is not None:
+            self.connection.close()
+        self.connection = http.client.HTTPConnection(self.host, self.port, timeout=self.timeout)
+
+    def request(self, method, path, form=None):
+        """(status, body) of one request; redirects are not followed"""
+        headers = {'Host': f'{self.host}:{self.port}'}
+        if self.cookies:
+            headers['Cookie'] = '; '.join(f'{name}={value}' for name, value in self.cookies.items())
+        body = None
+        if form is not None:
+            body = urllib.parse.urlencode(form)
+            headers['Content-Type'] = 'application/x-www-form-urlencoded'
+            headers['Referer'] = f'http://{self.host}:{self.port}{path}'
+
+        for attempt in range(2):
+            if self.connection is None or attempt:
+                self.connect()
+            try:
+                self.connection.request(method, path, body=body, headers=headers)
+                response = self.connection.getresponse()
+                content = response.read()
+                break
+            except RECONNECT_ERRORS:
+                if attempt:
+                    raise
+
+        for header in response.headers.get_all('Set-Cookie') or []:
+            for name, morsel in SimpleCookie(header).items():
+                self.cookies[name] = morsel.value
+        if response.will_close:
+            self.connection.close()
+            self.connection = None
+        return response.status, content
+
+    def close(self):
+        if self.connection is not None:
+            self.connection.close()
+
+
+class StepFailed(Exception):
+    """Ends the current journey; the failed step is already recorded"""
+
+
+class SimulatedUser:
+    """
+    Runs weighted journeys for one account, recording every request as
+    (step, seconds, error or None).
+    """
+
+    def __init__(self, session, paths, username, password, rng):
+        self.session = session
+        self.paths = paths
+        self.username = username
+        self.password = password
+        self.rng = rng
+        self.samples = []
+
+    def step(self, name, method, path, form=None, expect=(200,)):
+        started = time.perf_counter()
+        error = None
+        try:
+            status, body = self.session.request(method, path, form)
+        except (OSError, http.client.HTTPException) as e:
+            status, body = None, b''
+            error = f'connection: {type(e).__name__}'
+        elapsed = time.perf_counter() - started
+
+        if error is None and status not in expect:
+            if DATABASE_LOCKED in body:
+                error = 'database is locked'
+            elif status == 200 and VOTE_NOT_SAVED in body:
+                error = 'vote not saved'
+            else:
+                error = f'HTTP {status}'
+        self.samples.append((name, elapsed, error))
+        if error is not None:
+            raise StepFailed(error)
+        return body
+
+    def csrf_token(self, body):
+        match = CSRF_INPUT.search(body)
+        return match.group(1).decode() if match else self.session.cookies.get('csrftoken', '')
+
+    def login(self):
+        body = self.step('login_page', 'GET', self.paths['login'])
+        self.step('login_submit', 'POST', self.paths['login'], {
+            'csrfmiddlewaretoken': self.csrf_token(body),
+            'username': self.username,
+            'password': self.password,
+        }, expect=(302,))
+
+    def relogin(self):
+        """Log out and back in: a fresh session row and CSRF token"""
+        self.step('logout', 'GET', self.paths['logout'], expect=(302,))
+        self.login()
+
+    def home(self):
+        return self.step('home', 'GET', self.paths['home'])
+
+    def vote(self):
+        # The default home tab lists unanswered questions
+        question_ids = QUESTION_LINK.findall(self.home())
+        if not question_ids:
+            return
+        path = self.paths['question'].format(self.rng.choice(question_ids).decode())
+        body = self.step('question', 'GET', path)
+        if CSRF_INPUT.search(body) is None:
+            return  # answered meanwhile: the results page has no form
+        self.step('vote', 'POST', path, {
+            'csrfmiddlewaretoken': self.csrf_token(body),
+            'option_selected': self.rng.choice(['optionOne', 'optionTwo']),
+        }, expect=(302,))
+
+    def leaderboard(self):
+        self.step('leaderboard', 'GET', self.paths['leaderboard'])
+
+    JOURNEYS = {
+        'login': relogin,
+        'home': home,
+        'vote': vote,
+        'leaderboard': leaderboard,
+    }
+
+    def run(self, journey):
+        try:
+            if journey != 'login' and 'sessionid' not in self.session.cookies:
+                self.login()
+            self.JOURNEYS[journey](self)
+        except StepFailed:
+            # Start over from the login page, as a user would after an error
+            self.session.cookies.clear()
+
+
+def parse_mix(mix):
+    """'home=5,vote=3' -> {'home': 5.0, 'vote': 3.0}"""
+    weights = {}
+    for part in mix.split(','):
+        if not part.strip():
+            continue
+        name, _, weight = part.partition('=')
+        name = name.strip()
+        if name not in SimulatedUser.JOURNEYS:
+            raise ValueError(f"Unknown journey {name!r} (choose from {', '.join(SimulatedUser.JOURNEYS)})")
+        try:
+            weights[name] = float(weight or 1)
+        except ValueError:
+            raise ValueError(f'Bad weight for {name}: {weight!r}')
+    if not weights or sum(weights.values()) <= 0:
+        raise ValueError('The mix needs at least one journey with a positive weight')
+    return weights
+
+
+def run_user(job):
+    """Entry point of one load process; returns its samples"""
+    index, host, port, paths, username, password, weights, duration, think_time, seed = job
+    rng = random.Random(seed * 1000003 + index)
+    session = Session(host, port)
+    user = SimulatedUser(session, paths, username, password, rng)
+    names, chances = list(weights), list(weights.values())
+
+    deadline = time.monotonic() + duration
+    while time.monotonic() < deadline:
+        user.run(rng.choices(names, chances)[0])
+        if think_time:
+            time.sleep(rng.uniform(0, 2 * think_time))
+    session.close()
+    return user.samples
+
+
+def run(host, port, credentials, weights, duration, think_time=0.0, seed=42, paths=None):
+    """
+    One process per (username, password), each running journeys against
+    host:port for `duration` seconds. Returns (samples, wall seconds).
+    """
+    paths = paths or DEFAULT_PATHS
+    jobs = [
+        (index, host, port, paths, username, password, weights, duration, think_time, seed)
+        for index, (username, password) in enumerate(credentials)
+    ]
+    started = time.perf_counter()
+    # spawn: no Django state or database connections inherited from the parent
+    with multiprocessing.get_context('spawn').Pool(len(jobs)) as pool:
+        results = pool.map(run_user, jobs, chunksize=1)
+    elapsed = time.perf_counter() - started
+    return [sample for samples in results for sample in samples], elapsed
+
+
+def summarize(samples, elapsed):
+    """Per-step and overall request counts, error rates and latency percentiles"""
+    from .instrumentation import percentile
+
+    by_step = defaultdict(list)
+    for sample in samples:
+        by_step[sample[0]].append(sample)
+
+    def stats(rows):
+        latencies = [seconds * 1000 for _, seconds, _ in rows]
+        errors = Counter(error for _, _, error in rows if error is not None)
+        return {
+            'requests': len(rows),
+            'errors': sum(errors.values()),
+            'error_rate': sum(errors.values()) / len(rows) if rows else 0.0,
+            'error_kinds': dict(errors.most_common()),
+            'throughput_rps': len(rows) / elapsed if elapsed else 0.0,
+            'p50_ms': round(percentile(latencies, 50), 3),
+            'p95_ms': round(percentile(latencies, 95), 3),
+            'p99_ms': round(percentile(latencies, 99), 3),
+            'max_ms': round(max(latencies, default=0.0), 3),
+        }
+
+    return {
+        'elapsed_seconds': round(elapsed, 3),
+        'steps': {name: stats(rows) for name, rows in sorted(by_step.items())},
+        'total': stats(samples),
+    }
+
+
+# ============================================================================
+# LOCAL SERVER
+# ============================================================================
+
+def free_port():
+    with socket.socket() as sock:
+        sock.bind(('127.0.0.1', 0))
+        return sock.getsockname()[1]
+
+
+def server_command(kind, port, workers, threads, base_dir):
+    bind = f'127.0.0.1:{port}'
+    if kind == 'gunicorn':
+        return [
+            sys.executable, '-m', 'gunicorn', 'would_you_rather.wsgi:application',
+            '--bind', bind, '--workers', str(workers), '--threads', str(threads),
+            '--chdir', str(base_dir),
+        ]
+    if kind == 'uvicorn':
+        return [
+            sys.executable, '-m', 'uvicorn', 'would_you_rather.asgi:application',
+            '--host', '127.0.0.1', '--port', str(port), '--workers', str(workers),
+            '--app-dir', str(base_dir),
+        ]
+    return [sys.executable, str(base_dir / 'manage.py'), 'runserver', bind, '--noreload']
+
+
+def start_server(kind, port, workers, threads, base_dir, log_path, ready_timeout=30.0):
+    """
+    Launch the app on 127.0.0.1:port with the current settings module,
+    output to log_path, and wait until it answers. Returns the process.
+    """
+    log = open(log_path, 'wb')
+    process = subprocess.Popen(
+        server_command(kind, port, workers, threads, base_dir),
+        cwd=base_dir, env=os.environ.copy(), stdout=log, stderr=subprocess.STDOUT,
+    )
+    log.close()
+
+    deadline = time.monotonic() + ready_timeout
+    while time.monotonic() < deadline:
+        if process.poll() is not None:
+            raise RuntimeError(f'{kind} exited with code {process.returncode}; see {log_path}')
+        try:
+            Session('127.0.0.1', port, timeout=2).request('GET', DEFAULT_PATHS['login'])
+            return process
+        except OSError:
+            time.sleep(0.2)
+    stop_server(process)
+    raise RuntimeError(f'{kind} did not answer within {ready_timeout:.0f}s; see {log_path}')
+
+
+def stop_server(process):
+    process.terminate()
+    try:
+        process.wait(timeout=10)
+    except subprocess.TimeoutExpired:
+        process.kill()
+        process.wait()
+
+
+def count_in_log(log_path, text=DATABASE_LOCKED):
+    """Occurrences of text in the server output (tracebacks of 500s, swallowed errors aside)"""
+    try:
+        with open(log_path, 'rb') as log:
+            return log.read().count(text)
+    except FileNotFoundError:
+        return 0
@@ -0,0 +1,35 @@
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from polls import archive
+
+
+class Command(BaseCommand):
+    help = (
+        'Moves answers on old questions into the compact archive table, keeping '
+        'frozen vote tallies on each question'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--older-than-days', type=int, default=settings.ARCHIVE_AFTER_DAYS,
+            help='Archive answers on questions created more than this many days ago'
+        )
+        parser.add_argument(
+            '--batch-size', type=int, default=archive.QUESTION_BATCH_SIZE,
+            help='Questions archived per transaction'
+        )
+
+    def handle(self, *args, **options):
+        started = time.perf_counter()
+        summary = archive.archive_answers(
+            older_than_days=options['older_than_days'],
+            batch_size=options['batch_size'],
+            log=lambda message: self.stdout.write(message),
+        )
+        elapsed = time.perf_counter() - started
+        self.stdout.write(self.style.SUCCESS(
+            f"Archived {summary['answers']} answers on {summary['questions']} questions in {elapsed:.1f}s"
+        ))
@@ -0,0 +1,35 @@
+import time
+from datetime import datetime, time as dt_time, timezone
+
+from django.core.management.base import BaseCommand, CommandError
+
+from polls import rollups
+
+
+class Command(BaseCommand):
+    help = (
+        'Recomputes vote rollups from raw answers, day by day. Use after importing '
+        'answers with past timestamps or deleting answers'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--since', default=None,
+            help='First day to recompute, YYYY-MM-DD (default: the first answer)'
+        )
+
+    def handle(self, *args, **options):
+        since = None
+        if options['since']:
+            try:
+                day = datetime.strptime(options['since'], '%Y-%m-%d').date()
+            except ValueError:
+                raise CommandError('--since must be a date in YYYY-MM-DD format')
+            since = datetime.combine(day, dt_time.min, tzinfo=timezone.utc)
+
+        started = time.perf_counter()
+        buckets = rollups.backfill(since=since, log=lambda message: self.stdout.write(message))
+        elapsed = time.perf_counter() - started
+        self.stdout.write(self.style.SUCCESS(
+            f'Rebuilt {buckets} rollup buckets in {elapsed:.1f}s'
+        ))
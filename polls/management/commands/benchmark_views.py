@@ -0,0 +1,214 @@
+import json
+import statistics
+from pathlib import Path
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.db.models import Count
+from django.test import Client
+from django.urls import reverse
+
+from polls import sharding
+from polls.datagen import generate_dataset
+from polls.instrumentation import measure, percentile
+from polls.models import User, Question, Answer
+
+
+# Cumulative dataset sizes: (users, questions, answers)
+DATASET_SIZES = {
+    'small': (50, 200, 2000),
+    'medium': (500, 2000, 50000),
+    'large': (2000, 10000, 300000),
+}
+
+DEFAULT_BASELINE = Path(settings.BASE_DIR) / 'benchmarks' / 'baseline.json'
+
+
+class Command(BaseCommand):
+    help = (
+        'Benchmarks every view against generated datasets of increasing size '
+        'and fails when query counts or latency regress against a baseline'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--sizes', default='small,medium',
+            help=f"Comma-separated dataset sizes to run ({', '.join(DATASET_SIZES)})"
+        )
+        parser.add_argument('--iterations', type=int, default=20, help='Requests per endpoint')
+        parser.add_argument('--seed', type=int, default=42, help='Seed for the generated datasets')
+        parser.add_argument('--baseline', default=str(DEFAULT_BASELINE), help='Baseline JSON file')
+        parser.add_argument(
+            '--update-baseline', action='store_true',
+            help='Write the results as the new baseline instead of comparing'
+        )
+        parser.add_argument(
+            '--latency-threshold', type=float, default=1.5,
+            help='Fail when p95 latency exceeds baseline by this factor'
+        )
+        parser.add_argument(
+            '--latency-floor-ms', type=float, default=5.0,
+            help='Ignore latency regressions smaller than this many milliseconds'
+        )
+        parser.add_argument(
+            '--query-tolerance', type=int, default=0,
+            help='Extra queries per request allowed over the baseline'
+        )
+
+    def handle(self, *args, **options):
+        sizes = [size.strip() for size in options['sizes'].split(',') if size.strip()]
+        unknown = [size for size in sizes if size not in DATASET_SIZES]
+        if unknown:
+            raise CommandError(f"Unknown dataset size(s): {', '.join(unknown)}")
+        sizes.sort(key=lambda size: DATASET_SIZES[size])
+        if sharding.enabled():
+            # Only the default database is swapped for a test one below; the
+            # shards would be the real ones, and the baseline is unsharded
+            raise CommandError('Unset ANSWER_SHARDS to benchmark; the views would write to the real shards')
+
+        # Never touch the real database: run against a throwaway test database
+        old_name = connection.settings_dict['NAME']
+        connection.creation.create_test_db(verbosity=0, autoclobber=True, serialize=False)
+        try:
+            results = self.run_benchmarks(sizes, options)
+        finally:
+            connection.creation.destroy_test_db(old_name, verbosity=0)
+
+        baseline_path = Path(options['baseline'])
+        if options['update_baseline']:
+            baseline_path.parent.mkdir(parents=True, exist_ok=True)
+            baseline_path.write_text(json.dumps(results, indent=2, sort_keys=True))
+            self.stdout.write(self.style.SUCCESS(f'Baseline written to {baseline_path}'))
+            return
+
+        if not baseline_path.exists():
+            self.stdout.write(self.style.WARNING(
+                f'No baseline at {baseline_path}; run with --update-baseline to record one.'
+            ))
+            return
+
+        baseline = json.loads(baseline_path.read_text())
+        regressions = self.compare(results, baseline, options)
+        if regressions:
+            for line in regressions:
+                self.stderr.write(self.style.ERROR(line))
+            raise CommandError(f'{len(regressions)} performance regression(s) against {baseline_path}')
+        self.stdout.write(self.style.SUCCESS('No regressions against the baseline.'))
+
+    def run_benchmarks(self, sizes, options):
+        results = {}
+        loaded = (0, 0, 0)
+        for size in sizes:
+            target = DATASET_SIZES[size]
+            users, questions, answers = (max(t - l, 0) for t, l in zip(target, loaded))
+            self.stdout.write(f'\nLoading {size} dataset {target}...')
+            generate_dataset(
+                users=users, questions=questions, answers=answers,
+                seed=options['seed'], prefix=f'bench_{size}_',
+            )
+            loaded = target
+
+            results[size] = self.run_endpoints(options['iterations'])
+            self.print_table(size, results[size])
+        return results
+
+    def run_endpoints(self, iterations):
+        # Benchmark as the most active player, promoted so the admin is reachable
+        top = Answer.objects.values('user_id').annotate(n=Count('id')).order_by('-n').first()
+        user = User.objects.get(id=top['user_id']) if top else User.objects.first()
+        user.is_staff = user.is_superuser = True
+        user.save(update_fields=['is_staff', 'is_superuser'])
+
+        client = Client()
+        client.force_login(user)
+
+        answered = Answer.objects.filter(user=user).values_list('question_id', flat=True)
+        answered_id = answered.first()
+        unanswered_ids = list(
+            Question.objects.exclude(id__in=answered).values_list('id', flat=True)[:iterations + 2]
+        )
+        unanswered_id = unanswered_ids.pop() if unanswered_ids else answered_id
+
+        endpoints = {
+            'home_unanswered': lambda i: client.get(reverse('home')),
+            'home_answered': lambda i: client.get(reverse('home'), {'tab': 'answered'}),
+            'question_results': lambda i: client.get(reverse('question_detail', args=[answered_id])),
+            'question_form': lambda i: client.get(reverse('question_detail', args=[unanswered_id])),
+            'leaderboard': lambda i: client.get(reverse('leaderboard')),
+            'admin_users': lambda i: client.get(reverse('admin:polls_user_changelist')),
+            'admin_questions': lambda i: client.get(reverse('admin:polls_question_changelist')),
+            'admin_answers': lambda i: client.get(reverse('admin:polls_answer_changelist')),
+        }
+        if unanswered_ids:
+            endpoints['vote'] = lambda i: client.post(
+                reverse('question_detail', args=[unanswered_ids[(i + 1) % len(unanswered_ids)]]),
+                {'option_selected': 'optionOne'},
+            )
+
+        results = {}
+        for name, call in endpoints.items():
+            if answered_id is None and name == 'question_results':
+                continue
+
+            call(-1)  # warm-up: template loading, URL resolver, connection
+            samples = []
+            for i in range(iterations):
+                with measure() as stats:
+                    response = call(i)
+                    if response.streaming:
+                        # The streamed body runs its queries as it is read
+                        b''.join(response.streaming_content)
+                if response.status_code >= 400:
+                    raise CommandError(f'{name} returned HTTP {response.status_code}')
+                samples.append(stats)
+
+            latencies = [s.total_time * 1000 for s in samples]
+            results[name] = {
+                'queries': max(s.query_count for s in samples),
+                'duplicate_queries': max(
+                    sum(n - 1 for _, n in s.duplicate_queries) for s in samples
+                ),
+                'sql_ms': round(statistics.mean(s.db_time * 1000 for s in samples), 3),
+                'render_ms': round(statistics.mean(s.render_time * 1000 for s in samples), 3),
+                'p50_ms': round(percentile(latencies, 50), 3),
+                'p95_ms': round(percentile(latencies, 95), 3),
+            }
+        return results
+
+    def print_table(self, size, results):
+        self.stdout.write(
+            f"{'endpoint':<20}{'queries':>9}{'dupes':>7}{'sql ms':>10}"
+            f"{'render ms':>11}{'p50 ms':>10}{'p95 ms':>10}"
+        )
+        for name, r in results.items():
+            self.stdout.write(
+                f"{name:<20}{r['queries']:>9}{r['duplicate_queries']:>7}{r['sql_ms']:>10.2f}"
+                f"{r['render_ms']:>11.2f}{r['p50_ms']:>10.2f}{r['p95_ms']:>10.2f}"
+            )
+
+    def compare(self, results, baseline, options):
+        regressions = []
+        for size, endpoints in results.items():
+            for name, current in endpoints.items():
+                previous = baseline.get(size, {}).get(name)
+                if previous is None:
+                    continue
+
+                allowed_queries = previous['queries'] + options['query_tolerance']
+                if current['queries'] > allowed_queries:
+                    regressions.append(
+                        f"[{size}] {name}: {current['queries']} queries "
+                        f"(baseline {previous['queries']})"
+                    )
+
+                allowed_p95 = max(
+                    previous['p95_ms'] * options['latency_threshold'],
+                    previous['p95_ms'] + options['latency_floor_ms'],
+                )
+                if current['p95_ms'] > allowed_p95:
+                    regressions.append(
+                        f"[{size}] {name}: p95 {current['p95_ms']:.1f}ms "
+                        f"(baseline {previous['p95_ms']:.1f}ms)"
+                    )
+        return regressions
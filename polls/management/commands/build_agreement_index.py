@@ -0,0 +1,22 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from polls import agreement
+
+
+class Command(BaseCommand):
+    help = (
+        'Rebuilds the per-player answer bitsets behind "Players who think like you" '
+        'from every answer, archived ones included'
+    )
+
+    def handle(self, *args, **options):
+        started = time.perf_counter()
+        index = agreement.build_index()
+        users, words = index.answered.shape
+        elapsed = time.perf_counter() - started
+        self.stdout.write(self.style.SUCCESS(
+            f'Built agreement index for {users} user slots x {words * agreement.WORD_BITS} '
+            f'question slots (watermarks {index.watermarks}) in {elapsed:.1f}s'
+        ))
@@ -0,0 +1,31 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from polls import columnar
+
+
+class Command(BaseCommand):
+    help = (
+        'Appends new answers to the memory-mapped columnar answer store used by '
+        'the admin analytics page'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--full', action='store_true',
+            help='Rewrite the store from scratch, including archived answers '
+                 '(needed after answers are deleted)'
+        )
+
+    def handle(self, *args, **options):
+        started = time.perf_counter()
+        if options['full']:
+            meta = columnar.rebuild()
+            message = f"Rebuilt answer store with {meta['rows']} answers"
+        else:
+            appended = columnar.update()
+            meta = columnar.read_meta()
+            message = f"Appended {appended} answers ({meta['rows']} total)"
+        elapsed = time.perf_counter() - started
+        self.stdout.write(self.style.SUCCESS(f'{message} in {elapsed:.1f}s'))
@@ -0,0 +1,18 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from polls import dedup
+
+
+class Command(BaseCommand):
+    help = 'Builds the MinHash/LSH near-duplicate index over all existing questions'
+
+    def handle(self, *args, **kwargs):
+        started = time.perf_counter()
+        index = dedup.build_index()
+        elapsed = time.perf_counter() - started
+        self.stdout.write(self.style.SUCCESS(
+            f'Indexed {len(index.signatures)} questions in {elapsed:.1f}s '
+            f'({dedup.index_path()})'
+        ))
@@ -0,0 +1,36 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from polls import recommender
+
+
+class Command(BaseCommand):
+    help = (
+        'Updates the co-vote matrix with answers since the last run and refreshes '
+        '"answer next" recommendations for the users who voted'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--full', action='store_true',
+            help='Rebuild the matrix from scratch (needed after answers are deleted)'
+        )
+        parser.add_argument(
+            '--all-users', action='store_true',
+            help='Refresh recommendations for every user, not only those with new answers'
+        )
+        parser.add_argument('--top-k', type=int, default=None, help='Recommendations stored per user')
+
+    def handle(self, *args, **options):
+        started = time.perf_counter()
+        summary = recommender.rebuild(
+            full=options['full'],
+            all_users=options['all_users'],
+            k=options['top_k'],
+        )
+        elapsed = time.perf_counter() - started
+        self.stdout.write(self.style.SUCCESS(
+            f"Refreshed {summary['recommendations']} recommendations for {summary['users']} users "
+            f"({summary['questions']} questions, up to {summary['watermark']}) in {elapsed:.1f}s"
+        ))
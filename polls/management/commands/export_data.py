@@ -0,0 +1,47 @@
+import sys
+import time
+
+from django.core.management.base import BaseCommand
+
+from polls import export
+
+
+class Command(BaseCommand):
+    help = 'Streams questions or answers to a CSV or JSONL file in constant memory'
+
+    def add_arguments(self, parser):
+        parser.add_argument('name', choices=sorted(export.EXPORTS), help='What to export')
+        parser.add_argument('--format', choices=sorted(export.FORMATS), default='csv')
+        parser.add_argument('--gzip', action='store_true', help='Gzip the output')
+        parser.add_argument(
+            '--output', default=None,
+            help='Output file (default: <name>.<format>[.gz]; use - for stdout)'
+        )
+        parser.add_argument(
+            '--chunk-size', type=int, default=export.DEFAULT_CHUNK_SIZE,
+            help='Rows fetched per query'
+        )
+
+    def handle(self, *args, **options):
+        name, fmt, compress = options['name'], options['format'], options['gzip']
+        output = options['output'] or export.export_filename(name, fmt, compress)
+
+        started = time.perf_counter()
+        size = 0
+        stream = export.export_stream(name, fmt, compress=compress, chunk_size=options['chunk_size'])
+        if output == '-':
+            for chunk in stream:
+                sys.stdout.buffer.write(chunk)
+                size += len(chunk)
+            sys.stdout.buffer.flush()
+            return
+
+        with open(output, 'wb') as f:
+            for chunk in stream:
+                f.write(chunk)
+                size += len(chunk)
+
+        elapsed = time.perf_counter() - started
+        self.stdout.write(self.style.SUCCESS(
+            f'Wrote {output} ({size / 1024 / 1024:.1f} MB) in {elapsed:.1f}s'
+        ))
@@ -0,0 +1,45 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from polls.datagen import DEFAULT_PASSWORD, generate_dataset
+
+
+class Command(BaseCommand):
+    help = 'Bulk-generates users, questions and answers with realistic popularity skew'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--users', type=int, default=1000, help='Number of users to create')
+        parser.add_argument('--questions', type=int, default=5000, help='Number of questions to create')
+        parser.add_argument('--answers', type=int, default=100000, help='Number of answers to create')
+        parser.add_argument('--seed', type=int, default=None, help='Random seed for reproducible datasets')
+        parser.add_argument('--batch-size', type=int, default=5000, help='Rows per bulk_create batch')
+        parser.add_argument(
+            '--skew', type=float, default=1.1,
+            help='Zipf exponent for question popularity and user activity (0 = uniform)'
+        )
+        parser.add_argument('--days', type=int, default=90, help='Spread activity over this many days')
+        parser.add_argument('--prefix', default='player', help='Username prefix for generated users')
+
+    def handle(self, *args, **options):
+        started = time.perf_counter()
+        verbose = options['verbosity'] > 1
+
+        counts = generate_dataset(
+            users=options['users'],
+            questions=options['questions'],
+            answers=options['answers'],
+            seed=options['seed'],
+            batch_size=options['batch_size'],
+            skew=options['skew'],
+            days=options['days'],
+            prefix=options['prefix'],
+            log=self.stdout.write if verbose else None,
+        )
+
+        elapsed = time.perf_counter() - started
+        self.stdout.write(self.style.SUCCESS(
+            f"Created {counts['users']} users, {counts['questions']} questions and "
+            f"{counts['answers']} answers in {elapsed:.1f}s"
+        ))
+        self.stdout.write(f'All generated users have the password "{DEFAULT_PASSWORD}"')
@@ -0,0 +1,131 @@
+import json
+import os
+import re
+import subprocess
+import sys
+from collections import defaultdict
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+
+# Always listed, whatever their rank
+FOCUS_MODULES = [
+    'dotenv',
+    'would_you_rather.settings',
+    'django.contrib.admin',
+    'polls.models',
+    'polls.admin',
+    'numpy',
+    'would_you_rather.urls',
+    'polls.views',
+]
+
+# Runs in a fresh interpreter under -X importtime; phases go to stdout as JSON.
+# -X importtime only sees the import statement, not importlib.import_module(),
+# which is how Django loads settings, apps, admin modules and the URLconf by
+# name; routing those through __import__ gets them reported too.
+BOOT_SCRIPT = '''
+import importlib, json, sys, time
+_import_module = importlib.import_module
+def import_module(name, package=None):
+    if package is None and not name.startswith('.'):
+        __import__(name)
+        return sys.modules[name]
+    return _import_module(name, package)
+importlib.import_module = import_module
+phases = {}
+started = time.perf_counter()
+import django
+django.setup()
+phases['setup'] = time.perf_counter() - started
+from django.conf import settings
+step = time.perf_counter()
+__import__(settings.ROOT_URLCONF)
+phases['urlconf'] = time.perf_counter() - step
+if WARM:
+    from polls.warmup import warm_up
+    for name, seconds in warm_up().items():
+        phases['warm_up.' + name] = seconds
+phases['total'] = time.perf_counter() - started
+print(json.dumps(phases))
+'''
+
+IMPORT_LINE = re.compile(r'^import time:\s+(\d+) \|\s+(\d+) \|( *)(\S+)$')
+
+
+class Command(BaseCommand):
+    help = (
+        'Boots the app in a fresh interpreter with python -X importtime and '
+        'reports the import cost per module, per package and per boot phase'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--top', type=int, default=25, help='Modules to list')
+        parser.add_argument(
+            '--sort', choices=['cumulative', 'self'], default='cumulative',
+            help='Rank modules by time including their imports, or their own code only'
+        )
+        parser.add_argument(
+            '--prefix', default='',
+            help="Only list modules starting with this, e.g. 'polls' or 'django.contrib'"
+        )
+        parser.add_argument('--no-warm-up', action='store_true', help="Skip polls.warmup's warm_up()")
+        parser.add_argument('--output', help='Also write the results to this JSON file')
+
+    def handle(self, *args, **options):
+        script = BOOT_SCRIPT.replace('WARM', 'False' if options['no_warm_up'] else 'True')
+        # manage.py has set DJANGO_SETTINGS_MODULE, so the child boots the same settings
+        result = subprocess.run(
+            [sys.executable, '-X', 'importtime', '-c', script],
+            cwd=settings.BASE_DIR, env=os.environ.copy(), capture_output=True, text=True,
+        )
+        if result.returncode:
+            raise CommandError(f'Boot failed:\n{result.stderr[-3000:]}')
+
+        modules = {}
+        for line in result.stderr.splitlines():
+            match = IMPORT_LINE.match(line)
+            if match:
+                self_us, cumulative_us, _, name = match.groups()
+                modules[name] = {'self_ms': int(self_us) / 1000, 'cumulative_ms': int(cumulative_us) / 1000}
+        phases = {name: round(seconds * 1000, 3) for name, seconds in json.loads(result.stdout.splitlines()[-1]).items()}
+
+        packages = defaultdict(float)
+        for name, times in modules.items():
+            packages[name.split('.')[0]] += times['self_ms']
+
+        key = f"{options['sort']}_ms"
+        ranked = sorted(
+            (item for item in modules.items() if item[0].startswith(options['prefix'])),
+            key=lambda item: -item[1][key],
+        )[:options['top']]
+
+        self.stdout.write('Boot phases (ms):')
+        for name, ms in phases.items():
+            self.stdout.write(f'  {name:<24}{ms:>10.1f}')
+
+        self.print_modules('Focus modules', [(name, modules.get(name)) for name in FOCUS_MODULES])
+        self.print_modules(f"Top {len(ranked)} by {options['sort']} time", ranked)
+
+        self.stdout.write('\nOwn import time by top-level package (ms):')
+        for name, ms in sorted(packages.items(), key=lambda item: -item[1])[:15]:
+            self.stdout.write(f'  {name:<24}{ms:>10.1f}')
+
+        total = sum(times['self_ms'] for times in modules.values())
+        self.stdout.write(self.style.SUCCESS(
+            f'\n{len(modules)} modules imported in {total:.1f} ms of a {phases["total"]:.1f} ms boot'
+        ))
+
+        if options['output']:
+            with open(options['output'], 'w') as f:
+                json.dump({'phases': phases, 'modules': modules, 'packages': dict(packages)}, f, indent=2)
+            self.stdout.write(self.style.SUCCESS(f"Results written to {options['output']}"))
+
+    def print_modules(self, title, rows):
+        self.stdout.write(f"\n{title}:\n  {'module':<48}{'self ms':>10}{'cumul. ms':>11}")
+        for name, times in rows:
+            if times is None:
+                self.stdout.write(f"  {name:<48}{'not imported':>21}")
+            else:
+                self.stdout.write(f"  {name:<48}{times['self_ms']:>10.1f}{times['cumulative_ms']:>11.1f}")
@@ -0,0 +1,151 @@
+import json
+import tempfile
+from pathlib import Path
+from urllib.parse import urlsplit
+
+from django.conf import settings
+from django.contrib.auth.hashers import make_password
+from django.core.management.base import BaseCommand, CommandError
+
+from polls import caching, loadtest
+from polls.datagen import DEFAULT_PASSWORD
+from polls.models import User
+
+
+class Command(BaseCommand):
+    help = (
+        'Runs simulated users (one process each) through login, home, vote and '
+        'leaderboard journeys against a locally launched server or --url, and '
+        'reports throughput, error rates and latency percentiles'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--users', type=int, default=10, help='Simulated users, one process each')
+        parser.add_argument('--duration', type=float, default=30.0, help='Seconds each user keeps going')
+        parser.add_argument(
+            '--mix', default=loadtest.DEFAULT_MIX,
+            help=f"Journey weights, e.g. '{loadtest.DEFAULT_MIX}'"
+        )
+        parser.add_argument(
+            '--think-time', type=float, default=0.0,
+            help='Mean pause in seconds between journeys (0 for closed-loop maximum load)'
+        )
+        parser.add_argument('--seed', type=int, default=42)
+        parser.add_argument(
+            '--url',
+            help='Server to load, e.g. http://127.0.0.1:8000 (default: launch one locally)'
+        )
+        parser.add_argument(
+            '--server', choices=['gunicorn', 'uvicorn', 'runserver'], default='gunicorn',
+            help='Server to launch when no --url is given'
+        )
+        parser.add_argument('--workers', type=int, default=4, help='Worker processes of the launched server')
+        parser.add_argument('--threads', type=int, default=1, help='Threads per gunicorn worker')
+        parser.add_argument('--port', type=int, help='Port of the launched server (default: any free one)')
+        parser.add_argument(
+            '--user-prefix', default='loadtest_',
+            help='Accounts <prefix>0..N-1 are created as needed, with the datagen password'
+        )
+        parser.add_argument('--output', help='Also write the results to this JSON file')
+
+    def handle(self, *args, **options):
+        try:
+            weights = loadtest.parse_mix(options['mix'])
+        except ValueError as e:
+            raise CommandError(str(e))
+        if options['users'] < 1:
+            raise CommandError('--users must be at least 1')
+
+        credentials = self.ensure_users(options['users'], options['user_prefix'])
+
+        process = log_path = None
+        if options['url']:
+            parts = urlsplit(options['url'])
+            if parts.scheme != 'http' or not parts.hostname:
+                raise CommandError('--url must be a plain http:// address')
+            host, port = parts.hostname, parts.port or 80
+        else:
+            if options['server'] != 'runserver' and options['workers'] > 1 and not caching.is_shared():
+                self.stderr.write(
+                    f"Starting 1 worker instead of {options['workers']}: several workers need "
+                    'a shared cache (CACHE_BACKEND, CACHE_LOCATION); see README'
+                )
+                options['workers'] = 1
+            host, port = '127.0.0.1', options['port'] or loadtest.free_port()
+            log_path = Path(tempfile.mkstemp(prefix='load_test_', suffix='.log')[1])
+            self.stdout.write(
+                f"Starting {options['server']} on {host}:{port} "
+                f"({options['workers']} workers), output in {log_path}"
+            )
+            try:
+                process = loadtest.start_server(
+                    options['server'], port, options['workers'], options['threads'],
+                    Path(settings.BASE_DIR), log_path,
+                )
+            except RuntimeError as e:
+                raise CommandError(str(e))
+
+        self.stdout.write(
+            f"Running {len(credentials)} users for {options['duration']:.0f}s against "
+            f"{host}:{port}, mix {weights}"
+        )
+        try:
+            samples, elapsed = loadtest.run(
+                host, port, credentials, weights, options['duration'],
+                options['think_time'], options['seed'],
+            )
+        finally:
+            if process is not None:
+                loadtest.stop_server(process)
+
+        results = loadtest.summarize(samples, elapsed)
+        if log_path is not None:
+            results['server_log'] = str(log_path)
+            results['locked_in_server_log'] = loadtest.count_in_log(log_path)
+        self.print_results(results)
+
+        if options['output']:
+            Path(options['output']).write_text(json.dumps(results, indent=2, sort_keys=True))
+            self.stdout.write(self.style.SUCCESS(f"Results written to {options['output']}"))
+
+    def ensure_users(self, count, prefix):
+        usernames = [f'{prefix}{i}' for i in range(count)]
+        existing = set(User.objects.filter(username__in=usernames).values_list('username', flat=True))
+        missing = [username for username in usernames if username not in existing]
+        if missing:
+            password_hash = make_password(DEFAULT_PASSWORD)
+            User.objects.bulk_create(
+                [User(username=username, password=password_hash) for username in missing],
+                batch_size=500,
+            )
+            self.stdout.write(f'Created {len(missing)} load-test users')
+        return [(username, DEFAULT_PASSWORD) for username in usernames]
+
+    def print_results(self, results):
+        self.stdout.write(
+            f"\n{'step':<14}{'requests':>10}{'req/s':>9}{'errors':>8}{'err %':>8}"
+            f"{'p50 ms':>10}{'p95 ms':>10}{'p99 ms':>10}{'max ms':>10}"
+        )
+        rows = list(results['steps'].items()) + [('total', results['total'])]
+        for name, r in rows:
+            self.stdout.write(
+                f"{name:<14}{r['requests']:>10}{r['throughput_rps']:>9.1f}{r['errors']:>8}"
+                f"{r['error_rate'] * 100:>8.2f}{r['p50_ms']:>10.2f}{r['p95_ms']:>10.2f}"
+                f"{r['p99_ms']:>10.2f}{r['max_ms']:>10.2f}"
+            )
+
+        kinds = results['total']['error_kinds']
+        if kinds:
+            self.stdout.write('\nErrors:')
+            for kind, count in kinds.items():
+                self.stdout.write(f'  {count:>6}  {kind}')
+        if 'locked_in_server_log' in results:
+            self.stdout.write(
+                f"\n'database is locked' in server output: {results['locked_in_server_log']}"
+            )
+
+        style = self.style.SUCCESS if not results['total']['errors'] else self.style.WARNING
+        self.stdout.write(style(
+            f"\n{results['total']['requests']} requests in {results['elapsed_seconds']:.1f}s, "
+            f"{results['total']['errors']} errors"
+        ))
@@ -0,0 +1,38 @@
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+
+from polls import purge
+
+
+class Command(BaseCommand):
+    help = (
+        'Deletes users (with their questions and answers) or questions in chunked '
+        'raw DELETEs, keeping vote rollups, trending scores and archive tallies correct'
+    )
+
+    def add_arguments(self, parser):
+        target = parser.add_mutually_exclusive_group(required=True)
+        target.add_argument('--user', type=int, nargs='+', dest='user_ids', help='User ids to delete')
+        target.add_argument('--question', type=int, nargs='+', dest='question_ids', help='Question ids to delete')
+        parser.add_argument(
+            '--chunk-size', type=int, default=purge.CHUNK_SIZE,
+            help='Rows deleted per transaction'
+        )
+
+    def handle(self, *args, **options):
+        if options['chunk_size'] < 1:
+            raise CommandError('--chunk-size must be at least 1')
+        started = time.perf_counter()
+        log = lambda message: self.stdout.write(message)
+        if options['user_ids']:
+            summary = purge.purge_users(options['user_ids'], options['chunk_size'], log)
+            message = (
+                f"Deleted {len(options['user_ids'])} user(s), {summary.get('questions', 0)} questions "
+                f"and {summary.get('answers', 0) + summary.get('answers_on_questions', 0)} answers"
+            )
+        else:
+            summary = purge.purge_questions(options['question_ids'], options['chunk_size'], log)
+            message = f"Deleted {summary['questions']} question(s) and {summary['answers']} answers"
+        elapsed = time.perf_counter() - started
+        self.stdout.write(self.style.SUCCESS(f'{message} in {elapsed:.1f}s'))
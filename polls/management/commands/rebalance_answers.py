@@ -0,0 +1,64 @@
+import time
+
+from django.conf import settings
+from django.core.management import call_command
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connections
+
+from polls import purge, sharding
+from polls.models import Answer
+
+
+class Command(BaseCommand):
+    help = (
+        'Creates the answer table on every shard in ANSWER_SHARDS and moves each '
+        'answer to the shard its question hashes to (off the default database at '
+        'first, onto new shards after adding some)'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--chunk-size', type=int, default=sharding.CHUNK_SIZE,
+            help='Rows moved per transaction'
+        )
+        parser.add_argument('--dry-run', action='store_true', help='Only count the answers that would move')
+
+    def handle(self, *args, **options):
+        if not sharding.enabled():
+            raise CommandError('Sharding is off; set ANSWER_SHARDS to the number of shards first')
+        if options['chunk_size'] < 1:
+            raise CommandError('--chunk-size must be at least 1')
+        started = time.perf_counter()
+
+        if not options['dry_run']:
+            settings.ANSWER_SHARD_DIR.mkdir(parents=True, exist_ok=True)
+            for index, alias in enumerate(settings.ANSWER_SHARD_ALIASES):
+                call_command('migrate', 'polls', database=alias, verbosity=0)
+                sharding.seed_id_sequence(alias, index)
+            self.stdout.write(f'{len(settings.ANSWER_SHARD_ALIASES)} shards ready')
+
+        moved = sharding.rebalance(
+            options['chunk_size'], options['dry_run'], log=lambda message: self.stdout.write(message)
+        )
+        for (source, target), n in sorted(moved.items()):
+            self.stdout.write(f'  {source} -> {target}: {n}')
+
+        if not options['dry_run']:
+            self.stdout.write('Answers per database:')
+            for alias in ['default', *settings.ANSWER_SHARD_ALIASES]:
+                self.stdout.write(f'  {alias}: {Answer.objects.using(alias).count()}')
+            connections.close_all()
+            if moved:
+                # Moved answers keep their ids, which the indexes' per-database
+                # watermarks can't follow, so they are rebuilt from scratch
+                purge.queue_index_rebuilds()
+                self.stdout.write(
+                    'Queued answer store and agreement index rebuilds; '
+                    'run build_recommendations --full as well'
+                )
+
+        elapsed = time.perf_counter() - started
+        verb = 'would move' if options['dry_run'] else 'moved'
+        self.stdout.write(self.style.SUCCESS(
+            f'{sum(moved.values())} answers {verb} in {elapsed:.1f}s'
+        ))
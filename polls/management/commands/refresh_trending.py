@@ -0,0 +1,30 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from polls import trending
+
+
+class Command(BaseCommand):
+    help = (
+        'Refreshes trending scores for questions that received votes since the last run. '
+        'Run from cron, or with --every to keep running'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--every', type=int, default=None, metavar='SECONDS',
+            help='Keep running, refreshing every SECONDS'
+        )
+
+    def handle(self, *args, **options):
+        while True:
+            started = time.perf_counter()
+            refreshed = trending.update()
+            elapsed = time.perf_counter() - started
+            self.stdout.write(self.style.SUCCESS(
+                f'Refreshed {refreshed} trending scores in {elapsed:.2f}s'
+            ))
+            if not options['every']:
+                return
+            time.sleep(max(0, options['every'] - elapsed))
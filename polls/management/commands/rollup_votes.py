@@ -0,0 +1,17 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from polls import rollups
+
+
+class Command(BaseCommand):
+    help = 'Adds answers since the last run to the hourly and daily vote rollups (run from cron)'
+
+    def handle(self, *args, **options):
+        started = time.perf_counter()
+        processed = rollups.update()
+        elapsed = time.perf_counter() - started
+        self.stdout.write(self.style.SUCCESS(
+            f'Rolled up {processed} answers in {elapsed:.1f}s'
+        ))
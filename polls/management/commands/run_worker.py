@@ -0,0 +1,84 @@
+import multiprocessing
+import signal
+import threading
+import time
+
+from django import db
+from django.core.management.base import BaseCommand
+
+from polls.tasks import Worker
+
+
+def run_process(options, stop_event):
+    # Children get their own database connections; the parent handles signals
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    Worker(
+        batch_size=options['batch_size'],
+        poll_interval=options['poll_interval'],
+        burst=options['burst'],
+        stop_event=stop_event,
+    ).run()
+
+
+class Command(BaseCommand):
+    help = 'Runs queued background tasks (see polls/tasks.py) with a pool of threads or processes'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--concurrency', type=int, default=2, help='Number of workers')
+        parser.add_argument(
+            '--processes', action='store_true',
+            help='Run workers as processes instead of threads (for CPU-bound tasks)'
+        )
+        parser.add_argument('--batch-size', type=int, default=10, help='Tasks claimed per dequeue')
+        parser.add_argument(
+            '--poll-interval', type=float, default=1.0,
+            help='Seconds to wait when the queue is empty'
+        )
+        parser.add_argument(
+            '--burst', action='store_true',
+            help='Exit once no tasks are due instead of waiting for more'
+        )
+
+    def handle(self, *args, **options):
+        started = time.perf_counter()
+        if options['processes']:
+            stop_event = multiprocessing.Event()
+            # Don't share the parent's database connection with forked children
+            db.connections.close_all()
+            workers = [
+                multiprocessing.Process(target=run_process, args=(options, stop_event), daemon=True)
+                for _ in range(options['concurrency'])
+            ]
+        else:
+            stop_event = threading.Event()
+            workers = [
+                threading.Thread(
+                    target=Worker(
+                        batch_size=options['batch_size'],
+                        poll_interval=options['poll_interval'],
+                        burst=options['burst'],
+                        stop_event=stop_event,
+                    ).run,
+                    daemon=True,
+                )
+                for _ in range(options['concurrency'])
+            ]
+
+        def stop(signum, frame):
+            self.stdout.write('Stopping after the current tasks...')
+            stop_event.set()
+
+        signal.signal(signal.SIGINT, stop)
+        signal.signal(signal.SIGTERM, stop)
+
+        mode = 'processes' if options['processes'] else 'threads'
+        self.stdout.write(f"Starting {options['concurrency']} worker {mode}")
+        for worker in workers:
+            worker.start()
+        for worker in workers:
+            # Short joins keep the main thread responsive to signals
+            while worker.is_alive():
+                worker.join(0.5)
+
+        elapsed = time.perf_counter() - started
+        self.stdout.write(self.style.SUCCESS(f'Workers stopped after {elapsed:.1f}s'))
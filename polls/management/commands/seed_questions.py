@@ -62,25 +62,25 @@ class Command(BaseCommand):
             call_command('create_initial_users')
             users = list(User.objects.all())
 
+        # Look up which sample questions already exist in a single query
+        existing = set(
+            Question.objects.filter(
+                option_one_text__in=[q['option_one'] for q in sample_questions]
+            ).values_list('option_one_text', 'option_two_text')
+        )
+
         # Create questions
-        created_count = 0
+        new_questions = []
         for idx, q_data in enumerate(sample_questions):
             # Rotate through users
             author = users[idx % len(users)]
             
-            # Check if question already exists
-            existing = Question.objects.filter(
-                option_one_text=q_data['option_one'],
-                option_two_text=q_data['option_two']
-            ).exists()
-            
-            if not existing:
-                Question.objects.create(
+            if (q_data['option_one'], q_data['option_two']) not in existing:
+                new_questions.append(Question(
                     author=author,
                     option_one_text=q_data['option_one'],
                     option_two_text=q_data['option_two']
-                )
-                created_count += 1
+                ))
                 self.stdout.write(
                     self.style.SUCCESS(
                         f'Created question: {q_data["option_one"]} or {q_data["option_two"]}'
@@ -93,6 +93,9 @@ class Command(BaseCommand):
                     )
                 )
 
+        Question.objects.bulk_create(new_questions)
+        created_count = len(new_questions)
+
         self.stdout.write(
             self.style.SUCCESS(f'\nSuccessfully created {created_count} questions!')
         )
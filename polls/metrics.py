@@ -0,0 +1,274 @@
+import atexit
+import fcntl
+import glob
+import json
+import math
+import os
+import tempfile
+import threading
+import time
+
+from django.conf import settings
+
+
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, math.inf)
+
+# Totals of exited workers, in the multiprocess directory next to the live ones
+DEAD_FILE = 'metrics-dead.json'
+
+
+class Metric:
+    """Base class for a named metric with a fixed set of label names"""
+
+    type = None
+
+    def __init__(self, registry, name, documentation, labels=()):
+        self.registry = registry
+        self.name = name
+        self.documentation = documentation
+        self.label_names = tuple(labels)
+        self.values = {}
+
+    def _key(self, labels):
+        if set(labels) != set(self.label_names):
+            raise ValueError(f'{self.name} expects labels {self.label_names}, got {tuple(labels)}')
+        return tuple(str(labels[name]) for name in self.label_names)
+
+
+class Counter(Metric):
+    type = 'counter'
+
+    def inc(self, amount=1, **labels):
+        key = self._key(labels)
+        with self.registry.lock:
+            self.values[key] = self.values.get(key, 0) + amount
+        self.registry.maybe_flush()
+
+    def merge(self, target, snapshot):
+        for key, value in snapshot.items():
+            target[key] = target.get(key, 0) + value
+
+    def samples(self, values):
+        for key, value in sorted(values.items()):
+            yield self.name, self.label_names, key, value
+
+
+class Histogram(Metric):
+    type = 'histogram'
+
+    def __init__(self, registry, name, documentation, labels=(), buckets=DEFAULT_BUCKETS):
+        super().__init__(registry, name, documentation, labels)
+        self.buckets = tuple(buckets)
+
+    def observe(self, value, **labels):
+        key = self._key(labels)
+        with self.registry.lock:
+            # [per-bucket counts..., sum, count]
+            state = self.values.get(key)
+            if state is None:
+                state = self.values[key] = [0] * len(self.buckets) + [0.0, 0]
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    state[i] += 1
+                    break
+            state[-2] += value
+            state[-1] += 1
+        self.registry.maybe_flush()
+
+    def merge(self, target, snapshot):
+        for key, state in snapshot.items():
+            current = target.get(key)
+            if current is None:
+                target[key] = list(state)
+            else:
+                target[key] = [a + b for a, b in zip(current, state)]
+
+    def samples(self, values):
+        label_names = self.label_names + ('le',)
+        for key, state in sorted(values.items()):
+            cumulative = 0
+            for bound, count in zip(self.buckets, state):
+                cumulative += count
+                le = '+Inf' if bound == math.inf else repr(float(bound))
+                yield f'{self.name}_bucket', label_names, key + (le,), cumulative
+            yield f'{self.name}_sum', self.label_names, key, state[-2]
+            yield f'{self.name}_count', self.label_names, key, state[-1]
+
+
+class Registry:
+    """
+    In-process metric registry. With METRICS_MULTIPROC_DIR set, each worker
+    periodically writes its values to a per-process file and a scrape sums
+    the files of every worker, so any gunicorn worker can answer /metrics/.
+    """
+
+    def __init__(self):
+        self.metrics = {}
+        self.lock = threading.Lock()
+        self.last_flush = 0.0
+        self.flushed_pid = None
+
+    @property
+    def multiproc_dir(self):
+        return settings.METRICS_MULTIPROC_DIR
+
+    def counter(self, name, documentation, labels=()):
+        return self._register(Counter(self, name, documentation, labels))
+
+    def histogram(self, name, documentation, labels=(), buckets=DEFAULT_BUCKETS):
+        return self._register(Histogram(self, name, documentation, labels, buckets))
+
+    def _register(self, metric):
+        if metric.name in self.metrics:
+            raise ValueError(f'Metric {metric.name} is already registered')
+        self.metrics[metric.name] = metric
+        return metric
+
+    def snapshot(self):
+        with self.lock:
+            return {
+                name: {json.dumps(key): value for key, value in metric.values.items()}
+                for name, metric in self.metrics.items()
+            }
+
+    def maybe_flush(self):
+        if self.multiproc_dir and time.monotonic() - self.last_flush >= settings.METRICS_FLUSH_INTERVAL:
+            self.flush()
+
+    def flush(self):
+        """Atomically write this process's values to the shared directory"""
+        directory = self.multiproc_dir
+        if not directory:
+            return
+        os.makedirs(directory, exist_ok=True)
+        if self.flushed_pid != os.getpid():
+            # A file under our pid is left from an earlier process that
+            # wasn't cleaned up; keep its totals rather than overwrite them
+            mark_process_dead(os.getpid(), directory)
+            self.flushed_pid = os.getpid()
+        self.last_flush = time.monotonic()
+        write_json(os.path.join(directory, f'metrics-{os.getpid()}.json'), self.snapshot())
+
+    def collect(self):
+        """Values for every metric, summed across processes when multiprocess mode is on"""
+        if not self.multiproc_dir:
+            snapshots = [self.snapshot()]
+        else:
+            self.flush()
+            snapshots = []
+            # Exited workers' values live on in DEAD_FILE, so counters never go backwards
+            for path in glob.glob(os.path.join(self.multiproc_dir, 'metrics-*.json')):
+                try:
+                    with open(path) as f:
+                        snapshots.append(json.load(f))
+                except (OSError, ValueError):
+                    continue
+
+        merged = {name: {} for name in self.metrics}
+        for snapshot in snapshots:
+            for name, values in snapshot.items():
+                metric = self.metrics.get(name)
+                if metric is not None:
+                    metric.merge(merged[name], {tuple(json.loads(k)): v for k, v in values.items()})
+        return merged
+
+    def render(self):
+        """Prometheus text exposition format"""
+        lines = []
+        for name, values in self.collect().items():
+            metric = self.metrics[name]
+            lines.append(f'# HELP {name} {metric.documentation}')
+            lines.append(f'# TYPE {name} {metric.type}')
+            for sample_name, label_names, key, value in metric.samples(values):
+                if label_names:
+                    labels = ','.join(
+                        f'{label}="{escape_label(v)}"' for label, v in zip(label_names, key)
+                    )
+                    lines.append(f'{sample_name}{{{labels}}} {format_value(value)}')
+                else:
+                    lines.append(f'{sample_name} {format_value(value)}')
+        return '\n'.join(lines) + '\n'
+
+
+def write_json(path, data):
+    fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(path), suffix='.tmp')
+    with os.fdopen(fd, 'w') as f:
+        json.dump(data, f)
+    os.replace(tmp_path, path)
+
+
+def merge_snapshot(target, snapshot):
+    """Add one process's values to another's: counters add, histogram states add elementwise"""
+    for name, values in snapshot.items():
+        merged = target.setdefault(name, {})
+        for key, value in values.items():
+            current = merged.get(key)
+            if current is None:
+                merged[key] = value
+            elif isinstance(value, list):
+                merged[key] = [a + b for a, b in zip(current, value)]
+            else:
+                merged[key] = current + value
+
+
+def mark_process_dead(pid, directory=None):
+    """
+    Fold an exited worker's file into DEAD_FILE and delete it, so files
+    don't pile up as workers are replaced and a new worker reusing the pid
+    starts from zero (gunicorn's child_exit hook). Works on the JSON alone,
+    so the gunicorn master needn't have Django set up.
+    """
+    directory = directory or settings.METRICS_MULTIPROC_DIR
+    if not directory:
+        return
+    path = os.path.join(directory, f'metrics-{pid}.json')
+    if not os.path.exists(path):
+        return
+    with open(os.path.join(directory, 'metrics.lock'), 'w') as lock:
+        fcntl.flock(lock, fcntl.LOCK_EX)
+        try:
+            with open(path) as f:
+                snapshot = json.load(f)
+        except (OSError, ValueError):
+            snapshot = {}
+        dead_path = os.path.join(directory, DEAD_FILE)
+        try:
+            with open(dead_path) as f:
+                totals = json.load(f)
+        except (OSError, ValueError):
+            totals = {}
+        merge_snapshot(totals, snapshot)
+        write_json(dead_path, totals)
+        os.remove(path)
+
+
+def escape_label(value):
+    return value.replace('\\', r'\\').replace('\n', r'\n').replace('"', r'\"')
+
+
+def format_value(value):
+    if isinstance(value, float) and not value.is_integer():
+        return repr(value)
+    return str(int(value))
+
+
+registry = Registry()
+atexit.register(registry.flush)
+
+REQUEST_LATENCY = registry.histogram(
+    'wyr_request_duration_seconds', 'Request latency by URL name', labels=('view',)
+)
+DB_QUERIES = registry.counter(
+    'wyr_db_queries_total', 'Database queries executed, by URL name', labels=('view',)
+)
+VOTES = registry.counter('wyr_votes_total', 'Answers submitted')
+SIGNUPS = registry.counter('wyr_signups_total', 'Accounts created')
+LOGINS = registry.counter('wyr_logins_total', 'Successful logins')
+QUESTIONS_CREATED = registry.counter('wyr_questions_created_total', 'Questions created')
+CACHE_REQUESTS = registry.counter(
+    'wyr_cache_requests_total', 'Cache lookups by cache name and result', labels=('cache', 'result')
+)
+
+
+def record_cache(cache_name, hit):
+    CACHE_REQUESTS.inc(cache=cache_name, result='hit' if hit else 'miss')
@@ -1,7 +1,21 @@
+import json
+import logging
+import random
+import time
+from contextlib import ExitStack
+
+from django.conf import settings
+from django.core.exceptions import MiddlewareNotUsed
+from django.db import connections
 from django.shortcuts import redirect
 from django.urls import reverse
 from django.contrib import messages
 
+from . import metrics, profiling
+from .instrumentation import measure
+
+logger = logging.getLogger('polls.instrumentation')
+
 
 class AuthenticationMiddleware:
     """
@@ -62,4 +76,193 @@ class LoginRequiredMiddleware:
             return redirect(f"{reverse('login')}?next={path}")
         
         response = self.get_response(request)
-        return response
\ No newline at end of file
+        return response
+
+
+class QueryInstrumentationMiddleware:
+    """
+    Opt-in per-request instrumentation: query count, database time,
+    duplicate (N+1) queries, slow queries and template render time.
+    Results go out as a Server-Timing header and a JSON log line.
+    Removed from the stack entirely unless REQUEST_INSTRUMENTATION is on.
+    """
+    
+    def __init__(self, get_response):
+        if not settings.REQUEST_INSTRUMENTATION:
+            raise MiddlewareNotUsed
+        self.get_response = get_response
+        self.sample_rate = settings.REQUEST_INSTRUMENTATION_SAMPLE_RATE
+        self.slow_query_ms = settings.SLOW_QUERY_MS
+        self.duplicate_threshold = settings.DUPLICATE_QUERY_THRESHOLD
+    
+    def __call__(self, request):
+        if self.sample_rate < 1 and random.random() >= self.sample_rate:
+            return self.get_response(request)
+        
+        with measure(slow_query_ms=self.slow_query_ms) as stats:
+            response = self.get_response(request)
+        
+        # Headers go out before a streamed body is produced, so for streams
+        # Server-Timing covers the view and the log line covers everything
+        response['Server-Timing'] = self.server_timing(stats)
+        if response.streaming and not response.is_async:
+            response.streaming_content = self.stream(request, response, stats, response.streaming_content)
+        else:
+            self.log(request, response, stats)
+        return response
+    
+    def stream(self, request, response, stats, content):
+        """Measure each chunk of the body into the same stats; log when it's done"""
+        chunks = iter(content)
+        try:
+            while True:
+                with measure(stats=stats):
+                    chunk = next(chunks, None)
+                if chunk is None:
+                    return
+                yield chunk
+        finally:
+            self.log(request, response, stats)
+    
+    @staticmethod
+    def server_timing(stats):
+        return (
+            f'db;dur={stats.db_time * 1000:.1f};desc="{stats.query_count} queries", '
+            f'render;dur={stats.render_time * 1000:.1f}, total;dur={stats.total_time * 1000:.1f}'
+        )
+    
+    def log(self, request, response, stats):
+        match = request.resolver_match
+        duplicates = [
+            {'sql': sql[:300], 'count': n}
+            for sql, n in stats.duplicate_queries
+            if n >= self.duplicate_threshold
+        ]
+        record = {
+            'event': 'request',
+            'method': request.method,
+            'path': request.path,
+            'view': match.view_name if match else None,
+            'status': response.status_code,
+            'streaming': response.streaming,
+            'queries': stats.query_count,
+            'db_ms': round(stats.db_time * 1000, 2),
+            'render_ms': round(stats.render_time * 1000, 2),
+            'total_ms': round(stats.total_time * 1000, 2),
+        }
+        if duplicates:
+            record['duplicate_queries'] = duplicates
+        if stats.slow_queries:
+            record['slow_queries'] = [
+                {'sql': sql[:300], 'ms': round(elapsed * 1000, 2)}
+                for elapsed, sql in stats.slow_queries
+            ]
+        
+        level = logging.WARNING if duplicates or stats.slow_queries else logging.INFO
+        logger.log(level, json.dumps(record))
+
+
+
+class MetricsMiddleware:
+    """
+    Records request latency and database query counts per URL name
+    into the metrics registry served at /metrics/.
+    """
+    
+    def __init__(self, get_response):
+        if not settings.METRICS_ENABLED:
+            raise MiddlewareNotUsed
+        self.get_response = get_response
+    
+    def __call__(self, request):
+        queries = [0]
+        start = time.perf_counter()
+        with self.count_queries(queries):
+            response = self.get_response(request)
+        
+        # A streamed body runs after the view returns; record once it's done
+        if response.streaming and not response.is_async:
+            response.streaming_content = self.stream(request, response.streaming_content, queries, start)
+        else:
+            self.record(request, queries[0], start)
+        return response
+    
+    @staticmethod
+    def count_queries(queries):
+        """Adds the queries run on any connection to queries[0] while active"""
+        def count_query(execute, sql, params, many, context):
+            queries[0] += 1
+            return execute(sql, params, many, context)
+        
+        stack = ExitStack()
+        for alias in connections:
+            stack.enter_context(connections[alias].execute_wrapper(count_query))
+        return stack
+    
+    def stream(self, request, content, queries, start):
+        chunks = iter(content)
+        try:
+            while True:
+                with self.count_queries(queries):
+                    chunk = next(chunks, None)
+                if chunk is None:
+                    return
+                yield chunk
+        finally:
+            self.record(request, queries[0], start)
+    
+    @staticmethod
+    def record(request, queries, start):
+        elapsed = time.perf_counter() - start
+        match = request.resolver_match
+        view = match.view_name if match else 'unmatched'
+        metrics.REQUEST_LATENCY.observe(elapsed, view=view)
+        if queries:
+            metrics.DB_QUERIES.inc(queries, view=view)
+
+
+class ProfilingMiddleware:
+    """
+    Staff-only on-demand profiling: a request with "X-Profile: 1" or
+    ?profile=1 from a staff user runs under the sampling profiler in
+    polls/profiling.py, within PROFILE_RATE_LIMIT per minute. The saved
+    profile is linked from the X-Profile-Url response header. Must come
+    after AuthenticationMiddleware.
+    """
+    
+    def __init__(self, get_response):
+        if not settings.PROFILING_ENABLED:
+            raise MiddlewareNotUsed
+        self.get_response = get_response
+    
+    def __call__(self, request):
+        if not profiling.requested(request) or not request.user.is_staff:
+            return self.get_response(request)
+        if not profiling.allow():
+            response = self.get_response(request)
+            response['X-Profile'] = 'rate-limited'
+            return response
+        
+        profile = profiling.Profile(request)
+        with profile.collect():
+            response = self.get_response(request)
+        
+        match = request.resolver_match
+        profile.view = match.view_name if match else None
+        profile.status = response.status_code
+        response['X-Profile-Id'] = profile.id
+        response['X-Profile-Url'] = reverse('profile_detail', args=[profile.id])
+        
+        if response.streaming:
+            # The body is produced while it is sent; profile that part too
+            response.streaming_content = self.stream(profile, response.streaming_content)
+        else:
+            profile.save()
+        return response
+    
+    def stream(self, profile, content):
+        try:
+            with profile.collect():
+                yield from content
+        finally:
+            profile.save()
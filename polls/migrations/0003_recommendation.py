@@ -0,0 +1,30 @@
+# Generated by Django 6.0.1 on 2026-10-19 00:58
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('polls', '0002_alter_user_options_user_bio_alter_user_username'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='Recommendation',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('score', models.FloatField()),
+                ('rank', models.PositiveSmallIntegerField()),
+                ('question', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='+', to='polls.question')),
+                ('user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='recommendations', to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'ordering': ['user', 'rank'],
+                'indexes': [models.Index(fields=['user', 'rank'], name='polls_recom_user_id_10422c_idx')],
+                'unique_together': {('user', 'question')},
+            },
+        ),
+    ]
@@ -0,0 +1,85 @@
+# Generated by Django 6.0.1 on 2026-10-19 01:20
+
+from django.db import migrations
+
+
+SQLITE_FORWARD = [
+    """
+    CREATE VIRTUAL TABLE polls_question_fts USING fts5(
+        option_one_text,
+        option_two_text,
+        content='polls_question',
+        content_rowid='id',
+        tokenize='unicode61 remove_diacritics 2',
+        prefix='2 3 4'
+    )
+    """,
+    """
+    CREATE TRIGGER polls_question_fts_insert AFTER INSERT ON polls_question BEGIN
+        INSERT INTO polls_question_fts(rowid, option_one_text, option_two_text)
+        VALUES (new.id, new.option_one_text, new.option_two_text);
+    END
+    """,
+    """
+    CREATE TRIGGER polls_question_fts_delete AFTER DELETE ON polls_question BEGIN
+        INSERT INTO polls_question_fts(polls_question_fts, rowid, option_one_text, option_two_text)
+        VALUES ('delete', old.id, old.option_one_text, old.option_two_text);
+    END
+    """,
+    """
+    CREATE TRIGGER polls_question_fts_update AFTER UPDATE OF option_one_text, option_two_text ON polls_question BEGIN
+        INSERT INTO polls_question_fts(polls_question_fts, rowid, option_one_text, option_two_text)
+        VALUES ('delete', old.id, old.option_one_text, old.option_two_text);
+        INSERT INTO polls_question_fts(rowid, option_one_text, option_two_text)
+        VALUES (new.id, new.option_one_text, new.option_two_text);
+    END
+    """,
+    "INSERT INTO polls_question_fts(polls_question_fts) VALUES ('rebuild')",
+]
+
+SQLITE_REVERSE = [
+    "DROP TRIGGER IF EXISTS polls_question_fts_update",
+    "DROP TRIGGER IF EXISTS polls_question_fts_delete",
+    "DROP TRIGGER IF EXISTS polls_question_fts_insert",
+    "DROP TABLE IF EXISTS polls_question_fts",
+]
+
+POSTGRESQL_FORWARD = [
+    """
+    ALTER TABLE polls_question ADD COLUMN search_vector tsvector
+    GENERATED ALWAYS AS (
+        setweight(to_tsvector('simple', coalesce(option_one_text, '')), 'A') ||
+        setweight(to_tsvector('simple', coalesce(option_two_text, '')), 'A')
+    ) STORED
+    """,
+    "CREATE INDEX polls_question_search_idx ON polls_question USING GIN (search_vector)",
+]
+
+POSTGRESQL_REVERSE = [
+    "DROP INDEX IF EXISTS polls_question_search_idx",
+    "ALTER TABLE polls_question DROP COLUMN IF EXISTS search_vector",
+]
+
+
+def run_statements(statements):
+    def run(apps, schema_editor):
+        vendor_statements = statements.get(schema_editor.connection.vendor, [])
+        for sql in vendor_statements:
+            schema_editor.execute(sql)
+    return run
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('polls', '0003_recommendation'),
+    ]
+
+    operations = [
+        # The search index lives outside the ORM: an FTS5 table kept in sync by
+        # triggers on SQLite, a generated tsvector column on PostgreSQL.
+        migrations.RunPython(
+            run_statements({'sqlite': SQLITE_FORWARD, 'postgresql': POSTGRESQL_FORWARD}),
+            run_statements({'sqlite': SQLITE_REVERSE, 'postgresql': POSTGRESQL_REVERSE}),
+        ),
+    ]
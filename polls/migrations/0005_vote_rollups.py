@@ -0,0 +1,50 @@
+# Generated by Django 6.0.1 on 2026-10-19 01:04
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('polls', '0004_question_search_index'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='VoteRollup',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('option_selected', models.CharField(choices=[('optionOne', 'Option One'), ('optionTwo', 'Option Two')], max_length=10)),
+                ('granularity', models.CharField(choices=[('hour', 'Hourly'), ('day', 'Daily')], max_length=4)),
+                ('bucket', models.DateTimeField()),
+                ('count', models.PositiveIntegerField(default=0)),
+            ],
+            options={
+                'ordering': ['question', 'granularity', 'bucket'],
+            },
+        ),
+        migrations.CreateModel(
+            name='Watermark',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('name', models.CharField(max_length=50, unique=True)),
+                ('answered_at', models.DateTimeField(blank=True, null=True)),
+                ('answer_id', models.BigIntegerField(default=0)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+            ],
+        ),
+        migrations.AddIndex(
+            model_name='answer',
+            index=models.Index(fields=['answered_at', 'id'], name='polls_answe_answere_3bb5c9_idx'),
+        ),
+        migrations.AddField(
+            model_name='voterollup',
+            name='question',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='vote_rollups', to='polls.question'),
+        ),
+        migrations.AlterUniqueTogether(
+            name='voterollup',
+            unique_together={('question', 'granularity', 'bucket', 'option_selected')},
+        ),
+    ]
@@ -0,0 +1,27 @@
+# Generated by Django 6.0.1 on 2026-10-19 01:30
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('polls', '0005_vote_rollups'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='TrendingScore',
+            fields=[
+                ('question', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='trending_score', serialize=False, to='polls.question')),
+                ('hotness', models.FloatField()),
+                ('votes', models.PositiveIntegerField(default=0)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+            ],
+            options={
+                'ordering': ['-hotness'],
+                'indexes': [models.Index(fields=['-hotness'], name='polls_trend_hotness_bfc1b7_idx')],
+            },
+        ),
+    ]
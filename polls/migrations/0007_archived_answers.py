@@ -0,0 +1,63 @@
+# Generated by Django 6.0.1 on 2026-10-19 01:45
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+from polls.search_sql import SQLITE_TRIGGER_NAMES, SQLITE_TRIGGERS
+
+
+def reinstall_search_triggers(apps, schema_editor):
+    """Adding NOT NULL columns rebuilds polls_question on SQLite, dropping its FTS triggers"""
+    if schema_editor.connection.vendor != 'sqlite':
+        return
+    for name in SQLITE_TRIGGER_NAMES:
+        schema_editor.execute(f'DROP TRIGGER IF EXISTS {name}')
+    for sql in SQLITE_TRIGGERS:
+        schema_editor.execute(sql)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('polls', '0006_trendingscore'),
+    ]
+
+    operations = [
+        # Runs last when migrating backwards, after the columns are dropped again
+        migrations.RunPython(migrations.RunPython.noop, reinstall_search_triggers),
+        migrations.AddField(
+            model_name='question',
+            name='archived_at',
+            field=models.DateTimeField(blank=True, editable=False, null=True),
+        ),
+        migrations.AddField(
+            model_name='question',
+            name='archived_option_one_votes',
+            field=models.PositiveIntegerField(default=0, editable=False),
+        ),
+        migrations.AddField(
+            model_name='question',
+            name='archived_option_two_votes',
+            field=models.PositiveIntegerField(default=0, editable=False),
+        ),
+        migrations.AddField(
+            model_name='user',
+            name='archived_answers',
+            field=models.PositiveIntegerField(default=0, editable=False),
+        ),
+        migrations.CreateModel(
+            name='ArchivedAnswer',
+            fields=[
+                ('pk', models.CompositePrimaryKey('user', 'question', blank=True, editable=False, primary_key=True, serialize=False)),
+                ('option', models.PositiveSmallIntegerField(choices=[(1, 'Option One'), (2, 'Option Two')])),
+                ('answered_at', models.DateTimeField()),
+                ('question', models.ForeignKey(db_constraint=False, on_delete=django.db.models.deletion.CASCADE, related_name='archived_answers', to='polls.question')),
+                ('user', models.ForeignKey(db_constraint=False, db_index=False, on_delete=django.db.models.deletion.CASCADE, related_name='+', to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'indexes': [models.Index(fields=['answered_at'], name='polls_archi_answere_7dc5a8_idx')],
+            },
+        ),
+        migrations.RunPython(reinstall_search_triggers, migrations.RunPython.noop),
+    ]
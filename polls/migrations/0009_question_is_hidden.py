@@ -0,0 +1,26 @@
+# Generated by Django 6.0.1 on 2026-10-19 03:10
+
+import importlib
+
+from django.db import migrations, models
+
+
+archived_answers = importlib.import_module('polls.migrations.0007_archived_answers')
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('polls', '0008_task'),
+    ]
+
+    operations = [
+        # The column add rebuilds polls_question on SQLite; see 0007
+        migrations.RunPython(migrations.RunPython.noop, archived_answers.reinstall_search_triggers),
+        migrations.AddField(
+            model_name='question',
+            name='is_hidden',
+            field=models.BooleanField(default=False),
+        ),
+        migrations.RunPython(archived_answers.reinstall_search_triggers, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,17 @@
+# Generated by Django 6.0.1 on 2026-10-19 03:40
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('polls', '0009_question_is_hidden'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='question',
+            index=models.Index(fields=['is_hidden', '-created_at'], name='polls_question_feed_idx'),
+        ),
+    ]
@@ -18,6 +18,8 @@ class User(AbstractUser):
             'unique': "A user with that username already exists.",
         },
     )
+    # Answers moved to ArchivedAnswer (see polls/archive.py)
+    archived_answers = models.PositiveIntegerField(default=0, editable=False)
     
     def __str__(self):
         return self.username
@@ -28,7 +30,9 @@ class User(AbstractUser):
     
     @property
     def questions_answered(self):
-        return self.answers.count()
+        # A user's answers may be spread over shards (see polls/sharding.py)
+        from .sharding import count
+        return count(Answer.objects.filter(user=self)) + self.archived_answers
     
     @property
     def total_score(self):
@@ -45,34 +49,61 @@ class Question(models.Model):
     option_two_text = models.CharField(max_length=255)
     created_at = models.DateTimeField(default=timezone.now)
     
+    # Frozen tallies of answers moved to ArchivedAnswer (see polls/archive.py)
+    archived_at = models.DateTimeField(null=True, blank=True, editable=False)
+    archived_option_one_votes = models.PositiveIntegerField(default=0, editable=False)
+    archived_option_two_votes = models.PositiveIntegerField(default=0, editable=False)
+    
+    # Hidden by moderators: left out of listings, search, trending and the API
+    is_hidden = models.BooleanField(default=False)
+    
     class Meta:
         ordering = ['-created_at']
+        indexes = [
+            # Home feed: visible question ids newest first, read from the index alone
+            models.Index(fields=['is_hidden', '-created_at'], name='polls_question_feed_idx'),
+        ]
     
     def __str__(self):
         return f"Would you rather {self.option_one_text} or {self.option_two_text}?"
     
     @property
     def option_one_votes(self):
-        return self.answers.filter(option_selected='optionOne').count()
+        return self.answers.filter(option_selected='optionOne').count() + self.archived_option_one_votes
     
     @property
     def option_two_votes(self):
-        return self.answers.filter(option_selected='optionTwo').count()
+        return self.answers.filter(option_selected='optionTwo').count() + self.archived_option_two_votes
     
     @property
     def total_votes(self):
-        return self.answers.count()
+        return self.answers.count() + self.archived_option_one_votes + self.archived_option_two_votes
     
     def has_user_answered(self, user):
         if not user.is_authenticated:
             return False
-        return self.answers.filter(user=user).exists()
+        if self.answers.filter(user=user).exists():
+            return True
+        return self.archived_at is not None and self.archived_answers.filter(user=user).exists()
     
     def get_user_answer(self, user):
         try:
             return self.answers.get(user=user)
         except Answer.DoesNotExist:
+            pass
+        if self.archived_at is None:
             return None
+        archived = self.archived_answers.filter(user=user).first()
+        return archived.as_answer() if archived else None
+
+
+class AnswerQuerySet(models.QuerySet):
+    def create(self, **kwargs):
+        # Without using(), let the router pick the question's shard from the
+        # instance; QuerySet.create would pass the default database instead
+        answer = self.model(**kwargs)
+        answer.save(force_insert=True, using=self._db)
+        return answer
 
 
 class Answer(models.Model):
@@ -87,9 +118,178 @@ class Answer(models.Model):
     option_selected = models.CharField(max_length=10, choices=OPTION_CHOICES)
     answered_at = models.DateTimeField(default=timezone.now)
     
+    objects = AnswerQuerySet.as_manager()
+    
     class Meta:
         unique_together = ('user', 'question')
         ordering = ['-answered_at']
+        indexes = [
+            # Range scans by time for rollups and other incremental jobs
+            models.Index(fields=['answered_at', 'id']),
+        ]
+    
+    def __str__(self):
+        return f"{self.user.username} answered {self.question.id}"
+
+
+class ArchivedAnswer(models.Model):
+    """
+    Answer on an old question, moved out of the hot Answer table by
+    archive_answers. Keyed by (user, question) with no surrogate id and the
+    option stored as a small integer, so rows and indexes stay compact.
+    """
+    OPTION_ONE = 1
+    OPTION_TWO = 2
+    OPTIONS = {
+        'optionOne': OPTION_ONE,
+        'optionTwo': OPTION_TWO,
+    }
+    
+    pk = models.CompositePrimaryKey('user', 'question')
+    # The primary key already leads with user_id
+    user = models.ForeignKey(
+        User, on_delete=models.CASCADE, related_name='+', db_constraint=False, db_index=False
+    )
+    question = models.ForeignKey(
+        Question, on_delete=models.CASCADE, related_name='archived_answers', db_constraint=False
+    )
+    option = models.PositiveSmallIntegerField(choices=[(OPTION_ONE, 'Option One'), (OPTION_TWO, 'Option Two')])
+    answered_at = models.DateTimeField()
+    
+    class Meta:
+        indexes = [
+            # Day-by-day reads in backfill_rollups
+            models.Index(fields=['answered_at']),
+        ]
+    
+    def __str__(self):
+        return f"{self.user_id} answered {self.question_id} (archived)"
+    
+    @property
+    def option_selected(self):
+        return 'optionOne' if self.option == self.OPTION_ONE else 'optionTwo'
+    
+    def as_answer(self):
+        """An unsaved Answer with the same values, for code that expects one"""
+        return Answer(
+            user_id=self.user_id,
+            question_id=self.question_id,
+            option_selected=self.option_selected,
+            answered_at=self.answered_at,
+        )
+
+
+class Recommendation(models.Model):
+    """Precomputed "answer next" list per user, built by build_recommendations"""
+    user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='recommendations')
+    question = models.ForeignKey(Question, on_delete=models.CASCADE, related_name='+')
+    score = models.FloatField()
+    rank = models.PositiveSmallIntegerField()
+    
+    class Meta:
+        unique_together = ('user', 'question')
+        ordering = ['user', 'rank']
+        indexes = [
+            models.Index(fields=['user', 'rank']),
+        ]
+    
+    def __str__(self):
+        return f"#{self.rank} for {self.user_id}: question {self.question_id}"
+
+class VoteRollup(models.Model):
+    """Votes per question and option in one hour or one day, maintained by polls/rollups.py"""
+    HOUR = 'hour'
+    DAY = 'day'
+    GRANULARITY_CHOICES = [
+        (HOUR, 'Hourly'),
+        (DAY, 'Daily'),
+    ]
+    
+    question = models.ForeignKey(Question, on_delete=models.CASCADE, related_name='vote_rollups')
+    option_selected = models.CharField(max_length=10, choices=Answer.OPTION_CHOICES)
+    granularity = models.CharField(max_length=4, choices=GRANULARITY_CHOICES)
+    bucket = models.DateTimeField()  # start of the hour/day, UTC
+    count = models.PositiveIntegerField(default=0)
+    
+    class Meta:
+        unique_together = ('question', 'granularity', 'bucket', 'option_selected')
+        ordering = ['question', 'granularity', 'bucket']
+    
+    def __str__(self):
+        return f"Q{self.question_id} {self.option_selected} {self.granularity} {self.bucket:%Y-%m-%d %H:00}: {self.count}"
+
+
+class Watermark(models.Model):
+    """How far an incremental job has read through answers, ordered by (answered_at, id)"""
+    name = models.CharField(max_length=50, unique=True)
+    answered_at = models.DateTimeField(null=True, blank=True)
+    answer_id = models.BigIntegerField(default=0)
+    updated_at = models.DateTimeField(auto_now=True)
+    
+    def __str__(self):
+        return f"{self.name}: {self.answered_at} #{self.answer_id}"
+
+
+class TrendingScore(models.Model):
+    """
+    Time-decayed vote score per question, maintained by polls/trending.py.
+    hotness is the log of the decayed score scaled to a fixed epoch, so rows
+    only change when their question gets votes and still rank correctly.
+    """
+    question = models.OneToOneField(
+        Question, on_delete=models.CASCADE, primary_key=True, related_name='trending_score'
+    )
+    hotness = models.FloatField()
+    votes = models.PositiveIntegerField(default=0)
+    updated_at = models.DateTimeField(auto_now=True)
+    
+    class Meta:
+        ordering = ['-hotness']
+        indexes = [
+            models.Index(fields=['-hotness']),
+        ]
+    
+    def __str__(self):
+        return f"Question {self.question_id}: {self.hotness:.3f}"
+
+
+class Task(models.Model):
+    """A unit of background work queued by polls/tasks.py and run by run_worker"""
+    PENDING = 'pending'
+    RUNNING = 'running'
+    FAILED = 'failed'
+    STATUS_CHOICES = [
+        (PENDING, 'Pending'),
+        (RUNNING, 'Running'),
+        (FAILED, 'Failed'),
+    ]
+    
+    name = models.CharField(max_length=200)  # dotted path of the task function
+    args = models.JSONField(default=list)
+    kwargs = models.JSONField(default=dict)
+    dedup_key = models.CharField(max_length=200, null=True, blank=True)
+    status = models.CharField(max_length=10, choices=STATUS_CHOICES, default=PENDING)
+    run_at = models.DateTimeField(default=timezone.now)
+    attempts = models.PositiveSmallIntegerField(default=0)
+    max_attempts = models.PositiveSmallIntegerField(default=5)
+    locked_by = models.CharField(max_length=100, blank=True)
+    locked_at = models.DateTimeField(null=True, blank=True)
+    last_error = models.TextField(blank=True)
+    created_at = models.DateTimeField(default=timezone.now)
+    
+    class Meta:
+        ordering = ['run_at']
+        indexes = [
+            models.Index(fields=['status', 'run_at']),
+        ]
+        constraints = [
+            # At most one queued copy per key; a running copy may requeue itself
+            models.UniqueConstraint(
+                fields=['dedup_key'],
+                condition=models.Q(status='pending'),
+                name='polls_task_pending_dedup_key',
+            ),
+        ]
     
     def __str__(self):
-        return f"{self.user.username} answered {self.question.id}"
\ No newline at end of file
+        return f"{self.name} ({self.status})"
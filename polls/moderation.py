@@ -0,0 +1,107 @@
+import logging
+import re
+import uuid
+
+from django.db import transaction
+from django.db.models import Count, OuterRef, Subquery
+from django.db.models.functions import Coalesce
+
+from . import rollups, sharding, trending
+from .models import Question, Answer, ArchivedAnswer, Task, VoteRollup, TrendingScore, Watermark
+from .tasks import enqueue
+
+
+logger = logging.getLogger('polls.moderation')
+
+# Ids per background task; also under SQLite's bound parameter limit
+CHUNK_SIZE = 900
+
+# Labels from queue_in_chunks: "<task name>:<8 hex digits>"
+BATCH_LABEL = re.compile(r'[\w.]+:[0-9a-f]{8}')
+
+
+def queue_in_chunks(task_function, ids, chunk_size=CHUNK_SIZE):
+    """
+    Queue task_function(ids_chunk, batch=..., part=..., parts=...) once per
+    chunk of ids, which may be a values_list() queryset: ids are streamed,
+    no model instances are built. Returns (batch label, parts); each part's
+    dedup key starts with the label, so progress() can count what is left.
+    """
+    batch = f'{task_function.__name__}:{uuid.uuid4().hex[:8]}'
+    chunks = []
+    chunk = []
+    for value in ids.iterator(chunk_size=chunk_size) if hasattr(ids, 'iterator') else ids:
+        chunk.append(value)
+        if len(chunk) >= chunk_size:
+            chunks.append(chunk)
+            chunk = []
+    if chunk:
+        chunks.append(chunk)
+
+    for part, chunk in enumerate(chunks, 1):
+        enqueue(
+            task_function.name, [chunk], {'batch': batch, 'part': part, 'parts': len(chunks)},
+            dedup_key=f'{batch}:{part}', max_attempts=task_function.max_attempts,
+        )
+    return batch, len(chunks)
+
+
+def progress(batch):
+    """(parts still queued or running, parts failed) for a batch from queue_in_chunks"""
+    parts = Task.objects.filter(dedup_key__startswith=f'{batch}:')
+    return (
+        parts.exclude(status=Task.FAILED).count(),
+        parts.filter(status=Task.FAILED).count(),
+    )
+
+
+def log_part(batch, part, parts):
+    if batch:
+        logger.info('%s: part %d/%d done', batch, part, parts)
+
+
+def archived_count(option):
+    return Subquery(
+        ArchivedAnswer.objects.filter(question=OuterRef('pk'), option=option)
+        .order_by().values('question').annotate(count=Count('*')).values('count')
+    )
+
+
+def recompute_question_stats(question_ids):
+    """
+    Rebuild the frozen archive tallies, vote rollups and trending scores of
+    the given questions from their answers, in one transaction. Rollups and
+    scores are rebuilt up to their watermarks, so the incremental jobs carry
+    on from where they were.
+    """
+    with transaction.atomic():
+        Question.objects.filter(id__in=question_ids).update(
+            archived_option_one_votes=Coalesce(archived_count(ArchivedAnswer.OPTION_ONE), 0),
+            archived_option_two_votes=Coalesce(archived_count(ArchivedAnswer.OPTION_TWO), 0),
+        )
+
+        watermark = Watermark.objects.select_for_update().filter(name=rollups.WATERMARK_NAME).first()
+        VoteRollup.objects.filter(question_id__in=question_ids).delete()
+        if watermark is not None and watermark.answered_at is not None:
+            rows = sharding.all_rows(
+                Answer.objects.filter(rollups.upto(watermark.answered_at, watermark.answer_id))
+                .filter(question_id__in=question_ids),
+                'question_id', 'option_selected', 'answered_at',
+            )
+            rows.extend(
+                (question_id, 'optionOne' if option == ArchivedAnswer.OPTION_ONE else 'optionTwo', answered_at)
+                for question_id, option, answered_at in ArchivedAnswer.objects.filter(
+                    question_id__in=question_ids, answered_at__lte=watermark.answered_at
+                ).values_list('question_id', 'option', 'answered_at')
+            )
+            rollups.add_votes(rows)
+
+        watermark = Watermark.objects.select_for_update().filter(name=trending.WATERMARK_NAME).first()
+        TrendingScore.objects.filter(question_id__in=question_ids).delete()
+        if watermark is not None and watermark.answered_at is not None:
+            trending.apply_votes(sharding.all_rows(
+                Answer.objects.filter(rollups.upto(watermark.answered_at, watermark.answer_id))
+                .filter(question_id__in=question_ids),
+                'question_id', 'answered_at',
+            ))
+    return len(question_ids)
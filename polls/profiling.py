@@ -0,0 +1,257 @@
+import json
+import os
+import sys
+import threading
+import time
+import uuid
+from collections import Counter
+from contextlib import contextmanager
+from pathlib import Path
+
+from django.conf import settings
+from django.core.cache import caches
+
+from .instrumentation import measure
+
+
+# Where a sample's time went, by the innermost frame matching one of these
+# (path fragment, functions or None for any). First match from the leaf wins.
+PHASES = [
+    ('database', '/django/db/backends/', None),
+    ('orm compile', '/django/db/models/sql/compiler.py', {
+        'as_sql', 'compile', 'pre_sql_setup', 'setup_query', 'get_select', 'get_from_clause',
+        'get_order_by', 'get_group_by', 'get_extra_select', 'get_related_selections',
+        'get_default_columns', 'get_combinator_sql', 'collapse_group_by', 'quote_name_unless_alias',
+    }),
+    ('orm compile', '/django/db/models/sql/where.py', None),
+    ('orm compile', '/django/db/models/expressions.py', {'as_sql', 'as_sqlite', 'compile', 'resolve_expression'}),
+    ('orm compile', '/django/db/models/lookups.py', None),
+    ('template', '/django/template/', None),
+]
+OTHER_PHASE = 'python'
+
+_labels = {}
+
+
+def frame_label(code):
+    """'qualname (path:line)' for a code object, path shortened, no ';'"""
+    label = _labels.get(code)
+    if label is None:
+        filename = code.co_filename
+        for prefix in (str(settings.BASE_DIR), *sorted(sys.path, key=len, reverse=True)):
+            if prefix and filename.startswith(prefix + os.sep):
+                filename = filename[len(prefix) + 1:]
+                break
+        name = getattr(code, 'co_qualname', code.co_name)
+        label = f'{name} ({filename}:{code.co_firstlineno})'.replace(';', ':')
+        _labels[code] = label
+    return label
+
+
+class Sampler:
+    """
+    Statistical profiler for one thread: a background thread reads that
+    thread's stack every `interval` seconds and counts collapsed stacks
+    (root;...;leaf), rooted just below the `base` frame. Samples taken
+    while the thread is outside that frame are dropped.
+
+    The GIL hands the sampler a turn at most every sys.getswitchinterval()
+    (5 ms by default) while the request runs Python code, so intervals below
+    that mostly add overhead.
+    """
+
+    def __init__(self, stacks, interval, base):
+        self.stacks = stacks
+        self.interval = interval
+        self.base = base
+        self.thread_id = threading.get_ident()
+        self._stop = threading.Event()
+        self._thread = None
+
+    def __enter__(self):
+        self._thread = threading.Thread(target=self.run, name='profile sampler', daemon=True)
+        self._thread.start()
+        return self
+
+    def __exit__(self, *exc_info):
+        self._stop.set()
+        self._thread.join()
+
+    def run(self):
+        while not self._stop.wait(self.interval):
+            frame = sys._current_frames().get(self.thread_id)
+            codes = []
+            while frame is not None and frame is not self.base:
+                codes.append(frame.f_code)
+                frame = frame.f_back
+            if frame is None or not codes:
+                continue
+            self.stacks[';'.join(frame_label(code) for code in reversed(codes))] += 1
+
+
+class Profile:
+    """
+    One profiled request: sampled stacks plus measured query, template and
+    SQL compile times. collect() may be entered several times, e.g. for the
+    view and then for the body of a streaming response.
+    """
+
+    def __init__(self, request):
+        self.id = f"{time.strftime('%Y%m%d-%H%M%S')}-{uuid.uuid4().hex[:6]}"
+        self.started_at = time.time()
+        self.method = request.method
+        self.path = request.get_full_path()
+        self.user = request.user.get_username()
+        self.interval = settings.PROFILE_SAMPLE_INTERVAL_MS / 1000
+        self.stacks = Counter()
+        self.totals = Counter()
+        self.view = None
+        self.status = None
+
+    @contextmanager
+    def collect(self):
+        # The frame of the `with` (this generator's frame is suspended, off
+        # the stack, while the block runs)
+        base = sys._getframe(2)
+        with measure() as stats:
+            with Sampler(self.stacks, self.interval, base):
+                yield
+        self.totals.update({
+            'duration': stats.total_time,
+            'db': stats.db_time,
+            'render': stats.render_time,
+            'compile': stats.compile_time,
+            'queries': stats.query_count,
+        })
+
+    def save(self):
+        directory = Path(settings.PROFILE_DIR)
+        directory.mkdir(parents=True, exist_ok=True)
+        data = {
+            'id': self.id,
+            'started_at': self.started_at,
+            'method': self.method,
+            'path': self.path,
+            'view': self.view,
+            'status': self.status,
+            'user': self.user,
+            'interval_ms': self.interval * 1000,
+            'duration_ms': round(self.totals['duration'] * 1000, 3),
+            'db_ms': round(self.totals['db'] * 1000, 3),
+            'render_ms': round(self.totals['render'] * 1000, 3),
+            'compile_ms': round(self.totals['compile'] * 1000, 3),
+            'queries': self.totals['queries'],
+            'samples': sum(self.stacks.values()),
+            'stacks': dict(self.stacks),
+        }
+        tmp_path = directory / f'{self.id}.json.tmp'
+        tmp_path.write_text(json.dumps(data))
+        os.replace(tmp_path, directory / f'{self.id}.json')
+        prune(directory, settings.PROFILE_KEEP)
+
+
+def prune(directory, keep):
+    """Delete all but the newest `keep` profiles (ids sort by time)"""
+    for path in sorted(directory.glob('*.json'), reverse=True)[keep:]:
+        path.unlink(missing_ok=True)
+
+
+def requested(request):
+    return request.headers.get('X-Profile') == '1' or request.GET.get('profile') == '1'
+
+
+def allow():
+    """
+    Rate limit: at most PROFILE_RATE_LIMIT profiles per minute, counted in
+    the aggregate cache (so per process with LocMemCache)
+    """
+    cache = caches[settings.AGGREGATE_CACHE]
+    key = f'profile:rate:{int(time.time() // 60)}'
+    cache.add(key, 0, timeout=120)
+    try:
+        return cache.incr(key) <= settings.PROFILE_RATE_LIMIT
+    except ValueError:
+        # Expired between add() and incr()
+        return False
+
+
+# ============================================================================
+# READING PROFILES
+# ============================================================================
+
+def valid_id(profile_id):
+    return all(c.isalnum() or c == '-' for c in profile_id) and bool(profile_id)
+
+
+def load(profile_id):
+    """A saved profile as a dict, or None"""
+    if not valid_id(profile_id):
+        return None
+    try:
+        return json.loads((Path(settings.PROFILE_DIR) / f'{profile_id}.json').read_text())
+    except FileNotFoundError:
+        return None
+
+
+def recent(limit=100):
+    """Saved profiles newest first, without their stacks"""
+    profiles = []
+    for path in sorted(Path(settings.PROFILE_DIR).glob('*.json'), reverse=True)[:limit]:
+        try:
+            data = json.loads(path.read_text())
+        except (FileNotFoundError, ValueError):
+            continue
+        data.pop('stacks', None)
+        profiles.append(data)
+    return profiles
+
+
+def folded(data):
+    """Collapsed stacks, one 'frame;frame;... count' per line, for flamegraph.pl or speedscope"""
+    return ''.join(
+        f'{stack} {count}\n'
+        for stack, count in sorted(data['stacks'].items(), key=lambda item: -item[1])
+    )
+
+
+def phase(frames):
+    for frame in reversed(frames):
+        name, _, location = frame.rpartition(' (')
+        for phase_name, path_fragment, functions in PHASES:
+            if path_fragment in '/' + location and (functions is None or name.rpartition('.')[2] in functions):
+                return phase_name
+    return OTHER_PHASE
+
+
+def summarize(data, limit=30):
+    """
+    Top functions by self samples (time in the function itself) and by
+    total samples (time with the function on the stack), and samples per
+    phase: database, ORM compile, template rendering, other Python.
+    """
+    self_counts = Counter()
+    total_counts = Counter()
+    phases = Counter()
+    for stack, count in data['stacks'].items():
+        frames = stack.split(';')
+        self_counts[frames[-1]] += count
+        for frame in set(frames):
+            total_counts[frame] += count
+        phases[phase(frames)] += count
+
+    samples = data['samples'] or 1
+    # The sampler can fall behind its interval, so scale shares by wall time
+    duration_ms = data['duration_ms']
+
+    def rows(counter):
+        return [
+            {'function': function, 'samples': count, 'share': count / samples,
+             'ms': count / samples * duration_ms}
+            for function, count in counter.most_common(limit)
+        ]
+
+    return {
+        'by_self': rows(self_counts),
+        'by_total': rows(total_counts),
+        'phases': rows(phases),
+    }
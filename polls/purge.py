@@ -0,0 +1,246 @@
+from collections import Counter
+from contextlib import contextmanager
+
+from django.db import DEFAULT_DB_ALIAS, DatabaseError, connections, transaction
+from django.db.models import F
+
+from . import answered, jobs, rollups, sharding, trending
+from .models import User, Question, Answer, ArchivedAnswer, Recommendation, VoteRollup, TrendingScore, Watermark
+
+
+# Rows deleted per transaction, so the write lock is released between chunks.
+# Kept under SQLite's bound parameter limit since the ids go in an IN list.
+CHUNK_SIZE = 900
+
+# Users or questions per task queued by the admin purge actions; each one
+# may carry thousands of answers
+IDS_PER_TASK = 50
+
+OPTION_NAMES = {code: name for name, code in ArchivedAnswer.OPTIONS.items()}
+
+
+def raw_delete(model, ids_column, ids, using=DEFAULT_DB_ALIAS, **where):
+    """
+    DELETE FROM <table> WHERE ids_column IN (ids) [AND column = value ...]
+    in the `using` database, without the ORM collecting the rows or sending
+    signals first
+    """
+    if not ids:
+        return 0
+    connection = connections[using]
+    qn = connection.ops.quote_name
+    conditions = [f"{qn(ids_column)} IN ({', '.join(['%s'] * len(ids))})"]
+    conditions += [f'{qn(column)} = %s' for column in where]
+    with connection.cursor() as cursor:
+        cursor.execute(
+            f"DELETE FROM {qn(model._meta.db_table)} WHERE {' AND '.join(conditions)}",
+            [*ids, *where.values()],
+        )
+        return cursor.rowcount
+
+
+def rolled_up(name, rows):
+    """
+    The (question_id, option_selected, answered_at, id) rows already folded
+    in by the incremental job whose watermark is `name`. Locks the watermark
+    so that job can't move past these rows while they are being removed.
+    """
+    watermark = Watermark.objects.select_for_update().filter(name=name).first()
+    if watermark is None or watermark.answered_at is None:
+        return []
+    position = (watermark.answered_at, watermark.answer_id)
+    return [row for row in rows if (row[2], row[3]) <= position]
+
+
+def remove_from_aggregates(rows):
+    """
+    Take (question_id, option_selected, answered_at, id) rows out of the vote
+    rollups and trending scores. Must run in the transaction deleting them.
+    """
+    counted = rolled_up(rollups.WATERMARK_NAME, rows)
+    if counted:
+        rollups.remove_votes([row[:3] for row in counted])
+    counted = rolled_up(trending.WATERMARK_NAME, rows)
+    if counted:
+        trending.remove_votes([(row[0], row[2]) for row in counted])
+
+
+@contextmanager
+def shard_transaction(alias):
+    """
+    A transaction on the default database (the aggregates) around one on the
+    answers' shard. Yields a list for the (question_id, ...) rows deleted.
+    The shard commits first, so a retry never takes the rows out of the
+    aggregates twice; if the default commit then fails, the rows are gone
+    but still counted, and their questions are queued for a recount.
+    """
+    rows = []
+    try:
+        with transaction.atomic(), transaction.atomic(using=alias):
+            yield rows
+    except DatabaseError:
+        if rows and alias != DEFAULT_DB_ALIAS:
+            jobs.recompute_question_stats.delay(sorted({row[0] for row in rows}))
+        raise
+
+
+def delete_user_answers(user_id, chunk_size=CHUNK_SIZE):
+    """A user's answers are on every shard; the aggregates are in the default database"""
+    deleted = 0
+    for alias in sharding.answer_databases():
+        while True:
+            with shard_transaction(alias) as rows:
+                rows += (
+                    Answer.objects.using(alias).filter(user_id=user_id).order_by('id')
+                    .values_list('question_id', 'option_selected', 'answered_at', 'id')[:chunk_size]
+                )
+                if not rows:
+                    break
+                remove_from_aggregates(rows)
+                deleted += raw_delete(Answer, 'id', [row[3] for row in rows], alias, user_id=user_id)
+    return deleted
+
+
+def delete_answers(answer_ids, chunk_size=CHUNK_SIZE):
+    """Delete answers by id, taking them out of the vote rollups and trending scores"""
+    deleted = 0
+    for alias in sharding.answer_databases():
+        for start in range(0, len(answer_ids), chunk_size):
+            with shard_transaction(alias) as rows:
+                rows += (
+                    Answer.objects.using(alias).filter(id__in=answer_ids[start:start + chunk_size])
+                    .values_list('question_id', 'option_selected', 'answered_at', 'id', 'user_id')
+                )
+                remove_from_aggregates(rows)
+                deleted += raw_delete(Answer, 'id', [row[3] for row in rows], alias)
+            answered.forget({row[4] for row in rows})
+    return deleted
+
+
+def delete_user_archived_answers(user_id, chunk_size=CHUNK_SIZE):
+    """Delete a user's archived answers, taking them out of the frozen tallies"""
+    deleted = 0
+    while True:
+        with transaction.atomic():
+            rows = list(
+                ArchivedAnswer.objects.filter(user_id=user_id).order_by('question_id')
+                .values_list('question_id', 'option', 'answered_at')[:chunk_size]
+            )
+            if not rows:
+                return deleted
+            # Archived answers have no id; (answered_at, 0) sorts them before
+            # any live answer with the same timestamp, as backfill counts them
+            remove_from_aggregates([
+                (question_id, OPTION_NAMES[option], answered_at, 0)
+                for question_id, option, answered_at in rows
+            ])
+            for option, field in ((ArchivedAnswer.OPTION_ONE, 'archived_option_one_votes'),
+                                  (ArchivedAnswer.OPTION_TWO, 'archived_option_two_votes')):
+                question_ids = [question_id for question_id, chosen, _ in rows if chosen == option]
+                if question_ids:
+                    Question.objects.filter(id__in=question_ids).update(**{field: F(field) - 1})
+            User.objects.filter(id=user_id).update(archived_answers=F('archived_answers') - len(rows))
+            deleted += raw_delete(ArchivedAnswer, 'question_id', [row[0] for row in rows], user_id=user_id)
+
+
+def delete_question_answers(question_id, chunk_size=CHUNK_SIZE):
+    alias = sharding.shard_for(question_id)
+    deleted = 0
+    while True:
+        with transaction.atomic(using=alias):
+            rows = list(
+                Answer.objects.using(alias).filter(question_id=question_id).order_by('id')
+                .values_list('id', 'user_id')[:chunk_size]
+            )
+            if not rows:
+                return deleted
+            deleted += raw_delete(Answer, 'id', [row[0] for row in rows], alias, question_id=question_id)
+        answered.forget({row[1] for row in rows})
+
+
+def delete_question_archived_answers(question_id, chunk_size=CHUNK_SIZE):
+    """Delete a question's archived answers, taking them off each voter's count"""
+    deleted = 0
+    while True:
+        with transaction.atomic():
+            user_ids = list(
+                ArchivedAnswer.objects.filter(question_id=question_id).order_by('user_id')
+                .values_list('user_id', flat=True)[:chunk_size]
+            )
+            if not user_ids:
+                return deleted
+            # One archived answer per (user, question), so every count drops by one
+            User.objects.filter(id__in=user_ids).update(archived_answers=F('archived_answers') - 1)
+            deleted += raw_delete(ArchivedAnswer, 'user_id', user_ids, question_id=question_id)
+        answered.forget(user_ids)
+
+
+def purge_question(question_id, chunk_size=CHUNK_SIZE):
+    """
+    Delete a question and everything hanging off it in chunked raw DELETEs.
+    Its rollups and trending score go with it, so no aggregate needs fixing
+    beyond the per-user archive counts. Returns answers deleted.
+    """
+    deleted = delete_question_answers(question_id, chunk_size)
+    deleted += delete_question_archived_answers(question_id, chunk_size)
+    with transaction.atomic():
+        VoteRollup.objects.filter(question_id=question_id).delete()
+        TrendingScore.objects.filter(question_id=question_id).delete()
+        Recommendation.objects.filter(question_id=question_id).delete()
+        # Nothing large is left to collect, so the ORM delete is cheap now
+        Question.objects.filter(id=question_id).delete()
+    return deleted
+
+
+def purge_user(user_id, chunk_size=CHUNK_SIZE, log=None):
+    """
+    Delete a user, their questions and their answers in chunked raw DELETEs,
+    taking their votes out of the rollups, trending scores and the frozen
+    tallies of archived questions. Returns counts of what was deleted.
+    """
+    log = log or (lambda message: None)
+    # Locked out straight away, however long the rest takes
+    User.objects.filter(id=user_id).update(is_active=False)
+
+    question_ids = list(Question.objects.filter(author_id=user_id).values_list('id', flat=True))
+    answers_on_questions = 0
+    for question_id in question_ids:
+        answers_on_questions += purge_question(question_id, chunk_size)
+    log(f'User {user_id}: {len(question_ids)} questions and {answers_on_questions} answers on them deleted')
+
+    answers = delete_user_answers(user_id, chunk_size)
+    answers += delete_user_archived_answers(user_id, chunk_size)
+    log(f'User {user_id}: {answers} answers deleted')
+
+    with transaction.atomic():
+        Recommendation.objects.filter(user_id=user_id).delete()
+        User.objects.filter(id=user_id).delete()
+    return {
+        'questions': len(question_ids),
+        'answers': answers,
+        'answers_on_questions': answers_on_questions,
+    }
+
+
+def queue_index_rebuilds():
+    """Derived files still include deleted answers until rebuilt"""
+    jobs.rebuild_answer_store.delay(dedup_key=jobs.REBUILD_ANSWER_STORE_KEY)
+    jobs.build_agreement_index.delay(dedup_key=jobs.BUILD_AGREEMENT_INDEX_KEY)
+
+
+def purge_users(user_ids, chunk_size=CHUNK_SIZE, log=None):
+    totals = Counter()
+    for user_id in user_ids:
+        totals.update(purge_user(user_id, chunk_size, log))
+    queue_index_rebuilds()
+    return dict(totals)
+
+
+def purge_questions(question_ids, chunk_size=CHUNK_SIZE, log=None):
+    log = log or (lambda message: None)
+    deleted = 0
+    for number, question_id in enumerate(question_ids, 1):
+        deleted += purge_question(question_id, chunk_size)
+        log(f'Questions {number}/{len(question_ids)}: {deleted} answers deleted')
+    queue_index_rebuilds()
+    return {'questions': len(question_ids), 'answers': deleted}
@@ -0,0 +1,251 @@
+import os
+import tempfile
+from datetime import datetime, timedelta
+
+import numpy as np
+from scipy import sparse
+
+from django.conf import settings
+from django.db import transaction
+from django.utils import timezone
+
+from . import sharding
+from .models import Answer, ArchivedAnswer, Recommendation
+from .rollups import after, upto
+
+
+STATE_FILE = 'covote.npz'
+USER_BATCH_SIZE = 1000
+ANSWER_BATCH_SIZE = 10000
+# Stay well under SQLite's bound parameter limit for __in lookups
+IN_CHUNK_SIZE = 900
+
+
+def state_path():
+    return os.path.join(settings.RECOMMENDER_DIR, STATE_FILE)
+
+
+class CoVoteMatrix:
+    """
+    C[i, j] counts users who answered both question i and j (C = A.T @ A for
+    the binary user x question matrix A). Persisted with an (answered_at, id)
+    watermark, as the rollups keep, so each rebuild only folds in newer
+    answers. Archived answers are counted when the matrix is built from
+    scratch; by the time a question is archived its answers have long been
+    folded in.
+    """
+
+    def __init__(self, counts=None, watermark=None):
+        self.counts = counts if counts is not None else sparse.csr_matrix((0, 0), dtype=np.int32)
+        self.watermark = watermark
+
+    @classmethod
+    def load(cls):
+        """The saved matrix, or None if there is none to build on"""
+        path = state_path()
+        if not os.path.exists(path):
+            return None
+        with np.load(path) as data:
+            if 'watermark_at' not in data:
+                # Saved with per-database id watermarks, which can't be
+                # turned into a position in time: start over
+                return None
+            counts = sparse.csr_matrix(
+                (data['data'], data['indices'], data['indptr']), shape=tuple(data['shape'])
+            )
+            answered_at = str(data['watermark_at'])
+            watermark = (datetime.fromisoformat(answered_at), int(data['watermark_id'])) if answered_at else None
+            return cls(counts, watermark)
+
+    def save(self):
+        os.makedirs(settings.RECOMMENDER_DIR, exist_ok=True)
+        counts = self.counts.tocsr()
+        answered_at, answer_id = self.watermark or (None, 0)
+        fd, tmp_path = tempfile.mkstemp(dir=settings.RECOMMENDER_DIR, suffix='.npz')
+        with os.fdopen(fd, 'wb') as f:
+            np.savez(
+                f, data=counts.data, indices=counts.indices, indptr=counts.indptr, shape=np.array(counts.shape),
+                watermark_at=np.array(answered_at.isoformat() if answered_at else ''),
+                watermark_id=np.array(answer_id),
+            )
+        os.replace(tmp_path, state_path())
+
+    @property
+    def size(self):
+        return self.counts.shape[0]
+
+    def resize(self, size):
+        if size > self.size:
+            self.counts = self.counts.tocsr(copy=True)
+            self.counts.resize((size, size))
+
+    def add(self, delta):
+        self.resize(delta.shape[0])
+        self.counts = (self.counts + delta).tocsr()
+
+    def similarity(self):
+        """Cosine similarity between questions, with the diagonal removed"""
+        counts = self.counts.tocsr().astype(np.float64)
+        votes = counts.diagonal()
+        with np.errstate(divide='ignore'):
+            inverse = np.where(votes > 0, 1.0 / np.sqrt(votes), 0.0)
+        norm = sparse.diags(inverse)
+        similarity = (norm @ counts @ norm).tocsr()
+        similarity = similarity - sparse.diags(similarity.diagonal())
+        similarity.eliminate_zeros()
+        return similarity
+
+
+def answer_matrix(rows, user_index, size):
+    """Binary csr matrix from (user_id, question_id) pairs, rows ordered by user_index"""
+    if not rows:
+        return sparse.csr_matrix((len(user_index), size), dtype=np.int32)
+    pairs = np.array(rows, dtype=np.int64)
+    row = np.fromiter((user_index[u] for u in pairs[:, 0]), dtype=np.int64, count=len(pairs))
+    data = np.ones(len(pairs), dtype=np.int32)
+    matrix = sparse.csr_matrix((data, (row, pairs[:, 1])), shape=(len(user_index), size))
+    matrix.data[:] = 1  # duplicates collapse to a single vote
+    return matrix
+
+
+def from_archived():
+    """A matrix of the archived answers alone, to build the live ones onto"""
+    rows = list(ArchivedAnswer.objects.values_list('user_id', 'question_id').iterator(chunk_size=ANSWER_BATCH_SIZE))
+    if not rows:
+        return CoVoteMatrix()
+    user_ids = sorted({user_id for user_id, _ in rows})
+    size = max(question_id for _, question_id in rows) + 1
+    archived = answer_matrix(rows, {user_id: i for i, user_id in enumerate(user_ids)}, size)
+    return CoVoteMatrix((archived.T @ archived).tocsr().astype(np.int32))
+
+
+def previous_answers(user_ids, watermark):
+    """(user_id, question_id) of the users' answers already in the matrix: archived, and live up to the watermark"""
+    rows = []
+    for start in range(0, len(user_ids), IN_CHUNK_SIZE):
+        chunk = user_ids[start:start + IN_CHUNK_SIZE]
+        if watermark is not None:
+            rows.extend(sharding.all_rows(
+                Answer.objects.filter(upto(*watermark), user_id__in=chunk), 'user_id', 'question_id'
+            ))
+        rows.extend(ArchivedAnswer.objects.filter(user_id__in=chunk).values_list('user_id', 'question_id'))
+    return rows
+
+
+def new_answers(watermark, batch_size=ANSWER_BATCH_SIZE):
+    """
+    (answered_at, id, user_id, question_id) rows after the watermark, in
+    order. Answers younger than ROLLUP_LAG_SECONDS wait for the next run, as
+    in the rollups, so a late commit doesn't land behind the watermark.
+    """
+    cutoff = timezone.now() - timedelta(seconds=settings.ROLLUP_LAG_SECONDS)
+    rows = []
+    while True:
+        answers = Answer.objects.filter(answered_at__lte=cutoff)
+        if watermark is not None:
+            answers = answers.filter(after(*watermark))
+        batch = sharding.first_rows(
+            answers, ['answered_at', 'id'], ['answered_at', 'id', 'user_id', 'question_id'], batch_size
+        )
+        rows.extend(batch)
+        if len(batch) < batch_size:
+            return rows
+        watermark = batch[-1][:2]
+
+
+def update(matrix):
+    """
+    Fold answers newer than the watermark into the matrix. Returns the ids
+    of users whose answers changed, i.e. whose recommendations are stale.
+    """
+    new_rows = new_answers(matrix.watermark)
+    if not new_rows:
+        return matrix, []
+
+    user_ids = sorted({user_id for _, _, user_id, _ in new_rows})
+    user_index = {user_id: i for i, user_id in enumerate(user_ids)}
+    old_rows = previous_answers(user_ids, matrix.watermark)
+    size = max(matrix.size, *(question_id + 1 for _, _, _, question_id in new_rows),
+               *(question_id + 1 for _, question_id in old_rows))
+
+    old = answer_matrix(old_rows, user_index, size)
+    new = answer_matrix([(u, q) for _, _, u, q in new_rows], user_index, size)
+
+    # (A_old + A_new).T (A_old + A_new) - A_old.T A_old
+    delta = old.T @ new + new.T @ old + new.T @ new
+    matrix.add(delta.astype(np.int32))
+    matrix.watermark = tuple(new_rows[-1][:2])
+    return matrix, user_ids
+
+
+def top_k(scores, answered, k):
+    """Indices and scores of the k best unanswered questions in a sparse score row"""
+    questions, values = scores.indices, scores.data
+    keep = ~np.isin(questions, answered) & (values > 0)
+    questions, values = questions[keep], values[keep]
+    if len(values) > k:
+        best = np.argpartition(-values, k)[:k]
+        questions, values = questions[best], values[best]
+    order = np.argsort(-values, kind='stable')
+    return questions[order], values[order]
+
+
+def refresh_recommendations(matrix, user_ids, k=None):
+    """Recompute and store the top-k list for each user in user_ids"""
+    k = k or settings.RECOMMENDATIONS_PER_USER
+    similarity = matrix.similarity()
+    stored = 0
+
+    for start in range(0, len(user_ids), USER_BATCH_SIZE):
+        batch = user_ids[start:start + USER_BATCH_SIZE]
+        user_index = {user_id: i for i, user_id in enumerate(batch)}
+        # Answers archived before they were folded in aren't in the matrix
+        answered_rows = [row for row in previous_answers(batch, matrix.watermark) if row[1] < matrix.size]
+        answers = answer_matrix(answered_rows, user_index, matrix.size)
+        scores = (answers.astype(np.float64) @ similarity).tocsr()
+
+        rows = []
+        for user_id, i in user_index.items():
+            answered = answers.indices[answers.indptr[i]:answers.indptr[i + 1]]
+            questions, values = top_k(scores[i], answered, k)
+            rows.extend(
+                Recommendation(user_id=user_id, question_id=int(q), score=float(v), rank=rank)
+                for rank, (q, v) in enumerate(zip(questions, values), start=1)
+            )
+
+        with transaction.atomic():
+            Recommendation.objects.filter(user_id__in=batch).delete()
+            Recommendation.objects.bulk_create(rows, batch_size=5000)
+        stored += len(rows)
+    return stored
+
+
+def rebuild(full=False, all_users=False, k=None):
+    """
+    Incrementally update the co-vote matrix and refresh recommendations for
+    users with new answers (or everyone with all_users). With full, or
+    without a saved matrix, it is built from scratch from the archived and
+    live answers. Returns a summary dict.
+    """
+    matrix = None if full else CoVoteMatrix.load()
+    if matrix is None:
+        matrix, full = from_archived(), True
+    matrix, changed_users = update(matrix)
+
+    if all_users or full:
+        users = set(ArchivedAnswer.objects.order_by().values_list('user_id', flat=True).distinct())
+        if matrix.watermark is not None:
+            users.update(sharding.all_rows(
+                Answer.objects.filter(upto(*matrix.watermark)).order_by().distinct(), 'user_id', flat=True
+            ))
+        changed_users = sorted(users)
+
+    stored = refresh_recommendations(matrix, changed_users, k) if changed_users else 0
+    matrix.save()
+    answered_at, answer_id = matrix.watermark or (None, 0)
+    return {
+        'watermark': f'{answered_at:%Y-%m-%d %H:%M:%S} #{answer_id}' if answered_at else None,
+        'questions': matrix.size,
+        'users': len(changed_users),
+        'recommendations': stored,
+    }
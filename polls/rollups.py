@@ -0,0 +1,222 @@
+from collections import Counter
+from datetime import timedelta, timezone as dt_timezone
+
+from django.conf import settings
+from django.db import connection, transaction
+from django.db.models import Min, Q
+from django.utils import timezone
+
+from . import sharding
+from .models import Answer, ArchivedAnswer, VoteRollup, Watermark
+
+
+WATERMARK_NAME = 'vote_rollups'
+BATCH_SIZE = 10000
+
+STEPS = {
+    VoteRollup.HOUR: timedelta(hours=1),
+    VoteRollup.DAY: timedelta(days=1),
+}
+
+
+def truncate(moment, granularity):
+    """Start of the UTC hour or day containing moment"""
+    moment = moment.astimezone(dt_timezone.utc).replace(minute=0, second=0, microsecond=0)
+    if granularity == VoteRollup.DAY:
+        moment = moment.replace(hour=0)
+    return moment
+
+
+def upsert_sql():
+    meta = VoteRollup._meta
+    qn = connection.ops.quote_name
+    table = qn(meta.db_table)
+    count = qn(meta.get_field('count').column)
+    key = ', '.join(
+        qn(meta.get_field(name).column)
+        for name in ('question', 'granularity', 'bucket', 'option_selected')
+    )
+    # INSERT ... ON CONFLICT is supported by both SQLite (3.24+) and PostgreSQL
+    return (
+        f'INSERT INTO {table} ({key}, {count}) VALUES (%s, %s, %s, %s, %s) '
+        f'ON CONFLICT ({key}) DO UPDATE SET {count} = {table}.{count} + excluded.{count}'
+    )
+
+
+def bucket_counts(rows):
+    """Votes per (question_id, granularity, bucket, option_selected) in the rows"""
+    counts = Counter()
+    for question_id, option_selected, answered_at in rows:
+        hour = truncate(answered_at, VoteRollup.HOUR)
+        counts[question_id, VoteRollup.HOUR, hour, option_selected] += 1
+        counts[question_id, VoteRollup.DAY, hour.replace(hour=0), option_selected] += 1
+    return counts
+
+
+def add_votes(rows):
+    """
+    Add (question_id, option_selected, answered_at) rows to the hourly and
+    daily buckets. Must run inside the transaction that moves the watermark.
+    """
+    counts = bucket_counts(rows)
+    adapt_datetime = connection.ops.adapt_datetimefield_value
+    with connection.cursor() as cursor:
+        cursor.executemany(upsert_sql(), [
+            (question_id, granularity, adapt_datetime(bucket), option_selected, count)
+            for (question_id, granularity, bucket, option_selected), count in counts.items()
+        ])
+    return len(counts)
+
+
+def remove_votes(rows):
+    """
+    Subtract (question_id, option_selected, answered_at) rows of deleted
+    answers from their buckets, dropping buckets that reach zero. Must run
+    inside a transaction holding the watermark.
+    """
+    meta = VoteRollup._meta
+    qn = connection.ops.quote_name
+    count = qn(meta.get_field('count').column)
+    key = ' AND '.join(
+        f'{qn(meta.get_field(name).column)} = %s'
+        for name in ('question', 'granularity', 'bucket', 'option_selected')
+    )
+    counts = bucket_counts(rows)
+    adapt_datetime = connection.ops.adapt_datetimefield_value
+    with connection.cursor() as cursor:
+        cursor.executemany(
+            f'UPDATE {qn(meta.db_table)} SET {count} = CASE WHEN {count} > %s THEN {count} - %s ELSE 0 END '
+            f'WHERE {key}',
+            [
+                (removed, removed, question_id, granularity, adapt_datetime(bucket), option_selected)
+                for (question_id, granularity, bucket, option_selected), removed in counts.items()
+            ],
+        )
+    VoteRollup.objects.filter(question_id__in={key[0] for key in counts}, count=0).delete()
+    return len(counts)
+
+
+def after(answered_at, answer_id):
+    """Answers strictly after the (answered_at, id) position"""
+    return Q(answered_at__gt=answered_at) | Q(answered_at=answered_at, id__gt=answer_id)
+
+
+def upto(answered_at, answer_id):
+    """Answers at or before the (answered_at, id) position"""
+    return Q(answered_at__lt=answered_at) | Q(answered_at=answered_at, id__lte=answer_id)
+
+
+def update(batch_size=BATCH_SIZE):
+    """
+    Fold answers newer than the watermark into the rollups, one transaction
+    per batch so the counts and the watermark always move together.
+
+    Answers younger than ROLLUP_LAG_SECONDS are left for the next run: a vote
+    committed a moment after another one may carry a slightly older
+    answered_at, and must not land behind the watermark.
+    """
+    cutoff = timezone.now() - timedelta(seconds=settings.ROLLUP_LAG_SECONDS)
+    Watermark.objects.get_or_create(name=WATERMARK_NAME)
+    processed = 0
+
+    while True:
+        with transaction.atomic():
+            watermark = Watermark.objects.select_for_update().get(name=WATERMARK_NAME)
+            answers = Answer.objects.filter(answered_at__lte=cutoff)
+            if watermark.answered_at is not None:
+                answers = answers.filter(after(watermark.answered_at, watermark.answer_id))
+            rows = sharding.first_rows(
+                answers, ['answered_at', 'id'],
+                ['id', 'question_id', 'option_selected', 'answered_at'], batch_size,
+            )
+            if not rows:
+                return processed
+
+            add_votes([row[1:] for row in rows])
+            watermark.answer_id, watermark.answered_at = rows[-1][0], rows[-1][3]
+            watermark.save()
+        processed += len(rows)
+        if len(rows) < batch_size:
+            return processed
+
+
+def backfill(since=None, log=None):
+    """
+    Recompute rollups from raw answers, one day per transaction, from the day
+    containing since (default: the first live or archived answer) up to the watermark. Needed
+    for answers written with past timestamps (imports, generate_load_data)
+    and after answers are deleted; update() only ever moves forward.
+    """
+    log = log or (lambda message: None)
+    update()
+    watermark = Watermark.objects.get(name=WATERMARK_NAME)
+    if watermark.answered_at is None:
+        return 0
+
+    if since is None:
+        firsts = sharding.scatter(
+            lambda alias: Answer.objects.using(alias).aggregate(first=Min('answered_at'))['first']
+        )
+        firsts.append(ArchivedAnswer.objects.aggregate(first=Min('answered_at'))['first'])
+        # With every answer gone, the watermark's day still holds counted votes
+        since = min((first for first in firsts if first is not None), default=watermark.answered_at)
+    day = truncate(since, VoteRollup.DAY)
+    end = watermark.answered_at
+    counted = upto(end, watermark.answer_id)
+    processed = 0
+
+    while day <= end:
+        next_day = day + STEPS[VoteRollup.DAY]
+        with transaction.atomic():
+            VoteRollup.objects.filter(bucket__gte=day, bucket__lt=next_day).delete()
+            rows = sharding.all_rows(
+                Answer.objects.filter(counted, answered_at__gte=day, answered_at__lt=next_day),
+                'question_id', 'option_selected', 'answered_at',
+            )
+            # Archived answers were rolled up before they moved; keep counting them
+            rows.extend(
+                (question_id, 'optionOne' if option == ArchivedAnswer.OPTION_ONE else 'optionTwo', answered_at)
+                for question_id, option, answered_at in ArchivedAnswer.objects.filter(
+                    answered_at__gte=day, answered_at__lt=next_day, answered_at__lte=end
+                ).values_list('question_id', 'option', 'answered_at').iterator(chunk_size=BATCH_SIZE)
+            )
+            buckets = add_votes(rows)
+        log(f'{day:%Y-%m-%d}: {buckets} buckets')
+        processed += buckets
+        day = next_day
+    return processed
+
+
+def trend(question_id, granularity=VoteRollup.DAY, buckets=14, now=None):
+    """
+    The last `buckets` hours or days of votes for a question, oldest first,
+    with empty buckets filled in. Reads at most 2 x buckets rollup rows.
+    """
+    step = STEPS[granularity]
+    end = truncate(now or timezone.now(), granularity)
+    start = end - step * (buckets - 1)
+
+    counts = {}
+    for bucket, option_selected, count in VoteRollup.objects.filter(
+        question_id=question_id, granularity=granularity, bucket__gte=start
+    ).values_list('bucket', 'option_selected', 'count'):
+        counts[bucket, option_selected] = count
+
+    points = []
+    for i in range(buckets):
+        bucket = start + step * i
+        option_one = counts.get((bucket, 'optionOne'), 0)
+        option_two = counts.get((bucket, 'optionTwo'), 0)
+        points.append({
+            'bucket': bucket,
+            'option_one': option_one,
+            'option_two': option_two,
+            'total': option_one + option_two,
+        })
+
+    # Bar heights relative to the busiest bucket, for the CSS chart
+    peak = max((point['total'] for point in points), default=0) or 1
+    for point in points:
+        point['option_one_height'] = round(point['option_one'] / peak * 100, 1)
+        point['option_two_height'] = round(point['option_two'] / peak * 100, 1)
+    return points
@@ -0,0 +1,76 @@
+import re
+
+from django.db import connection
+
+from .models import Question
+
+
+# Words (including unicode letters) in a search box, e.g. "super str" -> ["super", "str"]
+TOKEN_RE = re.compile(r'\w+', re.UNICODE)
+MAX_TOKENS = 8
+
+
+def tokenize(query):
+    return TOKEN_RE.findall(query.lower())[:MAX_TOKENS]
+
+
+def _sqlite_match(tokens, prefix):
+    # Quoted tokens can't be parsed as FTS5 operators (AND, NEAR, column filters)
+    terms = ['"{}"'.format(token.replace('"', '""')) for token in tokens]
+    if prefix:
+        terms[-1] += '*'
+    return ' '.join(terms)
+
+
+def _postgresql_match(tokens, prefix):
+    terms = [re.sub(r'[^\w]', '', token) for token in tokens]
+    terms = [term for term in terms if term]
+    if prefix and terms:
+        terms[-1] += ':*'
+    return ' & '.join(terms)
+
+
+def search_question_ids(query, limit=20, prefix=True):
+    """
+    Ids of visible questions matching every word of query, best match first.
+    With prefix=True the last word also matches as a prefix ("invis" -> "invisible").
+    Hidden questions are filtered out before the LIMIT, so pages stay full.
+    """
+    tokens = tokenize(query)
+    if not tokens:
+        return []
+
+    vendor = connection.vendor
+    with connection.cursor() as cursor:
+        if vendor == 'sqlite':
+            # bm25() is lower-is-better; the FTS5 prefix indexes serve "term*" lookups
+            cursor.execute(
+                'SELECT polls_question.id FROM polls_question_fts '
+                'JOIN polls_question ON polls_question.id = polls_question_fts.rowid '
+                'WHERE polls_question_fts MATCH %s AND polls_question.is_hidden = %s '
+                'ORDER BY bm25(polls_question_fts) LIMIT %s',
+                [_sqlite_match(tokens, prefix), False, limit],
+            )
+        elif vendor == 'postgresql':
+            tsquery = _postgresql_match(tokens, prefix)
+            if not tsquery:
+                return []
+            # PostgreSQL has no built-in BM25; ts_rank_cd is the closest ranking it offers
+            cursor.execute(
+                "SELECT id FROM polls_question "
+                "WHERE search_vector @@ to_tsquery('simple', %s) AND is_hidden = %s "
+                "ORDER BY ts_rank_cd(search_vector, to_tsquery('simple', %s)) DESC, id DESC "
+                "LIMIT %s",
+                [tsquery, False, tsquery, limit],
+            )
+        else:
+            raise NotImplementedError(f'Question search is not available on {vendor}')
+        return [row[0] for row in cursor.fetchall()]
+
+
+def search_questions(query, limit=20, prefix=True):
+    """Visible questions (with authors) matching query, in rank order"""
+    ids = search_question_ids(query, limit=limit, prefix=prefix)
+    # Still filtered, for a question hidden between the two queries
+    questions = Question.objects.filter(is_hidden=False).select_related('author').in_bulk(ids)
+    return [questions[question_id] for question_id in ids if question_id in questions]
@@ -0,0 +1,33 @@
+# SQL behind the SQLite full-text index created in migration 0004, kept here
+# for later migrations: SQLite drops these triggers whenever Django rebuilds
+# polls_question to alter it, and those migrations re-create them. Plain
+# strings only, so migrations can import this module safely.
+
+SQLITE_TRIGGERS = [
+    """
+    CREATE TRIGGER polls_question_fts_insert AFTER INSERT ON polls_question BEGIN
+        INSERT INTO polls_question_fts(rowid, option_one_text, option_two_text)
+        VALUES (new.id, new.option_one_text, new.option_two_text);
+    END
+    """,
+    """
+    CREATE TRIGGER polls_question_fts_delete AFTER DELETE ON polls_question BEGIN
+        INSERT INTO polls_question_fts(polls_question_fts, rowid, option_one_text, option_two_text)
+        VALUES ('delete', old.id, old.option_one_text, old.option_two_text);
+    END
+    """,
+    """
+    CREATE TRIGGER polls_question_fts_update AFTER UPDATE OF option_one_text, option_two_text ON polls_question BEGIN
+        INSERT INTO polls_question_fts(polls_question_fts, rowid, option_one_text, option_two_text)
+        VALUES ('delete', old.id, old.option_one_text, old.option_two_text);
+        INSERT INTO polls_question_fts(rowid, option_one_text, option_two_text)
+        VALUES (new.id, new.option_one_text, new.option_two_text);
+    END
+    """,
+]
+
+SQLITE_TRIGGER_NAMES = [
+    'polls_question_fts_insert',
+    'polls_question_fts_delete',
+    'polls_question_fts_update',
+]
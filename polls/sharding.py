@@ -0,0 +1,358 @@
+import heapq
+from concurrent.futures import ThreadPoolExecutor
+
+from django.conf import settings
+from django.db import DEFAULT_DB_ALIAS, DatabaseError, connections, transaction
+from django.db.models import Count
+
+from .models import Answer, Question
+
+
+# Shard i allocates new answer ids from (i + 1) * ID_SPAN up, so ids stay
+# unique across databases; rows moved off the default database keep theirs
+ID_SPAN = 2 ** 40
+
+# Rows moved per transaction by rebalance(); their ids go in an IN list, so
+# this stays under SQLite's bound parameter limit
+CHUNK_SIZE = 900
+
+
+class ShardingNotSupported(RuntimeError):
+    """Raised by code that still reads answers from the default database only"""
+
+
+def enabled():
+    return bool(settings.ANSWER_SHARD_ALIASES)
+
+
+def jump_hash(key, buckets):
+    """
+    Jump consistent hash (Lamping & Veach): growing from n to n + 1 buckets
+    moves only the keys that land in the new bucket, about 1/(n + 1) of them
+    """
+    key &= 0xFFFFFFFFFFFFFFFF
+    bucket, jump = -1, 0
+    while jump < buckets:
+        bucket = jump
+        key = (key * 2862933555777941757 + 1) & 0xFFFFFFFFFFFFFFFF
+        jump = int((bucket + 1) * ((1 << 31) / ((key >> 33) + 1)))
+    return bucket
+
+
+def shard_for(question_id):
+    """Database alias holding the answers to a question"""
+    aliases = settings.ANSWER_SHARD_ALIASES
+    if not aliases:
+        return DEFAULT_DB_ALIAS
+    return aliases[jump_hash(question_id, len(aliases))]
+
+
+def answer_databases():
+    return list(settings.ANSWER_SHARD_ALIASES) or [DEFAULT_DB_ALIAS]
+
+
+def group_by_shard(question_ids):
+    """{alias: [question ids]}"""
+    groups = {}
+    for question_id in question_ids:
+        groups.setdefault(shard_for(question_id), []).append(question_id)
+    return groups
+
+
+def check_unsharded(what):
+    if enabled():
+        raise ShardingNotSupported(f'{what} reads answers from the default database only; unset ANSWER_SHARDS')
+
+
+class AnswerShardRouter:
+    """
+    Sends Answer reads and writes to the shard of their question when the
+    instance (or the question, for question.answers) is known. Everything
+    else, including Answer queries without such a hint, goes to the default
+    database: query every shard with the helpers below instead.
+    """
+
+    def shard(self, model, hints):
+        if not enabled():
+            return None
+        instance = hints.get('instance')
+        if model is not Answer:
+            # answer.user and answer.question of an answer read from a shard;
+            # Django would otherwise look for them in the answer's database
+            return DEFAULT_DB_ALIAS if isinstance(instance, Answer) else None
+        if isinstance(instance, Answer) and instance.question_id is not None:
+            return shard_for(instance.question_id)
+        if isinstance(instance, Question) and instance.pk is not None:
+            return shard_for(instance.pk)
+        return None
+
+    def db_for_read(self, model, **hints):
+        return self.shard(model, hints)
+
+    def db_for_write(self, model, **hints):
+        return self.shard(model, hints)
+
+    def allow_relation(self, obj1, obj2, **hints):
+        # An answer's user and question stay in the default database
+        if enabled() and Answer in (type(obj1), type(obj2)):
+            return True
+        return None
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        if db in settings.ANSWER_SHARD_ALIASES:
+            return app_label == 'polls' and model_name == 'answer'
+        return None
+
+
+def relax_foreign_keys(sender, connection, **kwargs):
+    """
+    connection_created handler: shard databases have no user or question
+    tables, so SQLite must not enforce the answer table's foreign keys there
+    """
+    if connection.alias in settings.ANSWER_SHARD_ALIASES and connection.vendor == 'sqlite':
+        with connection.cursor() as cursor:
+            cursor.execute('PRAGMA foreign_keys = OFF')
+
+
+def relax_foreign_keys_after_migrate(sender, using, **kwargs):
+    """post_migrate handler: the schema editor turns the checks back on as it finishes"""
+    relax_foreign_keys(sender, connections[using])
+
+
+def delete_shard_answers(sender, instance, using, **kwargs):
+    """
+    pre_delete handler for User and Question. The cascade to answers only
+    covers the database the delete runs in, and the shards have no foreign
+    keys to enforce it, so the answers there are deleted here.
+    """
+    if not enabled() or using != DEFAULT_DB_ALIAS:
+        return
+    if isinstance(instance, Question):
+        answers, aliases = Answer.objects.filter(question_id=instance.pk), [shard_for(instance.pk)]
+    else:
+        answers, aliases = Answer.objects.filter(user_id=instance.pk), settings.ANSWER_SHARD_ALIASES
+    for alias in aliases:
+        answers.using(alias).delete()
+
+
+# ============================================================================
+# SCATTER-GATHER
+# ============================================================================
+
+def scatter(function):
+    """
+    function(alias) for every database holding answers, the shards in
+    parallel threads (each with its own connection). Inside a transaction
+    they run in this thread instead, since other connections wouldn't see
+    its writes. Returns the results in alias order.
+    """
+    aliases = answer_databases()
+    if len(aliases) == 1 or any(connections[alias].in_atomic_block for alias in aliases):
+        return [function(alias) for alias in aliases]
+
+    def run(alias):
+        try:
+            return function(alias)
+        finally:
+            connections.close_all()
+
+    with ThreadPoolExecutor(max_workers=len(aliases), thread_name_prefix='shard') as pool:
+        return list(pool.map(run, aliases))
+
+
+def all_rows(queryset, *fields, flat=False):
+    """values_list(*fields) of an Answer queryset, from every shard, concatenated"""
+    parts = scatter(lambda alias: list(queryset.using(alias).values_list(*fields, flat=flat)))
+    return [row for part in parts for row in part]
+
+
+def first_rows(queryset, order_by, fields, limit):
+    """
+    The first `limit` rows of queryset.order_by(*order_by) across every
+    shard: each returns its own first `limit`, merged. order_by must be
+    ascending field names, all in fields.
+    """
+    positions = [fields.index(name) for name in order_by]
+    parts = scatter(
+        lambda alias: list(queryset.using(alias).order_by(*order_by).values_list(*fields)[:limit])
+    )
+    merged = heapq.merge(*parts, key=lambda row: tuple(row[i] for i in positions))
+    return [row for row, _ in zip(merged, range(limit))]
+
+
+def exists(queryset):
+    return any(scatter(lambda alias: queryset.using(alias).exists()))
+
+
+def count(queryset):
+    return sum(scatter(lambda alias: queryset.using(alias).count()))
+
+
+def answered_question_ids(user_id):
+    """Question ids of a user's live answers, from every shard"""
+    return all_rows(Answer.objects.filter(user_id=user_id), 'question_id', flat=True)
+
+
+def answer_counts_by_user(user_ids):
+    """{user_id: live answers} for user_ids, summed over the shards' GROUP BYs"""
+    queryset = Answer.objects.filter(user_id__in=user_ids).order_by().values_list(
+        'user_id'
+    ).annotate(n=Count('id'))
+    counts = {}
+    for part in scatter(lambda alias: list(queryset.using(alias))):
+        for user_id, n in part:
+            counts[user_id] = counts.get(user_id, 0) + n
+    return counts
+
+
+def answer_counts_by_question(question_ids):
+    """{question_id: {option_selected: live answers}} for question_ids, from the shards' GROUP BYs"""
+    queryset = Answer.objects.filter(question_id__in=question_ids).order_by().values_list(
+        'question_id', 'option_selected'
+    ).annotate(n=Count('id'))
+    counts = {}
+    for part in scatter(lambda alias: list(queryset.using(alias))):
+        for question_id, option_selected, n in part:
+            counts.setdefault(question_id, {})[option_selected] = n
+    return counts
+
+
+def bulk_create(answers, **kwargs):
+    """Answer.objects.bulk_create, one call per shard"""
+    groups = {}
+    for answer in answers:
+        groups.setdefault(shard_for(answer.question_id), []).append(answer)
+    created = []
+    for alias, group in groups.items():
+        created += Answer.objects.using(alias).bulk_create(group, **kwargs)
+    return created
+
+
+def load_watermarks(saved):
+    """
+    {alias: last Answer.id read} from a saved watermark: a dict, or a single
+    id saved before sharding, which was read from the default database
+    """
+    if isinstance(saved, dict):
+        return {alias: int(last_id) for alias, last_id in saved.items()}
+    return {DEFAULT_DB_ALIAS: int(saved)} if saved else {}
+
+
+def rows_after(watermarks, fields, batch_size):
+    """
+    Batches of Answer values_list('id', *fields) with ids past each database's
+    watermark, as (alias, rows), walking one database at a time by primary
+    key. Ids are only ordered within a database, hence a watermark for each.
+    """
+    for alias in answer_databases():
+        last_id = watermarks.get(alias, 0)
+        while True:
+            rows = list(
+                Answer.objects.using(alias).filter(id__gt=last_id).order_by('id')
+                .values_list('id', *fields)[:batch_size]
+            )
+            if rows:
+                last_id = rows[-1][0]
+                yield alias, rows
+            if len(rows) < batch_size:
+                break
+
+
+def rows_upto(watermarks, queryset, *fields, flat=False):
+    """all_rows() of queryset, limited to the ids each database's watermark covers"""
+    parts = scatter(lambda alias: list(
+        queryset.using(alias).filter(id__lte=watermarks.get(alias, 0)).values_list(*fields, flat=flat)
+    ))
+    return [row for part in parts for row in part]
+
+
+# ============================================================================
+# SETUP AND REBALANCING
+# ============================================================================
+
+def seed_id_sequence(alias, index):
+    """Start the shard's answer ids at its own range (idempotent)"""
+    connection = connections[alias]
+    start = (index + 1) * ID_SPAN
+    table = Answer._meta.db_table
+    with connection.cursor() as cursor:
+        if connection.vendor == 'sqlite':
+            cursor.execute('UPDATE sqlite_sequence SET seq = MAX(seq, %s) WHERE name = %s', [start, table])
+            if cursor.rowcount == 0:
+                cursor.execute('INSERT INTO sqlite_sequence (name, seq) VALUES (%s, %s)', [table, start])
+        elif connection.vendor == 'postgresql':
+            cursor.execute(
+                f"SELECT setval(pg_get_serial_sequence(%s, 'id'), "
+                f"GREATEST(%s, (SELECT COALESCE(MAX(id), 0) FROM {connection.ops.quote_name(table)})))",
+                [table, start],
+            )
+        else:
+            raise ShardingNotSupported(f'No id sequence seeding for {connection.vendor}')
+
+
+def has_answer_table(alias):
+    try:
+        return Answer._meta.db_table in connections[alias].introspection.table_names()
+    except DatabaseError:
+        return False
+
+
+def misplaced(alias, chunk_size):
+    """Chunks of answer rows (dicts) in `alias` that belong on another shard, by id"""
+    last_id = 0
+    while True:
+        rows = list(
+            Answer.objects.using(alias).filter(id__gt=last_id).order_by('id')
+            .values('id', 'user_id', 'question_id', 'option_selected', 'answered_at')[:chunk_size]
+        )
+        if not rows:
+            return
+        last_id = rows[-1]['id']
+        yield [row for row in rows if shard_for(row['question_id']) != alias]
+
+
+def move_rows(source, rows):
+    """
+    Copy rows to their shards, then delete them from source. The copy is
+    committed first and skips ids already there, so an interrupted move is
+    finished by running it again.
+    """
+    by_target = {}
+    for row in rows:
+        by_target.setdefault(shard_for(row['question_id']), []).append(row)
+    for target, group in by_target.items():
+        with transaction.atomic(using=target):
+            Answer.objects.using(target).bulk_create(
+                [Answer(**row) for row in group], ignore_conflicts=True
+            )
+    with transaction.atomic(using=source):
+        Answer.objects.using(source).filter(id__in=[row['id'] for row in rows]).delete()
+    return {target: len(group) for target, group in by_target.items()}
+
+
+def rebalance(chunk_size=CHUNK_SIZE, dry_run=False, log=None):
+    """
+    Move every answer to the shard its question hashes to: off the default
+    database when sharding is first enabled, and onto new shards after
+    ANSWER_SHARDS grows. Returns {(source, target): rows}.
+    """
+    log = log or (lambda message: None)
+    moved = {}
+    for source in [DEFAULT_DB_ALIAS, *settings.ANSWER_SHARD_ALIASES]:
+        if not has_answer_table(source):
+            continue  # a shard not set up yet (dry run): nothing on it
+        for rows in misplaced(source, chunk_size):
+            if not rows:
+                continue
+            if dry_run:
+                counts = {}
+                for row in rows:
+                    target = shard_for(row['question_id'])
+                    counts[target] = counts.get(target, 0) + 1
+            else:
+                counts = move_rows(source, rows)
+            for target, n in counts.items():
+                moved[source, target] = moved.get((source, target), 0) + n
+        log(f"{source}: {sum(n for (s, _), n in moved.items() if s == source)} answers "
+            f"{'to move' if dry_run else 'moved'}")
+    return moved
@@ -0,0 +1,252 @@
+import mimetypes
+import os
+import re
+from email.utils import formatdate, parsedate_to_datetime
+from wsgiref.headers import Headers
+
+from django.conf import settings
+
+
+# Filenames produced by ManifestStaticFilesStorage, e.g. style.3f2a9c1d04be.css
+HASHED_NAME_RE = re.compile(r'\.[0-9a-f]{12}\.[^/.]+$')
+
+# Encodings we look for next to a static file, in order of preference
+ENCODINGS = [('br', '.br'), ('gzip', '.gz')]
+
+BLOCK_SIZE = 64 * 1024
+IMMUTABLE_MAX_AGE = 365 * 24 * 60 * 60
+
+# parse_range() result for a valid range that starts past the end of the file
+UNSATISFIABLE = object()
+
+
+class StaticFile:
+    """A file on disk along with the headers needed to serve it"""
+
+    def __init__(self, path, url_path, max_age):
+        self.path = path
+        stat = os.stat(path)
+        self.size = stat.st_size
+        self.mtime = stat.st_mtime
+        self.etag = f'"{int(stat.st_mtime):x}-{stat.st_size:x}"'
+        self.last_modified = formatdate(stat.st_mtime, usegmt=True)
+
+        content_type, _ = mimetypes.guess_type(path)
+        if content_type is None:
+            content_type = 'application/octet-stream'
+        elif content_type.startswith('text/') or content_type in (
+            'application/javascript', 'application/json', 'image/svg+xml',
+        ):
+            content_type += '; charset=utf-8'
+        self.content_type = content_type
+
+        if HASHED_NAME_RE.search(url_path):
+            self.cache_control = f'public, max-age={IMMUTABLE_MAX_AGE}, immutable'
+        else:
+            self.cache_control = f'public, max-age={max_age}'
+
+        # encoding -> (path, size) for precompressed variants built at collectstatic time
+        self.variants = {}
+        for encoding, suffix in ENCODINGS:
+            variant_path = path + suffix
+            if os.path.isfile(variant_path):
+                self.variants[encoding] = (variant_path, os.path.getsize(variant_path))
+
+    def is_stale(self):
+        try:
+            return os.stat(self.path).st_mtime != self.mtime
+        except OSError:
+            return True
+
+
+class StaticFilesApplication:
+    """
+    WSGI wrapper that serves STATIC_ROOT and MEDIA_ROOT before the request
+    reaches Django, so workers don't run the middleware stack for assets.
+    Supports precompressed variants, conditional requests, byte ranges and
+    the server's wsgi.file_wrapper (sendfile under gunicorn).
+    """
+
+    def __init__(self, application):
+        self.application = application
+        self.mounts = []
+        for url, root, max_age in (
+            (settings.STATIC_URL, settings.STATIC_ROOT, settings.STATIC_FILES_MAX_AGE),
+            (settings.MEDIA_URL, settings.MEDIA_ROOT, settings.MEDIA_FILES_MAX_AGE),
+        ):
+            if url and root and url.startswith('/'):
+                self.mounts.append((url, os.path.realpath(root), max_age))
+        self.files = {}
+
+    def __call__(self, environ, start_response):
+        path = environ.get('PATH_INFO', '')
+        for url, root, max_age in self.mounts:
+            if path.startswith(url):
+                static_file = self.find_file(path, url, root, max_age)
+                if static_file is not None:
+                    return self.serve(static_file, environ, start_response)
+                break
+        return self.application(environ, start_response)
+
+    def find_file(self, path, url, root, max_age):
+        static_file = self.files.get(path)
+        if static_file is not None and not static_file.is_stale():
+            return static_file
+
+        relative = path[len(url):]
+        full_path = os.path.realpath(os.path.join(root, relative))
+        # Refuse anything that escapes the mount (e.g. ../ in the path)
+        if not full_path.startswith(root + os.sep) or not os.path.isfile(full_path):
+            self.files.pop(path, None)
+            return None
+
+        static_file = StaticFile(full_path, relative, max_age)
+        self.files[path] = static_file
+        return static_file
+
+    def serve(self, static_file, environ, start_response):
+        method = environ['REQUEST_METHOD']
+        if method not in ('GET', 'HEAD'):
+            start_response('405 Method Not Allowed', [('Allow', 'GET, HEAD')])
+            return [b'']
+
+        headers = Headers([
+            ('Cache-Control', static_file.cache_control),
+            ('Last-Modified', static_file.last_modified),
+            ('Accept-Ranges', 'bytes'),
+        ])
+        if static_file.variants:
+            headers['Vary'] = 'Accept-Encoding'
+
+        if self.not_modified(static_file, environ):
+            headers['ETag'] = static_file.etag
+            start_response('304 Not Modified', headers.items())
+            return [b'']
+
+        path, size = static_file.path, static_file.size
+        encoding = self.choose_encoding(static_file, environ)
+        if encoding is not None:
+            path, size = static_file.variants[encoding]
+            headers['Content-Encoding'] = encoding
+            # Each representation needs its own validator
+            headers['ETag'] = static_file.etag[:-1] + f'-{encoding}"'
+        else:
+            headers['ETag'] = static_file.etag
+        headers['Content-Type'] = static_file.content_type
+
+        start, end = 0, size - 1
+        status = '200 OK'
+        range_header = environ.get('HTTP_RANGE')
+        if range_header and encoding is None and self.range_applies(static_file, environ):
+            byte_range = self.parse_range(range_header, size)
+            if byte_range is UNSATISFIABLE:
+                headers['Content-Range'] = f'bytes */{size}'
+                start_response('416 Range Not Satisfiable', headers.items())
+                return [b'']
+            if byte_range is not None:
+                start, end = byte_range
+                status = '206 Partial Content'
+                headers['Content-Range'] = f'bytes {start}-{end}/{size}'
+
+        length = max(end - start + 1, 0)
+        headers['Content-Length'] = str(length)
+        start_response(status, headers.items())
+
+        if method == 'HEAD' or length == 0:
+            return [b'']
+
+        f = open(path, 'rb')
+        if start == 0 and length == size:
+            file_wrapper = environ.get('wsgi.file_wrapper')
+            if file_wrapper is not None:
+                return file_wrapper(f, BLOCK_SIZE)
+            return iter_file(f, length)
+        f.seek(start)
+        return iter_file(f, length)
+
+    @staticmethod
+    def not_modified(static_file, environ):
+        if_none_match = environ.get('HTTP_IF_NONE_MATCH')
+        if if_none_match is not None:
+            tags = {tag.strip().removeprefix('W/') for tag in if_none_match.split(',')}
+            return '*' in tags or any(
+                tag == static_file.etag or tag.startswith(static_file.etag[:-1] + '-')
+                for tag in tags
+            )
+
+        if_modified_since = environ.get('HTTP_IF_MODIFIED_SINCE')
+        if if_modified_since is not None:
+            try:
+                since = parsedate_to_datetime(if_modified_since).timestamp()
+            except (TypeError, ValueError):
+                return False
+            return int(static_file.mtime) <= since
+        return False
+
+    @staticmethod
+    def choose_encoding(static_file, environ):
+        accept_encoding = environ.get('HTTP_ACCEPT_ENCODING', '')
+        if not accept_encoding or not static_file.variants:
+            return None
+
+        accepted = set()
+        for item in accept_encoding.split(','):
+            token, _, params = item.strip().partition(';')
+            if params.replace(' ', '') in ('q=0', 'q=0.0', 'q=0.00', 'q=0.000'):
+                continue
+            accepted.add(token.strip().lower())
+
+        for encoding, _ in ENCODINGS:
+            if encoding in static_file.variants and encoding in accepted:
+                return encoding
+        return None
+
+    @staticmethod
+    def range_applies(static_file, environ):
+        if_range = environ.get('HTTP_IF_RANGE')
+        return if_range is None or if_range in (static_file.etag, static_file.last_modified)
+
+    @staticmethod
+    def parse_range(range_header, size):
+        """
+        Parse a single "bytes=start-end" or "bytes=-suffix" range. Returns
+        (start, end), UNSATISFIABLE, or None for a header that is invalid or
+        asks for several ranges: RFC 9110 says to ignore those and send the
+        whole file with a 200.
+        """
+        units, _, spec = range_header.partition('=')
+        if units.strip().lower() != 'bytes' or ',' in spec:
+            return None
+
+        first, dash, last = spec.strip().partition('-')
+        first, last = first.strip(), last.strip()
+        if not dash or not (first.isdigit() or first == '') or not (last.isdigit() or last == ''):
+            return None
+        if first == '':
+            if last == '':
+                return None
+            # Suffix range: the last N bytes
+            suffix = int(last)
+            if suffix == 0 or size == 0:
+                return UNSATISFIABLE
+            return max(size - suffix, 0), size - 1
+
+        start = int(first)
+        if last and int(last) < start:
+            return None
+        if start >= size:
+            return UNSATISFIABLE
+        end = min(int(last), size - 1) if last else size - 1
+        return start, end
+
+
+def iter_file(f, length):
+    try:
+        while length > 0:
+            chunk = f.read(min(BLOCK_SIZE, length))
+            if not chunk:
+                break
+            length -= len(chunk)
+            yield chunk
+    finally:
+        f.close()
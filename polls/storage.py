@@ -0,0 +1,64 @@
+import gzip
+import os
+
+from django.contrib.staticfiles.storage import ManifestStaticFilesStorage
+
+try:
+    import brotli
+except ImportError:  # Brotli is optional, gzip variants are always built
+    brotli = None
+
+
+# File types worth compressing. Images and fonts are already compressed.
+COMPRESSIBLE_EXTENSIONS = {
+    '.css', '.js', '.mjs', '.map', '.json', '.svg', '.html', '.txt', '.xml', '.ico',
+}
+
+# Skip variants that don't save at least 5% over the original.
+MIN_COMPRESSION_RATIO = 0.95
+
+
+class CompressedManifestStaticFilesStorage(ManifestStaticFilesStorage):
+    """
+    Manifest storage with content-hashed filenames that also writes
+    precompressed .gz and .br variants during collectstatic.
+    """
+
+    # Fall back to the unhashed name instead of raising when a file
+    # is missing from the manifest (e.g. before the first collectstatic).
+    manifest_strict = False
+
+    def post_process(self, paths, dry_run=False, **options):
+        yield from super().post_process(paths, dry_run=dry_run, **options)
+
+        if dry_run:
+            return
+
+        names = set(paths)
+        names.update(self.hashed_files.values())
+        for name in sorted(names):
+            if self._is_compressible(name) and self.exists(name):
+                self._write_compressed_variants(name)
+
+    def _is_compressible(self, name):
+        return os.path.splitext(name)[1].lower() in COMPRESSIBLE_EXTENSIONS
+
+    def _write_compressed_variants(self, name):
+        path = self.path(name)
+        with open(path, 'rb') as f:
+            data = f.read()
+
+        if not data:
+            return
+
+        # mtime=0 keeps the .gz output byte-identical between builds
+        variants = [('.gz', gzip.compress(data, compresslevel=9, mtime=0))]
+        if brotli is not None:
+            variants.append(('.br', brotli.compress(data, quality=11)))
+
+        for suffix, compressed in variants:
+            if len(compressed) < len(data) * MIN_COMPRESSION_RATIO:
+                with open(path + suffix, 'wb') as f:
+                    f.write(compressed)
+            elif os.path.exists(path + suffix):
+                os.remove(path + suffix)
@@ -0,0 +1,47 @@
+from django.http import StreamingHttpResponse
+from django.template import Context
+from django.template.loader import get_template, render_to_string
+
+
+# Placed in a page template where the streamed rows go
+ROWS_MARKER = '<!-- stream:rows -->'
+DEFAULT_CHUNK_SIZE = 100
+
+
+def render_rows(template_name, rows, context, chunk_size=DEFAULT_CHUNK_SIZE):
+    """
+    Render each row with template_name (the row is available as `entry`) and
+    yield the output in chunks of chunk_size rows. The template is compiled
+    once and rendered against one plain Context, so no context processors run
+    per row; pass anything the row template needs in context.
+    """
+    template = get_template(template_name).template
+    row_context = Context(context)
+    buffer = []
+    for row in rows:
+        with row_context.push(entry=row):
+            buffer.append(template.render(row_context))
+        if len(buffer) >= chunk_size:
+            yield ''.join(buffer)
+            buffer = []
+    if buffer:
+        yield ''.join(buffer)
+
+
+def stream_page(request, template_name, context, row_template, rows, chunk_size=DEFAULT_CHUNK_SIZE):
+    """
+    StreamingHttpResponse for a page whose template contains ROWS_MARKER.
+    Everything before the marker is sent straight away, the rows follow as
+    they come off rows (typically a QuerySet.iterator()), then the rest of
+    the page. Time to first byte and memory don't depend on the row count.
+    """
+    page = render_to_string(template_name, {**context, 'streaming': True}, request)
+    head, tail = page.split(ROWS_MARKER, 1)
+    row_context = {'user': request.user, **context}
+
+    def generate():
+        yield head
+        yield from render_rows(row_template, rows, row_context, chunk_size)
+        yield tail
+
+    return StreamingHttpResponse(generate(), content_type='text/html; charset=utf-8')
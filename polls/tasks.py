@@ -0,0 +1,250 @@
+import functools
+import logging
+import os
+import random
+import socket
+import threading
+import traceback
+import uuid
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import IntegrityError, close_old_connections, connection, transaction
+from django.utils import timezone
+from django.utils.module_loading import import_string
+
+from .models import Task
+
+
+logger = logging.getLogger('polls.tasks')
+
+
+class TaskFunction:
+    """A function that can be run in the background with .delay()"""
+
+    def __init__(self, func, max_attempts=None):
+        functools.update_wrapper(self, func)
+        self.func = func
+        self.name = f'{func.__module__}.{func.__qualname__}'
+        self.max_attempts = max_attempts
+
+    def __call__(self, *args, **kwargs):
+        return self.func(*args, **kwargs)
+
+    def delay(self, *args, dedup_key=None, countdown=0, **kwargs):
+        enqueue(
+            self.name, args, kwargs,
+            dedup_key=dedup_key, countdown=countdown, max_attempts=self.max_attempts,
+        )
+
+
+def task(func=None, *, max_attempts=None):
+    """
+    Decorator for background tasks. Arguments must be JSON serializable.
+
+        @task
+        def rebuild_something(question_id):
+            ...
+
+        rebuild_something.delay(question_id, dedup_key=f'rebuild:{question_id}')
+    """
+    if func is None:
+        return functools.partial(task, max_attempts=max_attempts)
+    return TaskFunction(func, max_attempts)
+
+
+def enqueue(name, args=(), kwargs=None, dedup_key=None, countdown=0, max_attempts=None):
+    """
+    Queue a task with a single INSERT. If a task with the same dedup_key is
+    already pending the insert is silently skipped.
+    """
+    row = Task(
+        name=name,
+        args=list(args),
+        kwargs=kwargs or {},
+        dedup_key=dedup_key,
+        run_at=timezone.now() + timedelta(seconds=countdown),
+        max_attempts=max_attempts or settings.TASK_MAX_ATTEMPTS,
+    )
+    Task.objects.bulk_create([row], ignore_conflicts=dedup_key is not None)
+
+
+def retry_delay(attempts):
+    """Exponential backoff with jitter: roughly base, 2 x base, 4 x base... capped"""
+    delay = min(settings.TASK_RETRY_MAX_DELAY, settings.TASK_RETRY_BASE_DELAY * 2 ** (attempts - 1))
+    return delay * random.uniform(0.5, 1.0)
+
+
+def claim(worker_id, batch_size):
+    """
+    Mark up to batch_size due tasks as running for this worker and return them.
+
+    PostgreSQL uses SELECT ... FOR UPDATE SKIP LOCKED so concurrent workers
+    never wait on each other. SQLite has no row locks, but every write holds
+    the database lock, so a single UPDATE ... WHERE id IN (SELECT ... LIMIT n)
+    claims rows atomically; the claim token then finds the rows it took.
+    """
+    now = timezone.now()
+    token = f'{worker_id}:{uuid.uuid4().hex[:8]}'
+    due = Task.objects.filter(status=Task.PENDING, run_at__lte=now).order_by('run_at')
+
+    if connection.features.has_select_for_update_skip_locked:
+        with transaction.atomic():
+            ids = list(
+                due.select_for_update(skip_locked=True).values_list('id', flat=True)[:batch_size]
+            )
+            if not ids:
+                return []
+            Task.objects.filter(id__in=ids).update(status=Task.RUNNING, locked_by=token, locked_at=now)
+    else:
+        claimed = Task.objects.filter(id__in=due.values('id')[:batch_size]).update(
+            status=Task.RUNNING, locked_by=token, locked_at=now
+        )
+        if not claimed:
+            return []
+    return list(Task.objects.filter(locked_by=token, status=Task.RUNNING).order_by('run_at'))
+
+
+def claimed(row):
+    """The task, only while this worker still holds it (it may have been requeued)"""
+    return Task.objects.filter(id=row.id, status=Task.RUNNING, locked_by=row.locked_by)
+
+
+def renew(row):
+    """Push back a claimed task's locked_at; False if another worker has it now"""
+    row.locked_at = timezone.now()
+    return bool(claimed(row).update(locked_at=row.locked_at))
+
+
+class Heartbeat(threading.Thread):
+    """Renews a running task's lock, so requeue_stale() leaves long tasks alone"""
+
+    def __init__(self, row):
+        super().__init__(name=f'heartbeat {row.id}', daemon=True)
+        self.row = row
+        self.stopped = threading.Event()
+
+    def run(self):
+        try:
+            while not self.stopped.wait(settings.TASK_LOCK_TIMEOUT / 3):
+                renew(self.row)
+        finally:
+            connection.close()
+
+    def stop(self):
+        self.stopped.set()
+        self.join()
+
+
+def finish(row, error=None):
+    """
+    Delete a task that succeeded; schedule a retry or mark failed otherwise.
+    Does nothing if the task was requeued and another worker holds it now.
+    """
+    if error is None:
+        if not claimed(row).delete()[0]:
+            logger.warning('Task %s (%s) was taken over by another worker', row.id, row.name)
+        return
+
+    attempts = row.attempts + 1
+    if attempts >= row.max_attempts:
+        claimed(row).update(status=Task.FAILED, attempts=attempts, last_error=error, locked_by='')
+        logger.error('Task %s (%s) failed after %d attempts', row.id, row.name, attempts)
+        return
+
+    try:
+        with transaction.atomic():
+            claimed(row).update(
+                status=Task.PENDING,
+                attempts=attempts,
+                last_error=error,
+                locked_by='',
+                run_at=timezone.now() + timedelta(seconds=retry_delay(attempts)),
+            )
+    except IntegrityError:
+        # An identical task was queued meanwhile and will do the work
+        claimed(row).delete()
+    logger.warning('Task %s (%s) failed, attempt %d/%d', row.id, row.name, attempts, row.max_attempts)
+
+
+def execute(row):
+    """
+    Run a claimed task. Returns False without running it if it was requeued
+    while waiting behind the rest of this worker's batch.
+    """
+    if not renew(row):
+        return False
+    heartbeat = Heartbeat(row)
+    heartbeat.start()
+    try:
+        func = import_string(row.name)
+        getattr(func, 'func', func)(*row.args, **row.kwargs)
+    except Exception:
+        error = traceback.format_exc()
+    else:
+        error = None
+    finally:
+        heartbeat.stop()
+    finish(row, error)
+    return True
+
+
+def requeue_stale():
+    """
+    Put back tasks whose worker died mid-run: running tasks' locks are renewed
+    by a heartbeat, so one untouched for TASK_LOCK_TIMEOUT has no worker
+    """
+    cutoff = timezone.now() - timedelta(seconds=settings.TASK_LOCK_TIMEOUT)
+    requeued = 0
+    for row in Task.objects.filter(status=Task.RUNNING, locked_at__lt=cutoff):
+        row.attempts += 1
+        try:
+            with transaction.atomic():
+                Task.objects.filter(id=row.id, status=Task.RUNNING, locked_at__lt=cutoff).update(
+                    status=Task.PENDING if row.attempts < row.max_attempts else Task.FAILED,
+                    attempts=row.attempts,
+                    last_error='Worker stopped responding',
+                    locked_by='',
+                )
+        except IntegrityError:
+            Task.objects.filter(id=row.id).delete()
+        requeued += 1
+    return requeued
+
+
+class Worker:
+    """Claims and runs tasks in a loop until stopped"""
+
+    # Seconds between checks for tasks abandoned by dead workers
+    STALE_CHECK_INTERVAL = 60
+
+    def __init__(self, batch_size=10, poll_interval=1.0, burst=False, stop_event=None):
+        self.batch_size = batch_size
+        self.poll_interval = poll_interval
+        self.burst = burst
+        self.stop_event = stop_event or threading.Event()
+        # Set by run(): workers are often built in one thread and run in another
+        self.id = None
+        self.processed = 0
+
+    def run(self):
+        self.id = f'{socket.gethostname()}:{os.getpid()}:{threading.get_ident()}'
+        last_stale_check = 0.0
+        try:
+            while not self.stop_event.is_set():
+                close_old_connections()
+                now = timezone.now().timestamp()
+                if now - last_stale_check >= self.STALE_CHECK_INTERVAL:
+                    requeue_stale()
+                    last_stale_check = now
+
+                rows = claim(self.id, self.batch_size)
+                for row in rows:
+                    if execute(row):
+                        self.processed += 1
+                if not rows:
+                    if self.burst:
+                        return
+                    self.stop_event.wait(self.poll_interval)
+        finally:
+            connection.close()
@@ -1,3 +1,1497 @@
-from django.test import TestCase
+import csv
+import gzip
+import io
+import json
+import os
+import random
+import runpy
+import shutil
+import tempfile
+import threading
+import time
+from datetime import timedelta
+from pathlib import Path
+from unittest import mock, skipUnless
 
-# Create your tests here.
+import numpy as np
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import DatabaseError, connection, connections
+from django.http import StreamingHttpResponse
+from django.test.utils import CaptureQueriesContext
+from django.test import RequestFactory, SimpleTestCase, TestCase, TransactionTestCase, override_settings
+from django.utils import timezone
+
+from . import agreement, answered, archive, caching, columnar, dedup, export, jobs, loadtest, metrics, moderation, profiling, purge, recommender, rollups, search, sharding, tasks, trending, views, warmup
+from .datagen import generate_dataset
+from .middleware import MetricsMiddleware, QueryInstrumentationMiddleware
+from .models import Answer, AnswerQuerySet, ArchivedAnswer, Question, Recommendation, Task, TrendingScore, User, VoteRollup
+from .static_serving import StaticFilesApplication
+
+
+# Rendered pages reference static files; the manifest only exists after collectstatic
+PLAIN_STORAGES = {
+    'default': {'BACKEND': 'django.core.files.storage.FileSystemStorage'},
+    'staticfiles': {'BACKEND': 'django.contrib.staticfiles.storage.StaticFilesStorage'},
+}
+
+calls = []
+
+
+@tasks.task
+def record_call(value):
+    calls.append(value)
+
+
+@tasks.task(max_attempts=2)
+def always_fail():
+    raise ValueError('boom')
+
+
+@tasks.task
+def outlive_lock_timeout():
+    time.sleep(settings.TASK_LOCK_TIMEOUT * 2)
+    calls.append(tasks.requeue_stale())
+
+
+class AnswerTestCase(TestCase):
+    """For tests that read or write answers, which are on the shards when ANSWER_SHARDS is set"""
+    databases = {'default', *settings.ANSWER_SHARD_ALIASES}
+
+    def _should_check_constraints(self, connection):
+        # Shards hold answers without the users and questions they point at
+        return connection.alias not in settings.ANSWER_SHARD_ALIASES and super()._should_check_constraints(connection)
+
+
+def make_votes(users=3, questions=2, age=timedelta(hours=2)):
+    """Users who each answered every question, optionOne on the first"""
+    answered_at = timezone.now() - age
+    players = [User.objects.create(username=f'player{i}') for i in range(users)]
+    asked = [
+        Question.objects.create(author=players[0], option_one_text=f'a{i}', option_two_text=f'b{i}')
+        for i in range(questions)
+    ]
+    for player in players:
+        for question in asked:
+            Answer.objects.create(
+                user=player, question=question, answered_at=answered_at,
+                option_selected='optionOne' if question == asked[0] else 'optionTwo',
+            )
+    return players, asked
+
+
+# ============================================================================
+# STATIC FILES
+# ============================================================================
+
+class StaticRangeTests(SimpleTestCase):
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        Path(directory.name, 'app.js').write_bytes(b'0123456789')
+        with override_settings(STATIC_ROOT=directory.name, MEDIA_ROOT=''):
+            self.app = StaticFilesApplication(lambda environ, start_response: [b'django'])
+
+    def get(self, range_header):
+        response = {}
+
+        def start_response(status, headers):
+            response['status'] = status
+            response['headers'] = dict(headers)
+
+        body = b''.join(self.app({
+            'REQUEST_METHOD': 'GET', 'PATH_INFO': '/static/app.js', 'HTTP_RANGE': range_header,
+        }, start_response))
+        return response['status'], response['headers'], body
+
+    def test_single_range(self):
+        status, headers, body = self.get('bytes=2-4')
+        self.assertEqual(status, '206 Partial Content')
+        self.assertEqual(headers['Content-Range'], 'bytes 2-4/10')
+        self.assertEqual(body, b'234')
+
+    def test_suffix_range(self):
+        status, _, body = self.get('bytes=-3')
+        self.assertEqual(status, '206 Partial Content')
+        self.assertEqual(body, b'789')
+
+    def test_unsatisfiable_range(self):
+        status, headers, _ = self.get('bytes=20-')
+        self.assertEqual(status, '416 Range Not Satisfiable')
+        self.assertEqual(headers['Content-Range'], 'bytes */10')
+
+    def test_multiple_and_invalid_ranges_are_ignored(self):
+        for range_header in ('bytes=0-1,4-5', 'bytes=abc', 'bytes=5-2', 'lines=1-2', 'bytes=--3'):
+            with self.subTest(range_header=range_header):
+                status, headers, body = self.get(range_header)
+                self.assertEqual(status, '200 OK')
+                self.assertNotIn('Content-Range', headers)
+                self.assertEqual(body, b'0123456789')
+
+
+# ============================================================================
+# LOAD DATA
+# ============================================================================
+
+class GenerateDatasetTests(AnswerTestCase):
+    def test_counts_and_unique_answers(self):
+        counts = generate_dataset(users=5, questions=8, answers=30, seed=1, batch_size=7)
+        self.assertEqual(counts, {'users': 5, 'questions': 8, 'answers': 30})
+        self.assertEqual(User.objects.count(), 5)
+        self.assertEqual(Question.objects.count(), 8)
+        pairs = sharding.all_rows(Answer.objects.all(), 'user_id', 'question_id')
+        self.assertEqual(len(pairs), 30)
+        self.assertEqual(len(set(pairs)), 30)
+
+
+# ============================================================================
+# NEAR-DUPLICATE QUESTIONS
+# ============================================================================
+
+class DuplicateQuestionTests(TestCase):
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.enterContext(override_settings(DEDUP_INDEX_DIR=directory.name))
+        dedup._index = None
+        self.addCleanup(setattr, dedup, '_index', None)
+        self.author = User.objects.create(username='author')
+        self.question = Question.objects.create(
+            author=self.author, option_one_text='Fly every day', option_two_text='Teleport once a week',
+        )
+
+    def matches(self, one, two):
+        return [question for question, _ in dedup.find_duplicates(one, two)]
+
+    def test_finds_near_duplicates(self):
+        self.assertEqual(self.matches('fly every day!', 'teleport once a week'), [self.question])
+        self.assertEqual(self.matches('Cook like a chef', 'Sing like a pro'), [])
+
+    def test_hidden_questions_are_skipped(self):
+        Question.objects.filter(id=self.question.id).update(is_hidden=True)
+        self.assertEqual(self.matches('Fly every day', 'Teleport once a week'), [])
+
+    def test_edits_are_reindexed(self):
+        self.matches('Fly every day', 'Teleport once a week')
+        self.question.option_one_text, self.question.option_two_text = 'Cook like a chef', 'Sing like a pro'
+        self.question.save()
+        self.assertEqual(self.matches('Fly every day', 'Teleport once a week'), [])
+        self.assertEqual(self.matches('Cook like a chef', 'Sing like a pro'), [self.question])
+
+    def test_edits_from_other_processes_are_rechecked(self):
+        self.matches('Fly every day', 'Teleport once a week')
+        # No post_save in this process, as for an edit made elsewhere
+        Question.objects.filter(id=self.question.id).update(option_one_text='Read minds for a year')
+        self.assertEqual(self.matches('Fly every day', 'Teleport once a week'), [])
+
+
+# ============================================================================
+# SEARCH
+# ============================================================================
+
+class SearchTests(TestCase):
+    def test_hidden_questions_do_not_use_up_the_limit(self):
+        author = User.objects.create(username='author')
+        for i in range(5):
+            Question.objects.create(
+                author=author, option_one_text=f'Swim {i}', option_two_text='Run', is_hidden=i < 3,
+            )
+        results = search.search_questions('swim', limit=2)
+        self.assertEqual(len(results), 2)
+        self.assertFalse(any(question.is_hidden for question in results))
+
+    def test_prefix_match(self):
+        author = User.objects.create(username='author')
+        question = Question.objects.create(author=author, option_one_text='Become invisible', option_two_text='Fly')
+        self.assertEqual(search.search_questions('invis'), [question])
+        self.assertEqual(search.search_questions('invis', prefix=False), [])
+
+
+# ============================================================================
+# REQUEST INSTRUMENTATION
+# ============================================================================
+
+@override_settings(REQUEST_INSTRUMENTATION=True, REQUEST_INSTRUMENTATION_SAMPLE_RATE=1.0)
+class QueryInstrumentationTests(TestCase):
+    def test_streamed_body_queries_are_logged(self):
+        def view(request):
+            User.objects.count()
+
+            def body():
+                yield str(User.objects.count())
+                yield str(Question.objects.count())
+
+            return StreamingHttpResponse(body())
+
+        response = QueryInstrumentationMiddleware(view)(RequestFactory().get('/stream/'))
+        self.assertIn('desc="1 queries"', response['Server-Timing'])
+        with self.assertLogs('polls.instrumentation') as logs:
+            self.assertEqual(b''.join(response.streaming_content), b'00')
+        record = json.loads(logs.records[0].getMessage())
+        self.assertEqual((record['queries'], record['streaming']), (3, True))
+
+
+# ============================================================================
+# METRICS
+# ============================================================================
+
+class MetricsFileTests(SimpleTestCase):
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.directory = directory.name
+
+    def registry(self):
+        registry = metrics.Registry()
+        return registry, registry.counter('test_total', 'Test'), registry.histogram('test_seconds', 'Test')
+
+    def test_dead_worker_totals_are_kept(self):
+        with override_settings(METRICS_MULTIPROC_DIR=self.directory):
+            registry, counter, histogram = self.registry()
+            counter.inc(3)
+            histogram.observe(0.2)
+            registry.flush()
+            Path(self.directory, 'metrics-999999.json').write_text(json.dumps({
+                'test_total': {'[]': 4},
+                'test_seconds': {'[]': [0] * 12 + [1.5, 1]},
+            }))
+            metrics.mark_process_dead(999999)
+            self.assertFalse(Path(self.directory, 'metrics-999999.json').exists())
+
+            values = registry.collect()
+            self.assertEqual(values['test_total'], {(): 7})
+            self.assertEqual(values['test_seconds'][()][-2:], [1.7, 2])
+
+    def test_leftover_file_of_a_reused_pid_is_folded_in(self):
+        with override_settings(METRICS_MULTIPROC_DIR=self.directory):
+            registry, counter, _ = self.registry()
+            counter.inc(5)
+            registry.flush()
+            fresh, counter, _ = self.registry()
+            counter.inc(1)
+            fresh.flush()
+            self.assertEqual(fresh.collect()['test_total'], {(): 6})
+
+
+class MetricsMiddlewareTests(TestCase):
+    @override_settings(METRICS_ENABLED=True)
+    def test_streamed_body_is_measured_when_it_ends(self):
+        def rows():
+            yield str(User.objects.count()).encode()
+            yield str(Question.objects.count()).encode()
+
+        def view(request):
+            request.resolver_match = mock.Mock(view_name='streamed')
+            return StreamingHttpResponse(rows())
+
+        with mock.patch.object(metrics.DB_QUERIES, 'inc') as inc, \
+                mock.patch.object(metrics.REQUEST_LATENCY, 'observe') as observe:
+            response = MetricsMiddleware(view)(RequestFactory().get('/streamed/'))
+            observe.assert_not_called()
+            self.assertEqual(b''.join(response.streaming_content), b'00')
+        inc.assert_called_once_with(2, view='streamed')
+        observe.assert_called_once_with(mock.ANY, view='streamed')
+
+
+class MetricsViewTests(TestCase):
+    @override_settings(METRICS_TOKEN=None)
+    def test_staff_only_without_token(self):
+        self.assertEqual(self.client.get('/metrics/').status_code, 403)
+        self.client.force_login(User.objects.create(username='staff', is_staff=True))
+        self.assertEqual(self.client.get('/metrics/').status_code, 200)
+
+    @override_settings(METRICS_TOKEN='secret')
+    def test_token(self):
+        self.assertEqual(self.client.get('/metrics/').status_code, 401)
+        response = self.client.get('/metrics/', headers={'Authorization': 'Bearer secret'})
+        self.assertEqual(response.status_code, 200)
+
+
+# ============================================================================
+# PROFILING
+# ============================================================================
+
+@override_settings(STORAGES=PLAIN_STORAGES)
+class ProfilingTests(AnswerTestCase):
+    def setUp(self):
+        cache.clear()
+        directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, directory, ignore_errors=True)
+        self.enterContext(override_settings(PROFILE_DIR=Path(directory), PROFILE_SAMPLE_INTERVAL_MS=1))
+        make_votes()
+
+    def test_only_staff_requests_are_profiled(self):
+        self.client.force_login(User.objects.create(username='player'))
+        response = self.client.get('/leaderboard/', {'profile': '1'})
+        self.assertEqual(response.status_code, 200)
+        self.assertNotIn('X-Profile-Id', response)
+        b''.join(response.streaming_content)
+        self.assertEqual(profiling.recent(), [])
+
+        self.client.force_login(User.objects.create_superuser('admin', 'admin@example.com', 'pw'))
+        response = self.client.get('/leaderboard/', {'profile': '1'})
+        # The leaderboard streams; its profile is saved once the body is sent
+        b''.join(response.streaming_content)
+        profile_id = response['X-Profile-Id']
+        self.assertEqual([profile['id'] for profile in profiling.recent()], [profile_id])
+        self.assertEqual(profiling.load(profile_id)['view'], 'leaderboard')
+        self.assertContains(self.client.get('/admin/profiles/'), response['X-Profile-Url'])
+        self.assertEqual(self.client.get(response['X-Profile-Url']).status_code, 200)
+
+    def test_samples_are_classified_by_their_innermost_phase(self):
+        view = 'leaderboard_view (polls/views.py:1)'
+        render = 'Template.render (django/template/base.py:1)'
+        compile_sql = 'SQLCompiler.as_sql (django/db/models/sql/compiler.py:1)'
+        execute = 'CursorWrapper.execute (django/db/backends/utils.py:1)'
+        results = 'SQLCompiler.results_iter (django/db/models/sql/compiler.py:1)'
+        cases = [
+            ([view], 'python'),
+            ([view, render], 'template'),
+            ([view, render, compile_sql], 'orm compile'),
+            ([view, render, compile_sql, execute], 'database'),
+            ([view, results], 'python'),
+        ]
+        for frames, phase in cases:
+            with self.subTest(frames=frames[-1]):
+                self.assertEqual(profiling.phase(frames), phase)
+
+        summary = profiling.summarize({
+            'stacks': {f'{view};{render}': 3, f'{view};{compile_sql};{execute}': 1},
+            'samples': 4, 'duration_ms': 40.0,
+        })
+        self.assertEqual(
+            [(row['function'], row['ms']) for row in summary['phases']],
+            [('template', 30.0), ('database', 10.0)],
+        )
+        self.assertEqual(summary['by_total'][0], {'function': view, 'samples': 4, 'share': 1.0, 'ms': 40.0})
+
+
+# ============================================================================
+# WORKER BOOT
+# ============================================================================
+
+class ReadinessTests(SimpleTestCase):
+    databases = {'default'}
+
+    def setUp(self):
+        self.enterContext(mock.patch.dict(warmup._state, {'warm': False, 'steps': {}, 'pid': None}))
+        self.enterContext(mock.patch.dict(warmup._last_check, {'at': None}))
+
+    def test_ready_once_warm(self):
+        response = self.client.get('/ready/')
+        self.assertEqual(response.status_code, 503)
+        self.assertFalse(response.json()['warm'])
+
+        steps = warmup.warm_up()
+        self.assertEqual(set(steps), {'urls', 'templates', 'databases'})
+        response = self.client.get('/ready/')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()['databases'], {'default': 'ok'})
+
+    def test_database_failure_is_reported(self):
+        warmup._state['warm'] = True
+        with mock.patch.object(connections['default'], 'cursor', side_effect=DatabaseError('unreachable')):
+            response = self.client.get('/ready/')
+        self.assertEqual(response.status_code, 503)
+        self.assertEqual(response.json()['databases'], {'default': 'DatabaseError: unreachable'})
+
+    def test_recent_check_is_reused(self):
+        warmup._state['warm'] = True
+        self.assertTrue(warmup.readiness()['ready'])
+        with CaptureQueriesContext(connection) as queries:
+            self.assertTrue(warmup.readiness()['ready'])
+        self.assertEqual(len(queries), 0)
+
+
+# ============================================================================
+# AGGREGATE CACHE
+# ============================================================================
+
+class CachedTests(SimpleTestCase):
+    def setUp(self):
+        cache.clear()
+
+    def test_computes_once_until_invalidated(self):
+        computed = []
+
+        @caching.cached('test_square', ttl=60, key=lambda n: n)
+        def square(n):
+            computed.append(n)
+            return n * n
+
+        self.assertEqual(square(3), 9)
+        self.assertEqual(square(3), 9)
+        self.assertEqual(square(4), 16)
+        self.assertEqual(computed, [3, 4])
+        square.invalidate(3)
+        self.assertEqual(square(3), 9)
+        self.assertEqual(computed, [3, 4, 3])
+
+    def test_stale_value_is_served_while_refreshing(self):
+        caching.get_cache().set('test_stale', ('old', 0, 0.0), timeout=60)
+        self.assertEqual(caching.fetch('test_stale', lambda: 'new', ttl=60), 'old')
+
+    def test_process_local_cache_is_not_shared(self):
+        self.assertFalse(caching.is_shared())
+        shared = {'default': {'BACKEND': 'django.core.cache.backends.filebased.FileBasedCache', 'LOCATION': '/tmp'}}
+        with override_settings(CACHES=shared):
+            self.assertTrue(caching.is_shared())
+
+    def test_gunicorn_runs_one_worker_without_a_shared_cache(self):
+        hooks = runpy.run_path(str(settings.BASE_DIR / 'gunicorn.conf.py'))
+        server = mock.Mock(num_workers=4)
+        hooks['on_starting'](server)
+        self.assertEqual(server.num_workers, 1)
+        server.log.warning.assert_called_once()
+
+        shared = {'default': {'BACKEND': 'django.core.cache.backends.filebased.FileBasedCache', 'LOCATION': '/tmp'}}
+        server = mock.Mock(num_workers=4)
+        with override_settings(CACHES=shared):
+            hooks['on_starting'](server)
+        self.assertEqual(server.num_workers, 4)
+
+
+# ============================================================================
+# TASK QUEUE
+# ============================================================================
+
+class TaskQueueTests(TransactionTestCase):
+    def setUp(self):
+        calls.clear()
+
+    def test_worker_runs_and_deletes_tasks(self):
+        record_call.delay(1)
+        record_call.delay(2)
+        tasks.Worker(burst=True).run()
+        self.assertEqual(sorted(calls), [1, 2])
+        self.assertFalse(Task.objects.exists())
+
+    def test_worker_id_is_taken_in_the_thread_that_runs_it(self):
+        worker = tasks.Worker(burst=True)
+        thread = threading.Thread(target=worker.run)
+        thread.start()
+        thread.join()
+        self.assertTrue(worker.id.endswith(f':{thread.ident}'))
+        self.assertNotEqual(thread.ident, threading.get_ident())
+
+    def test_dedup_key_queues_one_copy(self):
+        record_call.delay(1, dedup_key='once')
+        record_call.delay(2, dedup_key='once')
+        self.assertEqual(Task.objects.count(), 1)
+
+    def test_failures_retry_then_fail(self):
+        always_fail.delay()
+        row = tasks.claim('test', 10)[0]
+        with self.assertLogs('polls.tasks', 'WARNING'):
+            tasks.execute(row)
+        row.refresh_from_db()
+        self.assertEqual((row.status, row.attempts), (Task.PENDING, 1))
+        self.assertGreater(row.run_at, timezone.now())
+
+        Task.objects.filter(id=row.id).update(run_at=timezone.now())
+        with self.assertLogs('polls.tasks', 'ERROR'):
+            tasks.execute(tasks.claim('test', 10)[0])
+        row.refresh_from_db()
+        self.assertEqual((row.status, row.attempts), (Task.FAILED, 2))
+        self.assertIn('boom', row.last_error)
+
+    def test_requeued_task_is_left_to_its_new_worker(self):
+        record_call.delay(1)
+        stale = tasks.claim('old', 10)[0]
+        # Requeued by requeue_stale() and claimed again while `old` was busy
+        Task.objects.filter(id=stale.id).update(status=Task.PENDING, locked_by='')
+        current = tasks.claim('new', 10)[0]
+
+        self.assertFalse(tasks.execute(stale))
+        with self.assertLogs('polls.tasks', 'WARNING'):
+            tasks.finish(stale)
+        self.assertEqual((calls, Task.objects.get().locked_by), ([], current.locked_by))
+        self.assertTrue(tasks.execute(current))
+        self.assertEqual(calls, [1])
+        self.assertFalse(Task.objects.exists())
+
+    @override_settings(TASK_LOCK_TIMEOUT=0.2)
+    def test_heartbeat_keeps_long_tasks_claimed(self):
+        outlive_lock_timeout.delay()
+        tasks.Worker(burst=True).run()
+        self.assertEqual(calls, [0])
+        self.assertFalse(Task.objects.exists())
+
+
+# ============================================================================
+# VOTING
+# ============================================================================
+
+@override_settings(STORAGES=PLAIN_STORAGES)
+class VoteTests(AnswerTestCase):
+    def setUp(self):
+        cache.clear()
+        self.player = User.objects.create(username='player')
+        self.question = Question.objects.create(author=self.player, option_one_text='a', option_two_text='b')
+        self.client.force_login(self.player)
+
+    def vote(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            return self.client.post(
+                f'/question/{self.question.id}/', {'option_selected': 'optionOne'}, follow=True,
+            )
+
+    def test_vote_queues_aggregate_refresh(self):
+        self.vote()
+        self.assertTrue(Task.objects.filter(dedup_key=jobs.REFRESH_VOTE_AGGREGATES_KEY).exists())
+        self.assertIn(self.question.id, answered.answered_set(self.player.id))
+
+    def test_failing_enqueue_does_not_fail_the_vote(self):
+        with mock.patch.object(jobs, 'queue_vote_aggregates', side_effect=RuntimeError('queue down')), \
+                self.assertLogs('polls.jobs', 'ERROR'):
+            response = self.vote()
+        self.assertEqual(self.question.get_user_answer(self.player).option_selected, 'optionOne')
+        self.assertEqual([str(m) for m in response.context['messages']], ['Answer submitted successfully!'])
+
+
+# ============================================================================
+# JSON API
+# ============================================================================
+
+class ApiTests(AnswerTestCase):
+    def setUp(self):
+        cache.clear()
+        self.author = User.objects.create(username='author')
+        self.questions = [
+            Question.objects.create(author=self.author, option_one_text=f'a{i}', option_two_text=f'b{i}')
+            for i in range(3)
+        ]
+        self.player = User.objects.create(username='player')
+        self.client.force_login(self.player)
+
+    def post_votes(self, body):
+        with self.captureOnCommitCallbacks(execute=True):
+            return self.client.post('/api/votes/', body, content_type='application/json')
+
+    def test_deck_lists_unanswered_questions_newest_first(self):
+        Answer.objects.create(user=self.player, question=self.questions[2], option_selected='optionOne')
+        response = self.client.get('/api/deck/', {'size': 5})
+        self.assertEqual(
+            [question['id'] for question in response.json()['questions']],
+            [self.questions[1].id, self.questions[0].id],
+        )
+        self.assertEqual(response.json()['questions'][0]['author'], 'author')
+        self.assertEqual(self.client.get('/api/deck/', {'size': 'many'}).status_code, 400)
+
+    def test_votes_are_recorded_once(self):
+        first, second, third = self.questions
+        response = self.post_votes({'votes': [
+            {'question_id': first.id, 'option_selected': 'optionOne'},
+            {'question_id': second.id, 'option_selected': 'optionTwo'},
+            {'question_id': first.id, 'option_selected': 'optionTwo'},
+        ]})
+        self.assertEqual(response.json()['created'], 2)
+        self.assertEqual(
+            [result['status'] for result in response.json()['results']],
+            ['created', 'created', 'duplicate'],
+        )
+        self.assertEqual(first.get_user_answer(self.player).option_selected, 'optionOne')
+        self.assertIn(second.id, answered.answered_set(self.player.id))
+        self.assertTrue(Task.objects.filter(dedup_key=jobs.REFRESH_VOTE_AGGREGATES_KEY).exists())
+
+        response = self.post_votes({'votes': [
+            {'question_id': second.id, 'option_selected': 'optionOne'},
+            {'question_id': third.id, 'option_selected': 'optionOne'},
+        ]})
+        self.assertEqual(
+            [result['status'] for result in response.json()['results']],
+            ['duplicate', 'created'],
+        )
+        self.assertEqual(sharding.count(Answer.objects.filter(user=self.player)), 3)
+
+    def test_earlier_vote_with_the_same_timestamp_is_a_duplicate(self):
+        now = timezone.now()
+        Answer.objects.create(
+            user=self.player, question=self.questions[0], option_selected='optionOne', answered_at=now,
+        )
+        with mock.patch.object(views.timezone, 'now', return_value=now):
+            response = self.post_votes({'votes': [{'question_id': self.questions[0].id, 'option_selected': 'optionTwo'}]})
+        self.assertEqual(response.json()['created'], 0)
+        self.assertEqual(response.json()['results'][0]['status'], 'duplicate')
+
+    def test_bad_votes_are_reported(self):
+        Question.objects.filter(id=self.questions[1].id).update(is_hidden=True)
+        response = self.post_votes({'votes': [
+            {'question_id': True, 'option_selected': 'optionOne'},
+            {'question_id': str(self.questions[0].id), 'option_selected': 'optionOne'},
+            {'question_id': self.questions[0].id, 'option_selected': 'optionThree'},
+            'optionOne',
+            {'question_id': self.questions[1].id, 'option_selected': 'optionOne'},
+            {'question_id': 10 ** 9, 'option_selected': 'optionOne'},
+        ]})
+        self.assertEqual(
+            [result['status'] for result in response.json()['results']],
+            ['invalid', 'invalid', 'invalid', 'invalid', 'not_found', 'not_found'],
+        )
+        self.assertEqual(sharding.count(Answer.objects.all()), 0)
+
+    def test_malformed_bodies_are_rejected(self):
+        for body in ('not json', {'vote': []}, {'votes': {'question_id': 1}}, []):
+            with self.subTest(body=body):
+                self.assertEqual(self.post_votes(body).status_code, 400)
+        with mock.patch.object(views, 'VOTE_BATCH_MAX_SIZE', 1):
+            response = self.post_votes({'votes': [{}, {}]})
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(self.client.get('/api/votes/').status_code, 405)
+
+
+# ============================================================================
+# HOME PAGE
+# ============================================================================
+
+@override_settings(STORAGES=PLAIN_STORAGES)
+class HomeTests(AnswerTestCase):
+    def test_question_ids_scanned_once_on_a_stats_miss(self):
+        cache.clear()
+        players, asked = make_votes(users=1, questions=2)
+        Question.objects.create(author=players[0], option_one_text='c', option_two_text='d')
+        self.client.force_login(players[0])
+        with mock.patch.object(views, 'visible_question_ids', wraps=views.visible_question_ids) as scan:
+            response = self.client.get('/home/')
+        self.assertEqual(scan.call_count, 1)
+        self.assertEqual((response.context['unanswered_count'], response.context['answered_count']), (1, 2))
+
+
+# ============================================================================
+# LEADERBOARD
+# ============================================================================
+
+class LeaderboardTests(AnswerTestCase):
+    def setUp(self):
+        players, _ = make_votes()
+        User.objects.filter(pk=players[2].pk).update(archived_answers=1)
+
+    def ranking(self):
+        return [
+            (entry['user'].username, entry['total_score'])
+            for entry in views.leaderboard_entries(settings.LEADERBOARD_SIZE)
+        ]
+
+    @override_settings(LEADERBOARD_SIZE=2)
+    def test_top_users_ranked(self):
+        self.assertEqual(self.ranking(), [('player0', 4), ('player2', 3)])
+
+    def test_every_user_ranked_by_default(self):
+        self.assertIsNone(settings.LEADERBOARD_SIZE)
+        self.assertEqual(len(self.ranking()), User.objects.count())
+
+    @override_settings(LEADERBOARD_SIZE=2, STORAGES=PLAIN_STORAGES)
+    def test_page_renders_cached_rows(self):
+        cache.clear()
+        self.client.force_login(User.objects.get(username='player2'))
+        for streaming in (True, False):
+            with self.subTest(streaming=streaming), override_settings(LEADERBOARD_STREAMING=streaming):
+                response = self.client.get('/leaderboard/')
+                page = b''.join(response.streaming_content) if streaming else response.content
+                self.assertIn(b'player0', page)
+                self.assertNotIn(b'player1', page)
+                self.assertIn(b'ml-2">You</span>', page)
+        rows = cache.get('leaderboard')[0]
+        self.assertEqual([row[1:2] + row[-2:] for row in rows], [('player0', 2, 2), ('player2', 0, 3)])
+
+    @override_settings(LEADERBOARD_CACHE_ROWS=2)
+    def test_only_the_head_is_cached(self):
+        cache.clear()
+        expected = [(entry['rank'], entry['user'].id, entry['total_score']) for entry in views.leaderboard_entries()]
+        entries = [(entry['rank'], entry['user'].id, entry['total_score'])
+                   for entry in views.cached_leaderboard_entries()]
+        self.assertEqual(entries, expected)
+        self.assertEqual(len(cache.get('leaderboard')[0]), 2)
+        # A stale head, its two users swapped, still lists everyone once
+        stale = [(user_id, 'stale', '', '', '', '', 0, 0) for _, user_id, _ in expected[1::-1]]
+        cache.set('leaderboard', (stale, time.time() + 60, 0))
+        ids = [entry['user'].id for entry in views.cached_leaderboard_entries()]
+        self.assertEqual(sorted(ids), sorted(user_id for _, user_id, _ in expected))
+
+    @override_settings(LEADERBOARD_SIZE=2)
+    def test_sharded_ranking_matches_query(self):
+        expected = self.ranking()
+        with mock.patch.object(sharding, 'enabled', return_value=True), \
+                mock.patch.object(views, 'IN_BULK_CHUNK_SIZE', 1):
+            self.assertEqual(self.ranking(), expected)
+
+
+# ============================================================================
+# ROLLUPS AND TRENDING
+# ============================================================================
+
+class RollupTests(AnswerTestCase):
+    def test_update_counts_each_vote_once(self):
+        players, asked = make_votes()
+        self.assertEqual(rollups.update(), 6)
+        self.assertEqual(rollups.update(), 0)
+
+        daily = VoteRollup.objects.filter(question=asked[0], granularity=VoteRollup.DAY)
+        self.assertEqual(sum(daily.values_list('count', flat=True)), 3)
+        self.assertEqual(sum(point['option_one'] for point in rollups.trend(asked[0].id)), 3)
+        self.assertEqual(sum(point['option_two'] for point in rollups.trend(asked[1].id)), 3)
+
+    def test_recent_answers_wait_for_the_lag(self):
+        make_votes(age=timedelta(seconds=0))
+        self.assertEqual(rollups.update(), 0)
+
+    def test_backfill_matches_update(self):
+        make_votes()
+        rollups.update()
+        expected = sorted(VoteRollup.objects.values_list('question_id', 'granularity', 'bucket', 'option_selected', 'count'))
+        VoteRollup.objects.all().delete()
+        rollups.backfill()
+        self.assertEqual(
+            sorted(VoteRollup.objects.values_list('question_id', 'granularity', 'bucket', 'option_selected', 'count')),
+            expected,
+        )
+
+    def test_backfill_counts_archived_answers_when_none_are_live(self):
+        make_votes()
+        rollups.update()
+        expected = sorted(VoteRollup.objects.values_list('question_id', 'granularity', 'bucket', 'option_selected', 'count'))
+        archive.archive_answers(older_than_days=0)
+        self.assertEqual(sharding.count(Answer.objects.all()), 0)
+        VoteRollup.objects.all().delete()
+        rollups.backfill()
+        self.assertEqual(
+            sorted(VoteRollup.objects.values_list('question_id', 'granularity', 'bucket', 'option_selected', 'count')),
+            expected,
+        )
+
+
+class TrendingTests(AnswerTestCase):
+    def test_ranks_by_decayed_votes(self):
+        players, asked = make_votes(questions=1)
+        busy = asked[0]
+        quiet = Question.objects.create(author=players[0], option_one_text='x', option_two_text='y')
+        Answer.objects.create(
+            user=players[0], question=quiet, option_selected='optionOne',
+            answered_at=timezone.now() - timedelta(hours=12),
+        )
+        self.assertEqual(trending.update(), 2)
+        ranked = trending.trending_questions()
+        self.assertEqual([question for question, _ in ranked][:2], [busy, quiet])
+        self.assertAlmostEqual(ranked[0][1], 3 * 0.5 ** (2 / 6), places=2)
+
+    def test_hidden_questions_are_left_out(self):
+        _, asked = make_votes(questions=1)
+        trending.update()
+        Question.objects.filter(id=asked[0].id).update(is_hidden=True)
+        self.assertEqual(trending.trending_questions(), [])
+
+
+# ============================================================================
+# ADMIN
+# ============================================================================
+
+@override_settings(STORAGES=PLAIN_STORAGES)
+class UserAdminTests(AnswerTestCase):
+    def changelist(self):
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get('/admin/polls/user/')
+        return response, len(queries)
+
+    def test_counts_are_read_once_per_page(self):
+        players, asked = make_votes(users=2)
+        User.objects.filter(pk=players[1].pk).update(archived_answers=3)
+        self.client.force_login(User.objects.create_superuser('admin', 'admin@example.com', 'pw'))
+        response, queries = self.changelist()
+        self.assertContains(response, '<td class="field-questions_asked"><strong>2</strong></td>', html=True)
+        self.assertContains(response, '<td class="field-questions_answered"><strong>5</strong></td>', html=True)
+        self.assertContains(response, '<td class="field-total_score_display"><strong style="color: #667eea;">4</strong></td>', html=True)
+
+        for i in range(3):
+            extra = User.objects.create(username=f'extra{i}')
+            Answer.objects.create(user=extra, question=asked[0], option_selected='optionTwo')
+        self.assertEqual(self.changelist()[1], queries)
+
+
+@override_settings(STORAGES=PLAIN_STORAGES)
+class QuestionAdminTests(AnswerTestCase):
+    def setUp(self):
+        self.admin = User.objects.create_superuser('admin', 'admin@example.com', 'pw')
+        self.client.force_login(self.admin)
+        self.players, self.asked = make_votes(users=2)
+
+    def act(self, action, questions, **data):
+        return self.client.post('/admin/polls/question/', {
+            'action': action, '_selected_action': [q.id for q in questions], **data,
+        }, follow=True)
+
+    def test_vote_counts_are_read_once_per_page(self):
+        Question.objects.filter(pk=self.asked[1].pk).update(archived_option_one_votes=2)
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get('/admin/polls/question/')
+        self.assertContains(response, '<td class="field-total_votes_display"><strong>4</strong></td>', html=True)
+        self.assertContains(response, '<td class="field-option_one_percentage"><span style="color: #3298dc;">50.0%</span></td>', html=True)
+
+        for i in range(3):
+            question = Question.objects.create(author=self.players[0], option_one_text=f'e{i}', option_two_text='f')
+            Answer.objects.create(user=self.players[1], question=question, option_selected='optionTwo')
+        with CaptureQueriesContext(connection) as more_queries:
+            self.client.get('/admin/polls/question/')
+        self.assertEqual(len(more_queries), len(queries))
+
+    def test_hide_and_unhide(self):
+        self.act('hide_selected', self.asked[:1])
+        self.assertEqual(list(Question.objects.filter(is_hidden=True)), self.asked[:1])
+        self.act('unhide_selected', self.asked)
+        self.assertFalse(Question.objects.filter(is_hidden=True).exists())
+
+    def test_reassign_author_asks_then_updates(self):
+        response = self.act('reassign_author', self.asked)
+        self.assertContains(response, 'Reassign the author of 2 questions')
+        self.assertEqual(Question.objects.filter(author=self.players[1]).count(), 0)
+
+        response = self.act('reassign_author', self.asked, apply='Reassign', author='nobody')
+        self.assertContains(response, 'No user named')
+        self.act('reassign_author', self.asked, apply='Reassign', author=self.players[1].username)
+        self.assertEqual(Question.objects.filter(author=self.players[1]).count(), 2)
+
+    def test_recompute_stats_queues_a_batch_with_progress(self):
+        response = self.act('recompute_stats', self.asked)
+        task = Task.objects.get(name=jobs.recompute_question_stats.name)
+        self.assertEqual(task.args, [sorted(q.id for q in self.asked)])
+        batch = task.kwargs['batch']
+        self.assertContains(response, f'?q={batch}')
+
+        response = self.client.get('/admin/polls/task/', {'q': batch})
+        self.assertContains(response, f'Batch {batch}: 1 part(s) queued or running, 0 failed.')
+        Task.objects.filter(pk=task.pk).update(status=Task.FAILED)
+        response = self.client.get('/admin/polls/task/', {'q': batch})
+        self.assertContains(response, f'Batch {batch}: 0 part(s) queued or running, 1 failed.')
+
+    def test_purge_hides_questions_when_queued(self):
+        response = self.client.post('/admin/polls/question/?is_hidden__exact=0', {
+            'action': 'purge_selected', 'select_across': '1', 'index': '0',
+            '_selected_action': [self.asked[0].id],
+        }, follow=True)
+        self.assertContains(response, '2 question(s) hidden and queued for deletion in 1 part(s)')
+        self.assertEqual(Question.objects.filter(is_hidden=True).count(), 2)
+        self.assertEqual(Task.objects.get(name=jobs.purge_questions.name).args, [sorted(q.id for q in self.asked)])
+
+
+# ============================================================================
+# PURGE
+# ============================================================================
+
+class PurgeTests(AnswerTestCase):
+    def setUp(self):
+        cache.clear()
+
+    def test_purge_user_removes_their_votes_from_aggregates(self):
+        players, asked = make_votes()
+        rollups.update()
+        trending.update()
+        other = User.objects.create(username='asker')
+        Question.objects.filter(id=asked[1].id).update(author=other)
+
+        counts = purge.purge_user(players[1].id)
+        self.assertEqual(counts, {'questions': 0, 'answers': 2, 'answers_on_questions': 0})
+        self.assertFalse(User.objects.filter(id=players[1].id).exists())
+        self.assertEqual(sharding.count(Answer.objects.all()), 4)
+        daily = VoteRollup.objects.filter(question=asked[0], granularity=VoteRollup.DAY)
+        self.assertEqual(sum(daily.values_list('count', flat=True)), 2)
+        self.assertEqual(TrendingScore.objects.get(question=asked[0]).votes, 2)
+
+    def test_purge_user_deletes_their_questions(self):
+        players, asked = make_votes()
+        counts = purge.purge_user(players[0].id)
+        self.assertEqual(counts['questions'], 2)
+        self.assertEqual(counts['answers_on_questions'], 6)
+        self.assertFalse(Question.objects.exists())
+        self.assertFalse(sharding.exists(Answer.objects.all()))
+
+    @override_settings(STORAGES=PLAIN_STORAGES)
+    def test_admin_action_queues_users_in_parts(self):
+        players, _ = make_votes(users=3)
+        admin = User.objects.create_superuser('admin', 'admin@example.com', 'pw')
+        self.client.force_login(admin)
+        with mock.patch.object(purge, 'IDS_PER_TASK', 2):
+            self.client.post('/admin/polls/user/', {
+                'action': 'purge_selected', '_selected_action': [p.id for p in players] + [admin.id],
+            })
+        parts = Task.objects.filter(name__endswith='purge_users').order_by('id')
+        self.assertEqual([task.args[0] for task in parts], [[players[0].id, players[1].id], [players[2].id]])
+        self.assertFalse(User.objects.filter(id__in=[p.id for p in players], is_active=True).exists())
+        self.assertTrue(User.objects.get(id=admin.id).is_active)
+
+    def test_purge_question_forgets_answered_sets(self):
+        players, asked = make_votes()
+        self.assertIn(asked[0].id, answered.answered_set(players[1].id))
+        purge.purge_question(asked[0].id)
+        self.assertNotIn(asked[0].id, answered.answered_set(players[1].id))
+
+    def test_purge_questions(self):
+        _, asked = make_votes()
+        rollups.update()
+        self.assertEqual(purge.purge_questions([asked[0].id]), {'questions': 1, 'answers': 3})
+        self.assertFalse(VoteRollup.objects.filter(question_id=asked[0].id).exists())
+        self.assertEqual(sharding.count(Answer.objects.all()), 3)
+
+
+# ============================================================================
+# ARCHIVE
+# ============================================================================
+
+@override_settings(STORAGES=PLAIN_STORAGES)
+class ArchiveTests(AnswerTestCase):
+    def setUp(self):
+        cache.clear()
+        self.players, self.questions = make_votes()
+
+    def test_rerun_after_failed_delete_counts_once(self):
+        with mock.patch.object(AnswerQuerySet, 'delete', side_effect=DatabaseError('disk I/O error')):
+            with self.assertRaises(DatabaseError):
+                archive.archive_answers(older_than_days=0)
+        # Archived and still live: the archive side committed first
+        self.assertEqual((ArchivedAnswer.objects.count(), sharding.count(Answer.objects.all())), (6, 6))
+
+        self.assertEqual(archive.archive_answers(older_than_days=0)['answers'], 6)
+        self.assertEqual((ArchivedAnswer.objects.count(), sharding.count(Answer.objects.all())), (6, 0))
+        question = Question.objects.get(pk=self.questions[0].pk)
+        self.assertEqual((question.archived_option_one_votes, question.archived_option_two_votes), (3, 0))
+        self.assertEqual(set(User.objects.values_list('archived_answers', flat=True)), {2})
+
+    def test_pages_of_a_fully_archived_question_keep_their_counts(self):
+        archive.archive_answers(older_than_days=0)
+        question = self.questions[1]
+        self.assertFalse(sharding.exists(Answer.objects.filter(question=question)))
+
+        self.client.force_login(self.players[1])
+        response = self.client.get(f'/question/{question.id}/')
+        self.assertTrue(response.context['show_results'])
+        self.assertEqual(response.context['user_answer'].option_selected, 'optionTwo')
+        self.assertEqual(
+            [response.context[name] for name in ('total_votes', 'option_one_votes', 'option_two_votes')],
+            [3, 0, 3],
+        )
+        self.assertEqual(response.context['option_two_percentage'], 100.0)
+        self.assertContains(response, '3 out of 3 votes')
+
+        # Voting again changes nothing
+        self.client.post(f'/question/{question.id}/', {'option_selected': 'optionOne'})
+        self.assertEqual(Question.objects.get(pk=question.pk).total_votes, 3)
+        self.assertFalse(sharding.exists(Answer.objects.filter(question=question)))
+
+        self.client.force_login(User.objects.create_superuser('admin', 'admin@example.com', 'pw'))
+        response = self.client.get(f'/admin/polls/question/{question.id}/change/')
+        self.assertContains(response, '<p><strong>Option 2:</strong> 3 votes (100.0%)</p>', html=True)
+        self.assertContains(response, '<p><strong>Total:</strong> 3 votes</p>', html=True)
+
+
+# ============================================================================
+# EXPORT
+# ============================================================================
+
+class ExportTests(AnswerTestCase):
+    def test_csv_pages(self):
+        make_votes()
+        data = b''.join(export.export_stream('answers', 'csv', chunk_size=4)).decode()
+        rows = list(csv.reader(io.StringIO(data)))
+        self.assertEqual(rows[0], ['id', 'user_id', 'question_id', 'option_selected', 'answered_at', 'archived'])
+        self.assertEqual(sorted(int(row[0]) for row in rows[1:]), sorted(sharding.all_rows(Answer.objects.all(), 'id', flat=True)))
+
+    def test_archived_answers_are_included(self):
+        players, asked = make_votes(users=3, questions=1)
+        ArchivedAnswer.objects.bulk_create(
+            ArchivedAnswer(user=player, question=asked[0], option=ArchivedAnswer.OPTION_TWO,
+                           answered_at=timezone.now())
+            for player in players
+        )
+        sharding.scatter(lambda alias: Answer.objects.using(alias).filter(user=players[2]).delete())
+        data = b''.join(export.export_stream('answers', 'jsonl', chunk_size=2)).decode()
+        records = [json.loads(line) for line in data.splitlines()]
+        live = [record for record in records if not record['archived']]
+        archived = [record for record in records if record['archived']]
+        self.assertEqual(len(live), 2)
+        self.assertEqual(
+            sorted((record['user_id'], record['option_selected'], record['id']) for record in archived),
+            [(player.id, 'optionTwo', None) for player in players],
+        )
+
+    def test_gzipped_jsonl(self):
+        make_votes(questions=1)
+        data = gzip.decompress(b''.join(export.export_stream('questions', 'jsonl', compress=True)))
+        records = [json.loads(line) for line in data.decode().splitlines()]
+        self.assertEqual([record['option_one_text'] for record in records], ['a0'])
+
+
+# ============================================================================
+# COLUMNAR STORE
+# ============================================================================
+
+class AnswerStoreTests(AnswerTestCase):
+    # (option one, option two) voters of each question, by player index
+    PICKS = [
+        ([0, 1], [2, 3]),  # 50/50
+        ([0, 1, 2], [3]),  # 75/25
+        ([], [0, 1, 2]),  # unanimous
+    ]
+
+    def setUp(self):
+        self.players = [User.objects.create(username=f'player{i}') for i in range(4)]
+        self.questions = []
+        for one, two in self.PICKS:
+            question = Question.objects.create(author=self.players[0], option_one_text='a', option_two_text='b')
+            for option, voters in (('optionOne', one), ('optionTwo', two)):
+                for i in voters:
+                    Answer.objects.create(
+                        user=self.players[i], question=question, option_selected=option,
+                        answered_at=timezone.now() - timedelta(days=1),
+                    )
+            self.questions.append(question)
+        self.directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.directory, ignore_errors=True)
+
+    def check(self, store):
+        even, mixed, unanimous = [q.id for q in self.questions]
+        most, least = store.polarization(min_votes=3)
+        self.assertEqual(most, [(even, 4, 0.5, 1.0), (mixed, 4, 0.75, 0.5), (unanimous, 3, 0.0, 0.0)])
+        self.assertEqual(least, most[::-1])
+        self.assertEqual(store.polarization(min_votes=4)[0], most[:2])
+
+        ids = [player.id for player in self.players]
+        self.assertEqual(
+            store.agreement(ids[0], min_common=2),
+            [(ids[1], 3, 1.0), (ids[2], 3, 2 / 3), (ids[3], 2, 0.0)],
+        )
+        self.assertEqual(store.agreement(ids[0], min_common=3, limit=1), [(ids[1], 3, 1.0)])
+        self.assertEqual(store.agreement(User.objects.create(username='new').id), [])
+
+    def test_queries_match_the_answers(self):
+        self.assertEqual(columnar.update(self.directory), 11)
+        self.check(columnar.AnswerStore(self.directory))
+
+    def test_rebuild_reads_archived_answers(self):
+        archive.archive_answers(older_than_days=0)
+        self.assertEqual(sharding.count(Answer.objects.all()), 0)
+        self.assertEqual(columnar.rebuild(self.directory)['rows'], 11)
+        self.check(columnar.AnswerStore(self.directory))
+
+
+# ============================================================================
+# RECOMMENDATIONS
+# ============================================================================
+
+class RecommenderTests(AnswerTestCase):
+    # Questions each player answered, by question index; player 3 is the one advised
+    ANSWERED = [[0, 1], [0, 1, 2], [1, 3], [0]]
+
+    def setUp(self):
+        directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, directory, ignore_errors=True)
+        self.enterContext(override_settings(RECOMMENDER_DIR=directory))
+        self.players = [User.objects.create(username=f'player{i}') for i in range(4)]
+        self.questions = [
+            Question.objects.create(author=self.players[0], option_one_text=f'a{i}', option_two_text='b')
+            for i in range(4)
+        ]
+        for player, answered in zip(self.players, self.ANSWERED):
+            for i in answered:
+                self.vote(player, self.questions[i], timedelta(days=1))
+
+    def vote(self, player, question, age):
+        Answer.objects.create(
+            user=player, question=question, option_selected='optionOne', answered_at=timezone.now() - age,
+        )
+
+    def recommended(self, player):
+        return [
+            (recommendation.question, round(recommendation.score, 3))
+            for recommendation in Recommendation.objects.filter(user=player).order_by('rank')
+        ]
+
+    def counts(self):
+        matrix = recommender.CoVoteMatrix.load()
+        ids = [q.id for q in self.questions]
+        return matrix.counts.toarray()[np.ix_(ids, ids)].tolist()
+
+    def test_recommends_questions_co_answered_with_yours(self):
+        self.assertEqual(recommender.rebuild()['users'], 4)
+        self.assertEqual(self.counts(), [[3, 2, 1, 0], [2, 3, 1, 1], [1, 1, 1, 0], [0, 1, 0, 1]])
+        # Cosine similarity to question 0: 2 / sqrt(3 * 3) and 1 / sqrt(3 * 1)
+        q = self.questions
+        self.assertEqual(self.recommended(self.players[3]), [(q[1], 0.667), (q[2], 0.577)])
+
+    def test_new_answers_are_folded_in(self):
+        recommender.rebuild()
+        self.vote(self.players[3], self.questions[1], timedelta(minutes=5))
+        self.vote(self.players[2], self.questions[0], timedelta(seconds=0))  # within the lag
+
+        self.assertEqual(recommender.rebuild()['users'], 1)
+        self.assertEqual(self.counts(), [[3, 3, 1, 0], [3, 4, 1, 1], [1, 1, 1, 0], [0, 1, 0, 1]])
+        q = self.questions
+        self.assertEqual(self.recommended(self.players[3]), [(q[2], 1.077), (q[3], 0.5)])
+
+        incremental = self.counts()
+        recommender.rebuild(full=True)
+        self.assertEqual(self.counts(), incremental)
+
+    def test_full_rebuild_counts_archived_answers(self):
+        recommender.rebuild()
+        expected = self.counts()
+        archive.archive_answers(older_than_days=0)
+        self.assertEqual(sharding.count(Answer.objects.all()), 0)
+
+        self.assertEqual(recommender.rebuild(full=True)['users'], 4)
+        self.assertEqual(self.counts(), expected)
+        q = self.questions
+        self.assertEqual(self.recommended(self.players[3]), [(q[1], 0.667), (q[2], 0.577)])
+
+
+# ============================================================================
+# ANSWERED SETS
+# ============================================================================
+
+class AnsweredSetTests(SimpleTestCase):
+    def test_array_and_bitmap_containers(self):
+        ids = list(range(1, 10000, 2)) + [70000, 70001, 2 ** 20]
+        answered_set = answered.AnsweredSet.from_ids(ids)
+        self.assertEqual(len(answered_set), len(ids))
+        restored = answered.AnsweredSet.from_bytes(answered_set.to_bytes())
+        probe = [1, 2, 9999, 70001, 70002, 2 ** 20, 2 ** 21]
+        self.assertEqual(
+            list(restored.contains_many(probe)),
+            [True, False, True, True, False, True, False],
+        )
+        self.assertIn(70000, restored)
+        self.assertNotIn(4, restored)
+
+    def test_add_many(self):
+        answered_set = answered.AnsweredSet.from_ids([1, 2])
+        answered_set.add_many(range(3, 5000))
+        self.assertEqual(len(answered_set), 4999)
+        self.assertIn(4999, answered_set)
+
+
+class AgreementIndexTests(SimpleTestCase):
+    def test_popcount_without_bitwise_count(self):
+        words = np.array([[0, 1, 2 ** 64 - 1], [3, 2 ** 63, 0]], dtype=np.uint64)
+        with mock.patch.object(np, 'bitwise_count'):
+            del np.bitwise_count  # as on NumPy 1.x; the patch puts it back
+            self.assertEqual(list(agreement.popcount_rows(words)), [65, 3])
+
+    def test_similar_players(self):
+        index = agreement.AgreementIndex()
+        # User 1 agrees with 2 on all three questions and with 3 on one of them
+        index.add_many([1, 1, 1, 2, 2, 2, 3, 3, 3], [5, 6, 70] * 3, [True, False, True] * 2 + [True, True, False])
+        for rows in (agreement.COMPARE_ROWS, 2):
+            with self.subTest(rows=rows), mock.patch.object(agreement, 'COMPARE_ROWS', rows):
+                self.assertEqual(
+                    [(user_id, common, round(rate, 2)) for user_id, common, rate in index.similar(1, min_common=3)],
+                    [(2, 3, 1.0), (3, 3, 0.33)],
+                )
+
+    def test_requests_read_the_saved_index_and_reload_it(self):
+        index = agreement.AgreementIndex()
+        index.add_many([1, 1, 2, 2], [5, 6, 5, 6], [True, True, True, True])
+        with tempfile.TemporaryDirectory() as directory, override_settings(AGREEMENT_INDEX_DIR=directory), \
+                mock.patch.object(agreement, '_index', None):
+            # Nothing built yet: no neighbours, and no scan of the answers
+            self.assertEqual(agreement.similar_players(1), [])
+
+            index.watermarks = {'default': 7}
+            index.save(agreement.index_path())
+            self.assertEqual(agreement.get_index().similar(1, min_common=2), [(2, 2, 1.0)])
+            self.assertIsInstance(agreement.get_index().answered, np.memmap)
+            self.assertEqual(agreement.AgreementIndex.load(agreement.index_path()).watermarks, {'default': 7})
+
+            index.add_many([3, 3], [5, 6], [False, False])
+            index.save(agreement.index_path())
+            stat = os.stat(agreement.index_path())
+            os.utime(agreement.index_path(), ns=(stat.st_atime_ns, stat.st_mtime_ns + 10 ** 9))
+            self.assertEqual([user_id for user_id, _, _ in agreement.get_index().similar(1, min_common=2)], [2, 3])
+
+
+class AgreementJobTests(AnswerTestCase):
+    def test_update_folds_new_answers_into_the_file(self):
+        players, asked = make_votes()
+        with tempfile.TemporaryDirectory() as directory, override_settings(AGREEMENT_INDEX_DIR=directory):
+            agreement.update_index()  # builds the missing file
+            self.assertEqual(agreement.get_index().similar(players[0].id, min_common=2)[0][1:], (2, 1.0))
+
+            question = Question.objects.create(author=players[0], option_one_text='c', option_two_text='d')
+            for player in players[:2]:
+                Answer.objects.create(user=player, question=question, option_selected='optionOne')
+            self.assertEqual(agreement.update_index().similar(players[0].id, min_common=3), [(players[1].id, 3, 1.0)])
+
+
+class AnsweredCacheTests(AnswerTestCase):
+    def setUp(self):
+        cache.clear()
+
+    def test_cached_set_follows_votes(self):
+        players, asked = make_votes(users=1)
+        player = players[0]
+        self.assertEqual(sorted(answered.load(player.id).contains_many([q.id for q in asked])), [True, True])
+
+        new = Question.objects.create(author=player, option_one_text='c', option_two_text='d')
+        self.assertNotIn(new.id, answered.answered_set(player.id))
+        Answer.objects.create(user=player, question=new, option_selected='optionOne')
+        answered.record_votes(player.id, [new.id])
+        self.assertIn(new.id, answered.answered_set(player.id))
+
+        new.answers.all().delete()
+        answered.forget([player.id])
+        self.assertNotIn(new.id, answered.answered_set(player.id))
+
+    def test_vote_during_a_rebuild_is_not_lost(self):
+        players, asked = make_votes(users=1)
+        player = players[0]
+        new = Question.objects.create(author=player, option_one_text='c', option_two_text='d')
+        load = answered.load
+
+        def load_then_vote(user_id):
+            # The set is read before the vote lands, and stored after it
+            stale = load(user_id)
+            Answer.objects.create(user=player, question=new, option_selected='optionOne')
+            answered.record_votes(player.id, [new.id])
+            return stale
+
+        with mock.patch('polls.answered.load', side_effect=load_then_vote):
+            self.assertNotIn(new.id, answered.answered_set(player.id))
+        self.assertIn(new.id, answered.answered_set(player.id))
+
+
+# ============================================================================
+# LOAD TESTING
+# ============================================================================
+
+class FakeSession:
+    """Replays (status, body) responses, or raises them if they're exceptions"""
+
+    def __init__(self, *responses, cookies=None):
+        self.responses = list(responses)
+        self.cookies = dict(cookies or {})
+        self.requests = []
+
+    def request(self, method, path, form=None):
+        self.requests.append((method, path, form))
+        response = self.responses.pop(0)
+        if isinstance(response, Exception):
+            raise response
+        return response
+
+
+class LoadTestTests(SimpleTestCase):
+    FORM = b'<input type="hidden" name="csrfmiddlewaretoken" value="token">'
+
+    def user(self, *responses, logged_in=True):
+        session = FakeSession(*responses, cookies={'sessionid': 'abc'} if logged_in else {})
+        return loadtest.SimulatedUser(session, loadtest.DEFAULT_PATHS, 'player', 'pw', random.Random(0))
+
+    def test_parse_mix(self):
+        self.assertEqual(loadtest.parse_mix('home=5, vote ,'), {'home': 5.0, 'vote': 1.0})
+        for mix in ('home=5,browse=1', 'home=often', 'home=0', ''):
+            with self.subTest(mix=mix), self.assertRaises(ValueError):
+                loadtest.parse_mix(mix)
+
+    def test_summarize(self):
+        samples = [('home', 0.010, None), ('home', 0.030, 'HTTP 500'), ('vote', 0.020, None)]
+        summary = loadtest.summarize(samples, elapsed=2.0)
+        self.assertEqual(summary['total']['requests'], 3)
+        self.assertEqual(summary['total']['errors'], 1)
+        self.assertAlmostEqual(summary['total']['error_rate'], 1 / 3)
+        self.assertEqual(summary['total']['throughput_rps'], 1.5)
+        self.assertEqual((summary['total']['p50_ms'], summary['total']['p95_ms']), (20.0, 30.0))
+        self.assertEqual(summary['steps']['home']['error_kinds'], {'HTTP 500': 1})
+        self.assertEqual(summary['steps']['vote']['errors'], 0)
+
+    def test_vote_journey(self):
+        user = self.user((200, b'<a href="/question/7/">'), (200, self.FORM), (302, b''))
+        user.run('vote')
+        self.assertEqual([(name, error) for name, _, error in user.samples], [
+            ('home', None), ('question', None), ('vote', None),
+        ])
+        method, path, form = user.session.requests[-1]
+        self.assertEqual((method, path, form['csrfmiddlewaretoken']), ('POST', '/question/7/', 'token'))
+
+    def test_logged_out_user_logs_in_first(self):
+        user = self.user((200, self.FORM), (302, b''), (200, b''), logged_in=False)
+        user.run('leaderboard')
+        self.assertEqual([name for name, _, _ in user.samples], ['login_page', 'login_submit', 'leaderboard'])
+
+    def test_errors_are_classified(self):
+        cases = [
+            ((200, loadtest.VOTE_NOT_SAVED), 'vote not saved'),
+            ((500, b'OperationalError: database is locked'), 'database is locked'),
+            ((404, b''), 'HTTP 404'),
+            (ConnectionRefusedError(), 'connection: ConnectionRefusedError'),
+        ]
+        for response, error in cases:
+            with self.subTest(error=error):
+                user = self.user((200, b'<a href="/question/7/">'), (200, self.FORM), response)
+                user.run('vote')
+                self.assertEqual(user.samples[-1][::2], ('vote', error))
+                # A failed journey starts over from the login page
+                self.assertEqual(user.session.cookies, {})
+
+
+# ============================================================================
+# SHARDING (ANSWER_SHARDS=2 python manage.py test polls)
+# ============================================================================
+
+@skipUnless(settings.ANSWER_SHARD_ALIASES, 'needs shard databases: set ANSWER_SHARDS=2')
+@override_settings(STORAGES=PLAIN_STORAGES)
+class ShardingTests(TransactionTestCase):
+    # Scatter-gather reads run in threads, which don't see a TestCase's transaction
+    databases = '__all__'
+
+    def setUp(self):
+        cache.clear()
+        for index, alias in enumerate(settings.ANSWER_SHARD_ALIASES):
+            sharding.seed_id_sequence(alias, index)
+        self.author = User.objects.create(username='author')
+        self.questions = [
+            Question.objects.create(author=self.author, option_one_text=f'a{i}', option_two_text=f'b{i}')
+            for i in range(6)
+        ]
+        self.assertEqual(
+            {sharding.shard_for(q.id) for q in self.questions}, set(settings.ANSWER_SHARD_ALIASES)
+        )
+
+    def vote_on_all(self, user):
+        for question in self.questions:
+            Answer.objects.create(user=user, question=question, option_selected='optionOne')
+
+    def test_answers_are_stored_on_their_questions_shard(self):
+        question = self.questions[0]
+        answer = Answer.objects.create(user=self.author, question=question, option_selected='optionOne')
+        self.assertEqual(answer._state.db, sharding.shard_for(question.id))
+        self.assertFalse(Answer.objects.using('default').exists())
+
+        answer = question.get_user_answer(self.author)
+        self.assertEqual((answer.user, answer.question), (self.author, question))
+
+    def test_deletes_cascade_to_every_shard(self):
+        player = User.objects.create(username='player')
+        self.vote_on_all(player)
+        self.vote_on_all(self.author)
+
+        self.questions[0].delete()
+        self.assertEqual(sharding.count(Answer.objects.filter(user=player)), 5)
+        player.delete()
+        self.assertEqual(sharding.count(Answer.objects.all()), 5)
+
+    def test_reads_gather_every_shard(self):
+        player = User.objects.create(username='player')
+        self.vote_on_all(player)
+        question_ids = {q.id for q in self.questions}
+
+        self.assertEqual(sharding.count(Answer.objects.filter(user=player)), 6)
+        self.assertEqual(set(sharding.answered_question_ids(player.id)), question_ids)
+        self.assertEqual(sharding.answer_counts_by_user([player.id, self.author.id]), {player.id: 6})
+        self.assertEqual(player.questions_answered, 6)
+        self.assertTrue(all(q in answered.answered_set(player.id) for q in question_ids))
+        ranking = [(entry['user'].username, entry['total_score']) for entry in views.leaderboard_entries()]
+        self.assertEqual(ranking, [('player', 6), ('author', 6)])
+
+        self.client.force_login(User.objects.create_superuser('admin', 'admin@example.com', 'pw'))
+        response = self.client.get('/admin/polls/user/')
+        self.assertContains(response, '<td class="field-questions_answered"><strong>6</strong></td>', html=True)
+
+    def test_deck_skips_answered_questions_a_chunk_at_a_time(self):
+        player = User.objects.create(username='player')
+        for question in self.questions[3:]:
+            Answer.objects.create(user=player, question=question, option_selected='optionOne')
+        self.client.force_login(player)
+        with mock.patch.object(views, 'DECK_SCAN_CHUNK', 2):
+            response = self.client.get('/api/deck/', {'size': 2})
+        self.assertEqual(
+            [question['id'] for question in response.json()['questions']],
+            [self.questions[2].id, self.questions[1].id],
+        )
+
+    def test_answer_admin_is_refused(self):
+        self.client.force_login(User.objects.create_superuser('admin', 'admin@example.com', 'pw'))
+        self.assertNotContains(self.client.get('/admin/'), '/admin/polls/answer/')
+        with self.assertRaises(sharding.ShardingNotSupported):
+            self.client.get('/admin/polls/answer/')
+
+    def test_purges_delete_on_every_shard(self):
+        player = User.objects.create(username='player')
+        self.vote_on_all(player)
+        self.vote_on_all(self.author)
+
+        purge.purge_question(self.questions[0].id)
+        self.assertEqual(sharding.count(Answer.objects.filter(question_id=self.questions[0].id)), 0)
+        self.assertEqual(purge.purge_user(player.id)['answers'], 5)
+        self.assertEqual(sharding.count(Answer.objects.all()), 5)
+        self.assertFalse(User.objects.filter(id=player.id).exists())
+
+    def test_purge_queues_a_recount_when_the_aggregates_fail_to_commit(self):
+        player = User.objects.create(username='player')
+        self.vote_on_all(player)
+
+        default = connections['default']
+        failures = [DatabaseError('disk full')]
+
+        def commit(commit=default.commit):
+            if failures:
+                raise failures.pop()
+            commit()
+
+        with mock.patch.object(default, 'commit', commit), self.assertRaises(DatabaseError):
+            purge.delete_user_answers(player.id)
+        # The first shard's chunk is gone and its questions wait for a recount
+        task = Task.objects.get(name=jobs.recompute_question_stats.name)
+        alias = settings.ANSWER_SHARD_ALIASES[0]
+        self.assertEqual(
+            sorted(task.args[0]), sorted(q.id for q in self.questions if sharding.shard_for(q.id) == alias)
+        )
+        self.assertFalse(Answer.objects.using(alias).filter(user=player).exists())
+
+    def test_archiving_and_recomputing_read_every_shard(self):
+        player = User.objects.create(username='player')
+        self.vote_on_all(player)
+
+        self.assertEqual(archive.archive_answers(older_than_days=0)['answers'], 6)
+        self.assertEqual(sharding.count(Answer.objects.all()), 0)
+        self.assertEqual(ArchivedAnswer.objects.count(), 6)
+        player.refresh_from_db()
+        self.assertEqual(player.archived_answers, 6)
+
+        moderation.recompute_question_stats([q.id for q in self.questions])
+        self.assertEqual(
+            list(Question.objects.values_list('archived_option_one_votes', flat=True)), [1] * 6
+        )
+
+    def test_rebalance_moves_answers_to_their_shard(self):
+        player = User.objects.create(username='player')
+        Answer.objects.using('default').bulk_create(
+            [Answer(user=player, question=q, option_selected='optionOne') for q in self.questions]
+        )
+
+        moved = sharding.rebalance(chunk_size=4)
+        self.assertEqual(sum(moved.values()), 6)
+        self.assertFalse(Answer.objects.using('default').exists())
+        for question in self.questions:
+            self.assertTrue(
+                Answer.objects.using(sharding.shard_for(question.id)).filter(question=question).exists()
+            )
+        self.assertEqual(sharding.rebalance(), {})
+
+    def test_indexes_keep_a_watermark_per_shard(self):
+        player = User.objects.create(username='player')
+        self.vote_on_all(player)
+
+        with tempfile.TemporaryDirectory() as directory:
+            self.assertEqual(columnar.update(directory), 6)
+            self.assertEqual(columnar.update(directory), 0)
+            self.assertEqual(set(columnar.read_meta(directory)['watermarks']), set(settings.ANSWER_SHARD_ALIASES))
+
+        index = agreement.AgreementIndex()
+        self.assertEqual(index.catch_up(batch_size=2), 6)
+        Answer.objects.create(user=self.author, question=self.questions[0], option_selected='optionOne')
+        self.assertEqual(index.catch_up(), 1)
+        self.assertEqual(index.similar(player.id, min_common=1), [(self.author.id, 1, 1.0)])
+
+        with override_settings(ROLLUP_LAG_SECONDS=0):
+            matrix, users = recommender.update(recommender.CoVoteMatrix())
+        self.assertEqual(sorted(users), sorted([player.id, self.author.id]))
+        self.assertEqual(int(matrix.counts[self.questions[0].id, self.questions[1].id]), 1)
+        with override_settings(ROLLUP_LAG_SECONDS=0):
+            self.assertEqual(recommender.update(matrix)[1], [])
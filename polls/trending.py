@@ -0,0 +1,142 @@
+import math
+from collections import defaultdict
+from datetime import datetime, timedelta, timezone as dt_timezone
+
+from django.conf import settings
+from django.db import transaction
+from django.utils import timezone
+
+from . import sharding
+from .models import Answer, TrendingScore, Watermark
+from .rollups import after
+
+
+WATERMARK_NAME = 'trending'
+BATCH_SIZE = 10000
+
+# Scores are stored relative to this instant; see TrendingScore
+EPOCH = datetime(2026, 1, 1, tzinfo=dt_timezone.utc)
+
+
+def time_constant():
+    """Seconds for a vote's weight to fall by a factor of e"""
+    return settings.TRENDING_HALF_LIFE_HOURS * 3600 / math.log(2)
+
+
+def position(moment):
+    return (moment - EPOCH).total_seconds() / time_constant()
+
+
+def logsumexp(values):
+    peak = max(values)
+    return peak + math.log(sum(math.exp(value - peak) for value in values))
+
+
+def current_score(hotness, now=None):
+    """
+    The decayed vote count: sum of exp(-age / tau) over all votes. hotness is
+    log(sum of exp((answered_at - EPOCH) / tau)), which ranks questions the
+    same way at any instant and never needs updating while nobody votes.
+    """
+    return math.exp(hotness - position(now or timezone.now()))
+
+
+def apply_votes(rows):
+    """Fold (question_id, answered_at) rows into the stored scores"""
+    positions = defaultdict(list)
+    for question_id, answered_at in rows:
+        positions[question_id].append(position(answered_at))
+
+    existing = TrendingScore.objects.in_bulk(list(positions))
+    now = timezone.now()
+    created, updated = [], []
+    for question_id, values in positions.items():
+        hotness = logsumexp(values)
+        score = existing.get(question_id)
+        if score is None:
+            created.append(TrendingScore(question_id=question_id, hotness=hotness, votes=len(values)))
+        else:
+            score.hotness = logsumexp([score.hotness, hotness])
+            score.votes += len(values)
+            score.updated_at = now
+            updated.append(score)
+
+    TrendingScore.objects.bulk_create(created, batch_size=1000)
+    TrendingScore.objects.bulk_update(updated, ['hotness', 'votes', 'updated_at'], batch_size=1000)
+    return len(positions)
+
+
+def remove_votes(rows):
+    """
+    Take (question_id, answered_at) rows back out of the stored scores, for
+    deleted answers. A score left with (next to) nothing is dropped.
+    """
+    positions = defaultdict(list)
+    for question_id, answered_at in rows:
+        positions[question_id].append(position(answered_at))
+
+    existing = TrendingScore.objects.in_bulk(list(positions))
+    now = timezone.now()
+    updated, emptied = [], []
+    for question_id, values in positions.items():
+        score = existing.get(question_id)
+        if score is None:
+            continue
+        # exp(hotness) is the sum being subtracted from; scale by it to stay in range
+        remaining = 1.0 - sum(math.exp(value - score.hotness) for value in values)
+        score.votes -= len(values)
+        if score.votes <= 0 or remaining <= 1e-9:
+            emptied.append(question_id)
+            continue
+        score.hotness += math.log(remaining)
+        score.updated_at = now
+        updated.append(score)
+
+    TrendingScore.objects.filter(question_id__in=emptied).delete()
+    TrendingScore.objects.bulk_update(updated, ['hotness', 'votes', 'updated_at'], batch_size=1000)
+    return len(positions)
+
+
+def update(batch_size=BATCH_SIZE):
+    """
+    Add answers since the watermark to the scores of their questions. Only
+    questions that received votes are touched. Returns the number of
+    questions refreshed. Uses the same lag as the vote rollups.
+    """
+    cutoff = timezone.now() - timedelta(seconds=settings.ROLLUP_LAG_SECONDS)
+    Watermark.objects.get_or_create(name=WATERMARK_NAME)
+    refreshed = 0
+
+    while True:
+        with transaction.atomic():
+            watermark = Watermark.objects.select_for_update().get(name=WATERMARK_NAME)
+            answers = Answer.objects.filter(answered_at__lte=cutoff)
+            if watermark.answered_at is not None:
+                answers = answers.filter(after(watermark.answered_at, watermark.answer_id))
+            rows = sharding.first_rows(
+                answers, ['answered_at', 'id'], ['id', 'question_id', 'answered_at'], batch_size,
+            )
+            if not rows:
+                return refreshed
+
+            refreshed += apply_votes([row[1:] for row in rows])
+            watermark.answer_id, watermark.answered_at = rows[-1][0], rows[-1][2]
+            watermark.save()
+        if len(rows) < batch_size:
+            return refreshed
+
+
+def trending_questions(limit=20, now=None):
+    """
+    (question, score) pairs for the hottest questions, best first. Questions
+    whose score has decayed below TRENDING_MIN_SCORE are left out; both the
+    cut-off and the order are a range scan on the hotness index.
+    """
+    now = now or timezone.now()
+    threshold = position(now) + math.log(settings.TRENDING_MIN_SCORE)
+    scores = (
+        TrendingScore.objects.filter(hotness__gte=threshold, question__is_hidden=False)
+        .select_related('question__author')
+        .order_by('-hotness')[:limit]
+    )
+    return [(score.question, current_score(score.hotness, now)) for score in scores]
@@ -12,4 +12,15 @@ urlpatterns = [
     path('add/', views.new_question_view, name='new_question'),
     path('question/<int:question_id>/', views.question_detail_view, name='question_detail'),
     path('leaderboard/', views.leaderboard_view, name='leaderboard'),
+    path('search/', views.search_view, name='search'),
+    path('search/autocomplete/', views.search_autocomplete_view, name='search_autocomplete'),
+    
+    # Batch client API
+    path('api/deck/', views.api_deck_view, name='api_deck'),
+    path('api/votes/', views.api_votes_view, name='api_votes'),
+    
+    # Operations
+    path('export/<str:name>/', views.export_view, name='export'),
+    path('metrics/', views.metrics_view, name='metrics'),
+    path('ready/', views.ready_view, name='ready'),
 ]
\ No newline at end of file
@@ -1,13 +1,61 @@
+import heapq
+import json
+
+import numpy as np
+
 from django.shortcuts import render, redirect, get_object_or_404
 from django.contrib.auth import login, logout, authenticate
 from django.contrib.auth.decorators import login_required
 from django.contrib import messages
-from django.db.models import Count, Q, F, Window
+from django.conf import settings
+from django.contrib import admin
+from django.contrib.admin.views.decorators import staff_member_required
+from django.http import HttpResponse, JsonResponse, StreamingHttpResponse, Http404
+from django.urls import reverse
+from django.utils import timezone
+from django.utils.crypto import constant_time_compare
+from django.db.models import Count, Q, F, OuterRef, Subquery, Window
 from django.views.decorators.cache import never_cache
 from django.views.decorators.http import require_http_methods
-from .models import User, Question, Answer
+from .models import User, Question, Answer, ArchivedAnswer, Recommendation
 from .forms import UserLoginForm, UserSignupForm, QuestionForm, AnswerForm
-from django.db.models.functions import DenseRank
+from . import agreement, answered, archive, caching, columnar, export, jobs, metrics, profiling, rollups, sharding, streaming, trending, warmup
+from .search import search_questions
+from django.db.models.functions import Coalesce, DenseRank
+
+
+# Number of recommended questions shown above the unanswered tab
+RECOMMENDATIONS_ON_HOME = 3
+
+# Ids per in_bulk() query, under SQLite's bound parameter limit
+IN_BULK_CHUNK_SIZE = 900
+
+SEARCH_RESULTS_LIMIT = 50
+AUTOCOMPLETE_LIMIT = 8
+
+TRENDING_LIMIT = 24
+
+# Batch client API limits
+DECK_DEFAULT_SIZE = 20
+DECK_MAX_SIZE = 100
+# Newest questions read per step when the deck skips answered ones in Python
+DECK_SCAN_CHUNK = 500
+VOTE_BATCH_MAX_SIZE = 100
+
+# Leaderboard rows fetched and rendered per streamed chunk
+LEADERBOARD_CHUNK_SIZE = 100
+
+# What polls/leaderboard_entry.html shows of each user, as cached by leaderboard_rows()
+LEADERBOARD_USER_FIELDS = ('id', 'username', 'first_name', 'last_name', 'email', 'avatar')
+
+# Rows per table on the admin analytics page
+ANALYTICS_LIMIT = 10
+
+# Days of daily vote rollups charted on the results page
+TREND_DAYS = 14
+
+# Players listed under "Players who think like you" on the results page
+SIMILAR_PLAYERS_LIMIT = 10
 
 
 # ============================================================
@@ -36,6 +84,7 @@ def login_view(request):
             if user is not None:
                 # Log the user in
                 login(request, user)
+                metrics.LOGINS.inc()
                 messages.success(request, f'Welcome back, {user.username}!')
                 
                 # Redirect to next parameter or home
@@ -70,6 +119,7 @@ def signup_view(request):
         if form.is_valid():
             # Create new user
             user = form.save()
+            metrics.SIGNUPS.inc()
             
             # Get the password from cleaned data for authentication
             raw_password = form.cleaned_data.get('password1')
@@ -120,6 +170,41 @@ def logout_view(request):
 # MAIN APPLICATION VIEWS
 # ============================================================
 
+def visible_question_ids():
+    """Ids of visible questions, newest first: a scan of the (is_hidden, created_at) index"""
+    return np.fromiter(
+        Question.objects.filter(is_hidden=False).order_by('-created_at').values_list('id', flat=True),
+        dtype=np.int64,
+    )
+
+
+def questions_in_order(ids):
+    """Questions (with authors) for ids, in the order given, by primary key"""
+    questions = []
+    for start in range(0, len(ids), IN_BULK_CHUNK_SIZE):
+        chunk = ids[start:start + IN_BULK_CHUNK_SIZE].tolist()
+        found = Question.objects.select_related('author').in_bulk(chunk)
+        questions.extend(found[question_id] for question_id in chunk if question_id in found)
+    return questions
+
+
+@caching.cached('home_stats', ttl=settings.HOME_STATS_CACHE_SECONDS, key=lambda user, ids=None: user.pk)
+def home_stats(user, ids=None):
+    """
+    Tab counts for the home page. Cached per user; a user's own votes and
+    questions drop their entry, other users' new questions show up within
+    HOME_STATS_CACHE_SECONDS. Pass visible_question_ids() if the caller
+    already has them.
+    """
+    if ids is None:
+        ids = visible_question_ids()
+    answered_count = int(answered.answered_set(user.pk).contains_many(ids).sum())
+    return {
+        'unanswered_count': len(ids) - answered_count,
+        'answered_count': answered_count,
+    }
+
+
 @login_required
 def home_view(request):
     """
@@ -128,30 +213,50 @@ def home_view(request):
     """
     user = request.user
     
-    # Get answered question IDs for current user
-    answered_question_ids = Answer.objects.filter(
-        user=user
-    ).values_list('question_id', flat=True)
-    
-    # Get unanswered questions
-    unanswered_questions = Question.objects.exclude(
-        id__in=answered_question_ids
-    ).select_related('author').order_by('-created_at')
-    
-    # Get answered questions
-    answered_questions = Question.objects.filter(
-        id__in=answered_question_ids
-    ).select_related('author').order_by('-created_at')
+    # Compressed set of answered question ids (archived included), kept in
+    # the cache and updated on each vote; see polls/answered.py
+    answered_ids = answered.answered_set(user.id)
     
     # Determine active tab
     active_tab = request.GET.get('tab', 'unanswered')
     
+    # One index scan of question ids, split in memory against the set; only
+    # the active tab's questions are then fetched, by primary key
+    ids = None
+    unanswered_questions = []
+    answered_questions = []
+    if active_tab in ('unanswered', 'answered'):
+        ids = visible_question_ids()
+        mask = answered_ids.contains_many(ids)
+        if active_tab == 'unanswered':
+            unanswered_questions = questions_in_order(ids[~mask])
+        else:
+            answered_questions = questions_in_order(ids[mask])
+    
+    # "Answer next" picks, precomputed by build_recommendations
+    recommended_questions = [
+        recommendation.question
+        for recommendation in Recommendation.objects.filter(
+            user=user, question__is_hidden=False
+        ).select_related('question__author')
+        if recommendation.question_id not in answered_ids
+    ][:RECOMMENDATIONS_ON_HOME]
+    
+    # Scores are precomputed by refresh_trending; this is an index range scan
+    trending_questions = []
+    if active_tab == 'trending':
+        trending_questions = [
+            (question, score, question.id in answered_ids)
+            for question, score in trending.trending_questions(TRENDING_LIMIT)
+        ]
+    
     context = {
+        'trending_questions': trending_questions,
+        'recommended_questions': recommended_questions,
         'unanswered_questions': unanswered_questions,
         'answered_questions': answered_questions,
         'active_tab': active_tab,
-        'unanswered_count': unanswered_questions.count(),
-        'answered_count': answered_questions.count(),
+        **home_stats(user, ids),
     }
     
     return render(request, 'polls/home.html', context)
@@ -170,7 +275,14 @@ def new_question_view(request):
             question = form.save(commit=False)
             question.author = request.user
             question.save()
+            metrics.QUESTIONS_CREATED.inc()
+            home_stats.invalidate(request.user)
             messages.success(request, 'Question created successfully!')
+            if form.duplicate_of is not None:
+                messages.warning(
+                    request,
+                    f'Heads up: this looks a lot like "{form.duplicate_of}"'
+                )
             return redirect('home')
         else:
             messages.error(request, 'Please correct the errors below.')
@@ -189,6 +301,8 @@ def question_detail_view(request, question_id):
     """
     question = get_object_or_404(Question.objects.select_related('author'), id=question_id)
     user = request.user
+    if question.is_hidden and not user.is_staff:
+        raise Http404('Question not found')
     
     # Check if user has already answered
     user_answer = question.get_user_answer(user)
@@ -203,6 +317,18 @@ def question_detail_view(request, question_id):
         option_one_percentage = (option_one_votes / total_votes * 100) if total_votes > 0 else 0
         option_two_percentage = (option_two_votes / total_votes * 100) if total_votes > 0 else 0
         
+        # Pre-aggregated daily buckets, so this is O(days) rather than O(votes)
+        vote_trend = rollups.trend(question.id, buckets=TREND_DAYS)
+        
+        # Bitset comparison against every player, then one query for the names
+        similar = agreement.similar_players(user.id, SIMILAR_PLAYERS_LIMIT)
+        players = User.objects.in_bulk([user_id for user_id, _, _ in similar])
+        similar_players = [
+            {'user': players[user_id], 'common': common, 'agreement': round(rate * 100)}
+            for user_id, common, rate in similar
+            if user_id in players
+        ]
+        
         context = {
             'question': question,
             'user_answer': user_answer,
@@ -211,6 +337,9 @@ def question_detail_view(request, question_id):
             'option_two_votes': option_two_votes,
             'option_one_percentage': round(option_one_percentage, 1),
             'option_two_percentage': round(option_two_percentage, 1),
+            'vote_trend': vote_trend,
+            'vote_trend_total': sum(point['total'] for point in vote_trend),
+            'similar_players': similar_players,
             'show_results': True,
         }
     else:
@@ -224,10 +353,15 @@ def question_detail_view(request, question_id):
                 
                 try:
                     answer.save()
-                    messages.success(request, 'Answer submitted successfully!')
-                    return redirect('question_detail', question_id=question.id)
                 except Exception as e:
                     messages.error(request, 'An error occurred while saving your answer.')
+                else:
+                    metrics.VOTES.inc()
+                    answered.record_votes(user.id, [question.id])
+                    home_stats.invalidate(user)
+                    jobs.queue_vote_aggregates_after_votes()
+                    messages.success(request, 'Answer submitted successfully!')
+                    return redirect('question_detail', question_id=question.id)
             else:
                 messages.error(request, 'Please select an option.')
         else:
@@ -242,33 +376,184 @@ def question_detail_view(request, question_id):
     return render(request, 'polls/question_detail.html', context)
 
 @login_required
-def leaderboard_view(request):
+def search_view(request):
     """
-    Display leaderboard without conflicting property names
+    Full-text search over question options, ranked by relevance.
+    Requires authentication.
     """
-    users = User.objects.annotate(
-        questions_authored_count=Count('questions', distinct=True),
-        answers_count=Count('answers', distinct=True)  # or exclude self if needed
-    )
+    query = request.GET.get('q', '').strip()
+    results = search_questions(query, limit=SEARCH_RESULTS_LIMIT) if query else []
+    
+    return render(request, 'polls/search.html', {
+        'query': query,
+        'results': results,
+    })
 
-    # Sort by total score
-    sorted_users = sorted(
-        users,
-        key=lambda u: (u.questions_authored_count + u.answers_count),
-        reverse=True
-    )
 
-    leaderboard = []
-    for idx, user in enumerate(sorted_users, start=1):
-        leaderboard.append({
-            'rank': idx,
+@login_required
+def search_autocomplete_view(request):
+    """
+    JSON suggestions for the search box; the last word matches as a prefix.
+    Requires authentication.
+    """
+    query = request.GET.get('q', '').strip()
+    results = search_questions(query, limit=AUTOCOMPLETE_LIMIT) if len(query) >= 2 else []
+    
+    return JsonResponse({
+        'results': [
+            {
+                'id': question.id,
+                'text': f"{question.option_one_text} or {question.option_two_text}",
+                'url': reverse('question_detail', args=[question.id]),
+            }
+            for question in results
+        ]
+    })
+
+
+def leaderboard_entries(limit=None, exclude_ids=(), start=1):
+    """
+    The first `limit` leaderboard rows (every user when None), ranked in the
+    database and read with a chunked iterator, for the streaming leaderboard.
+    exclude_ids and start carry on a board after its cached head. Per-user
+    counts are correlated subqueries rather than joins, so one user's rows
+    don't multiply another's.
+    """
+    question_counts = Question.objects.filter(author=OuterRef('pk')).order_by().values(
+        'author'
+    ).annotate(count=Count('id')).values('count')
+    # Only what the leaderboard shows, since the rows end up in the cache
+    users = User.objects.only(
+        'username', 'first_name', 'last_name', 'email', 'avatar', 'date_joined'
+    ).annotate(
+        questions_authored_count=Coalesce(Subquery(question_counts), 0),
+    ).exclude(id__in=exclude_ids)
+    
+    if sharding.enabled():
+        users = sharded_leaderboard_users(users, limit)
+    else:
+        answer_counts = Answer.objects.filter(user=OuterRef('pk')).order_by().values(
+            'user'
+        ).annotate(count=Count('id')).values('count')
+        users = users.annotate(
+            answers_count=Coalesce(Subquery(answer_counts), 0) + F('archived_answers'),
+        ).annotate(
+            total=F('questions_authored_count') + F('answers_count'),
+        ).order_by('-total', '-date_joined', '-id')
+        if limit is not None:
+            users = users[:limit]
+        users = users.iterator(chunk_size=LEADERBOARD_CHUNK_SIZE)
+    
+    for rank, user in enumerate(users, start=start):
+        yield {
+            'rank': rank,
             'user': user,
             'questions_asked': user.questions_authored_count,
             'questions_answered': user.answers_count,
-            'total_score': user.questions_authored_count + user.answers_count
-        })
+            'total_score': user.total,
+        }
+
+
+def sharded_leaderboard_users(users, limit):
+    """
+    The top `limit` users (all of them when None) with answers spread over
+    shards. Users are read from the default database in chunks by id, each
+    chunk's live answer counts are summed from every shard, and only the
+    best `limit` are kept in a heap, so with a limit memory doesn't grow
+    with the user table.
+    """
+    users = users.only(
+        'username', 'first_name', 'last_name', 'email', 'avatar', 'date_joined', 'archived_answers'
+    ).order_by('id')
+    top = []
+    last_id = 0
+    while True:
+        chunk = list(users.filter(id__gt=last_id)[:IN_BULK_CHUNK_SIZE])
+        if not chunk:
+            break
+        last_id = chunk[-1].id
+        answer_counts = sharding.answer_counts_by_user([user.id for user in chunk])
+        for user in chunk:
+            user.answers_count = answer_counts.get(user.id, 0) + user.archived_answers
+            user.total = user.questions_authored_count + user.answers_count
+            # Same order as the unsharded query; ids are unique, so users are never compared
+            entry = (user.total, user.date_joined, user.id, user)
+            if limit is None or len(top) < limit:
+                heapq.heappush(top, entry)
+            elif entry > top[0]:
+                heapq.heapreplace(top, entry)
+    return [entry[-1] for entry in sorted(top, reverse=True)]
+
+
+@caching.cached('leaderboard', ttl=settings.LEADERBOARD_CACHE_SECONDS)
+def leaderboard_rows():
+    """
+    The ranked leaderboard, shared by every request. The ranking query is the
+    slowest in the app, so an expired copy is served while one request
+    recomputes it (see polls/caching.py). Only the top
+    LEADERBOARD_CACHE_ROWS are cached, as small tuples (the
+    LEADERBOARD_USER_FIELDS then questions asked and answered) rather than
+    whole users; the rest of the board streams from the database.
+    """
+    return [
+        (
+            entry['user'].id, entry['user'].username, entry['user'].first_name,
+            entry['user'].last_name, entry['user'].email, entry['user'].avatar.name,
+            entry['questions_asked'], entry['questions_answered'],
+        )
+        for entry in leaderboard_entries(leaderboard_head_size())
+    ]
 
-    return render(request, 'polls/leaderboard.html', {'leaderboard': leaderboard})
+
+def leaderboard_head_size():
+    if settings.LEADERBOARD_SIZE is None:
+        return settings.LEADERBOARD_CACHE_ROWS
+    return min(settings.LEADERBOARD_SIZE, settings.LEADERBOARD_CACHE_ROWS)
+
+
+def cached_leaderboard_entries():
+    """
+    The cached head of the leaderboard, then the rest read live. The tail
+    leaves out the head's users, so everyone appears once even when the
+    cached copy is a little stale.
+    """
+    # A generator, so a streamed page's header still goes out before a recompute
+    head = leaderboard_rows()
+    for rank, (*fields, asked, answers_count) in enumerate(head, start=1):
+        yield {
+            'rank': rank,
+            # Unsaved, but with the pk, so `entry.user == user` still works
+            'user': User(**dict(zip(LEADERBOARD_USER_FIELDS, fields))),
+            'questions_asked': asked,
+            'questions_answered': answers_count,
+            'total_score': asked + answers_count,
+        }
+    if len(head) < leaderboard_head_size() or len(head) == settings.LEADERBOARD_SIZE:
+        return
+    yield from leaderboard_entries(
+        None if settings.LEADERBOARD_SIZE is None else settings.LEADERBOARD_SIZE - len(head),
+        exclude_ids=[row[0] for row in head],
+        start=len(head) + 1,
+    )
+
+
+@login_required
+def leaderboard_view(request):
+    """
+    Display leaderboard without conflicting property names
+    """
+    if settings.LEADERBOARD_STREAMING:
+        # Header goes out before the ranking query runs; rows follow in chunks
+        return streaming.stream_page(
+            request,
+            'polls/leaderboard.html',
+            {'leaderboard': User.objects.exists()},
+            'polls/leaderboard_entry.html',
+            cached_leaderboard_entries(),
+            chunk_size=LEADERBOARD_CHUNK_SIZE,
+        )
+    
+    return render(request, 'polls/leaderboard.html', {'leaderboard': list(cached_leaderboard_entries())})
 
 # @login_required
 # def leaderboard_view(request):
@@ -300,6 +585,294 @@ def leaderboard_view(request):
     return render(request, 'polls/leaderboard.html', {'leaderboard': leaderboard})
 
 
+# ============================================================
+# API VIEWS (batch clients)
+# ============================================================
+
+def unanswered_deck(questions, answered_ids, size):
+    """
+    The first `size` of questions (ordered newest first) not in answered_ids.
+    With answers on shards the exclusion can't be a subquery, and a prolific
+    user's ids would overflow one IN list, so candidates are read a chunk at a
+    time and checked against the answered set.
+    """
+    deck = []
+    while len(deck) < size:
+        chunk = list(questions[:DECK_SCAN_CHUNK])
+        if not chunk:
+            break
+        mask = answered_ids.contains_many([question['id'] for question in chunk])
+        deck.extend(question for question, done in zip(chunk, mask) if not done)
+        last = chunk[-1]
+        questions = questions.filter(
+            Q(created_at__lt=last['created_at']) | Q(created_at=last['created_at'], id__lt=last['id'])
+        )
+    return deck[:size]
+
+
+@login_required
+def api_deck_view(request):
+    """
+    The next N questions the user hasn't answered, newest first, as JSON.
+    One query. Requires authentication.
+    """
+    try:
+        size = min(max(int(request.GET.get('size', DECK_DEFAULT_SIZE)), 1), DECK_MAX_SIZE)
+    except ValueError:
+        return JsonResponse({'error': 'size must be a number'}, status=400)
+    
+    questions = Question.objects.filter(is_hidden=False).order_by('-created_at', '-id').values(
+        'id', 'option_one_text', 'option_two_text', 'created_at', 'author__username'
+    )
+    if sharding.enabled():
+        questions = unanswered_deck(questions, answered.answered_set(request.user.id), size)
+    else:
+        questions = questions.exclude(archive.answered_filter(request.user))[:size]
+    
+    return JsonResponse({
+        'questions': [
+            {
+                'id': question['id'],
+                'option_one_text': question['option_one_text'],
+                'option_two_text': question['option_two_text'],
+                'author': question['author__username'],
+                'created_at': question['created_at'],
+            }
+            for question in questions
+        ]
+    })
+
+
+@login_required
+@require_http_methods(["POST"])
+def api_votes_view(request):
+    """
+    Record many votes in one request. Body:
+    {"votes": [{"question_id": 1, "option_selected": "optionOne"}, ...]}
+    Returns a status per vote: created, duplicate, not_found or invalid.
+    Requires authentication.
+    """
+    try:
+        votes = json.loads(request.body)['votes']
+        if not isinstance(votes, list):
+            raise TypeError
+    except (ValueError, KeyError, TypeError):
+        return JsonResponse({'error': 'Expected {"votes": [...]}'}, status=400)
+    if len(votes) > VOTE_BATCH_MAX_SIZE:
+        return JsonResponse({'error': f'At most {VOTE_BATCH_MAX_SIZE} votes per request'}, status=400)
+    
+    user = request.user
+    valid_options = dict(Answer.OPTION_CHOICES)
+    statuses = [None] * len(votes)
+    wanted = {}  # question_id -> index of the first vote for it
+    for i, vote in enumerate(votes):
+        question_id = vote.get('question_id') if isinstance(vote, dict) else None
+        # bool is an int subclass; true must not vote on question 1
+        if (not isinstance(question_id, int) or isinstance(question_id, bool)
+                or vote.get('option_selected') not in valid_options):
+            statuses[i] = 'invalid'
+        elif question_id in wanted:
+            statuses[i] = 'duplicate'
+        else:
+            wanted[question_id] = i
+    
+    existing = dict(
+        Question.objects.filter(id__in=list(wanted), is_hidden=False).values_list('id', 'archived_at')
+    ) if wanted else {}
+    archived_ids = [question_id for question_id, archived_at in existing.items() if archived_at]
+    already_archived = set(
+        ArchivedAnswer.objects.filter(user=user, question_id__in=archived_ids)
+        .values_list('question_id', flat=True)
+    ) if archived_ids else set()
+    
+    now = timezone.now()
+    answers = []
+    for question_id, i in wanted.items():
+        if question_id not in existing:
+            statuses[i] = 'not_found'
+        elif question_id in already_archived:
+            statuses[i] = 'duplicate'
+        else:
+            answers.append(Answer(
+                user=user,
+                question_id=question_id,
+                option_selected=votes[i]['option_selected'],
+                answered_at=now,
+            ))
+    
+    created = set()
+    if answers:
+        answered_before = set(sharding.all_rows(
+            Answer.objects.filter(user=user, question_id__in=[answer.question_id for answer in answers]),
+            'question_id', flat=True,
+        ))
+        for answer in answers:
+            statuses[wanted[answer.question_id]] = (
+                'duplicate' if answer.question_id in answered_before else 'created'
+            )
+        answers = [answer for answer in answers if answer.question_id not in answered_before]
+        # A concurrent request's insert of the same pair is skipped by the unique constraint
+        sharding.bulk_create(answers, ignore_conflicts=True)
+        created = {answer.question_id for answer in answers}
+    
+    if created:
+        metrics.VOTES.inc(len(created))
+        answered.record_votes(user.id, sorted(created))
+        home_stats.invalidate(user)
+        jobs.queue_vote_aggregates_after_votes()
+    
+    return JsonResponse({
+        'created': len(created),
+        'results': [
+            {
+                'question_id': vote.get('question_id') if isinstance(vote, dict) else None,
+                'status': status,
+            }
+            for vote, status in zip(votes, statuses)
+        ],
+    })
+
+
+# ============================================================
+# OPERATIONS
+# ============================================================
+
+@staff_member_required
+def export_view(request, name):
+    """
+    Stream a full table export as CSV or JSONL, optionally gzipped.
+    Staff only.
+    """
+    if name not in export.EXPORTS:
+        raise Http404('Unknown export')
+    
+    fmt = request.GET.get('format', 'csv')
+    if fmt not in export.FORMATS:
+        return HttpResponse('Unsupported format', status=400, content_type='text/plain')
+    compress = request.GET.get('gzip') == '1'
+    
+    response = StreamingHttpResponse(
+        export.export_stream(name, fmt, compress=compress),
+        content_type='application/gzip' if compress else export.FORMATS[fmt],
+    )
+    filename = export.export_filename(name, fmt, compress)
+    response['Content-Disposition'] = f'attachment; filename="{filename}"'
+    return response
+
+
+@staff_member_required
+def answer_analytics_view(request):
+    """
+    Admin analytics computed from the columnar answer store (polls/columnar.py)
+    rather than the Answer table. Staff only.
+    """
+    store = columnar.AnswerStore()
+    most_polarizing, least_polarizing = store.polarization(limit=ANALYTICS_LIMIT)
+    
+    agreement_user = None
+    agreement = []
+    username = request.GET.get('user', '').strip()
+    if username:
+        agreement_user = User.objects.filter(username=username).first()
+        if agreement_user is None:
+            messages.error(request, f'No user named "{username}".')
+        else:
+            agreement = store.agreement(agreement_user.id, limit=ANALYTICS_LIMIT)
+    
+    # Only labels come from the database: a primary key lookup of the ids shown
+    question_ids = [row[0] for row in most_polarizing + least_polarizing]
+    questions = Question.objects.in_bulk(question_ids)
+    users = User.objects.in_bulk([row[0] for row in agreement])
+    
+    context = {
+        **admin.site.each_context(request),
+        'title': 'Answer analytics',
+        'summary': store.summary(),
+        'most_polarizing': [(questions.get(row[0]), *row[1:]) for row in most_polarizing],
+        'least_polarizing': [(questions.get(row[0]), *row[1:]) for row in least_polarizing],
+        'username': username,
+        'agreement_user': agreement_user,
+        'agreement': [(users.get(row[0]), *row[1:]) for row in agreement],
+    }
+    return render(request, 'polls/admin_analytics.html', context)
+
+
+@staff_member_required
+def profile_list_view(request):
+    """Recent request profiles (polls/profiling.py). Staff only."""
+    return render(request, 'polls/admin_profiles.html', {
+        **admin.site.each_context(request),
+        'title': 'Request profiles',
+        'profiles': profiling.recent(),
+        'rate_limit': settings.PROFILE_RATE_LIMIT,
+    })
+
+
+@staff_member_required
+def profile_detail_view(request, profile_id):
+    """
+    Top functions and time per phase (database, ORM compile, templates)
+    of one profiled request. Staff only.
+    """
+    data = profiling.load(profile_id)
+    if data is None:
+        raise Http404('Unknown profile')
+    
+    summary = profiling.summarize(data)
+    return render(request, 'polls/admin_profile.html', {
+        **admin.site.each_context(request),
+        'title': f"Profile of {data['method']} {data['path']}",
+        'profile': data,
+        'summary': summary,
+        'tables': [
+            ('Top functions by self time', summary['by_self']),
+            ('Top functions by total time (on the stack)', summary['by_total']),
+        ],
+    })
+
+
+@staff_member_required
+def profile_folded_view(request, profile_id):
+    """A profile's collapsed stacks, the input format of flamegraph.pl and speedscope. Staff only."""
+    data = profiling.load(profile_id)
+    if data is None:
+        raise Http404('Unknown profile')
+    
+    response = HttpResponse(profiling.folded(data), content_type='text/plain; charset=utf-8')
+    response['Content-Disposition'] = f'attachment; filename="{profile_id}.folded"'
+    return response
+
+
+@never_cache
+def metrics_view(request):
+    """
+    Expose the metrics registry in Prometheus text format.
+    Scrapers authenticate with METRICS_TOKEN; without one configured only
+    logged-in staff can read it.
+    """
+    if settings.METRICS_TOKEN:
+        expected = f'Bearer {settings.METRICS_TOKEN}'
+        if not constant_time_compare(request.headers.get('Authorization', ''), expected):
+            return HttpResponse('Unauthorized', status=401, content_type='text/plain')
+    elif not request.user.is_staff:
+        return HttpResponse('Forbidden', status=403, content_type='text/plain')
+    
+    return HttpResponse(
+        metrics.registry.render(),
+        content_type='text/plain; version=0.0.4; charset=utf-8'
+    )
+
+
+@never_cache
+def ready_view(request):
+    """
+    Readiness probe: 200 once this worker has warmed up (polls/warmup.py)
+    and reaches its default database, 503 before that
+    """
+    status = warmup.readiness()
+    return JsonResponse(status, status=200 if status['ready'] else 503)
+
+
 # ============================================================
 # ERROR HANDLERS
 # ============================================================
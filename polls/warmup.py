@@ -0,0 +1,134 @@
+import logging
+import os
+import time
+from pathlib import Path
+
+from django.db import DEFAULT_DB_ALIAS, connections
+from django.template import engines
+from django.urls import URLResolver, get_resolver
+
+
+logger = logging.getLogger('polls.warmup')
+
+# Admin templates behind the staff pages, compiled along with the app's own
+ADMIN_TEMPLATES = [
+    'admin/base_site.html',
+    'admin/index.html',
+    'admin/login.html',
+    'admin/change_list.html',
+    'admin/change_form.html',
+    'admin/delete_selected_confirmation.html',
+]
+
+# Filled in by warm_up(); forked workers inherit it along with the warm caches
+_state = {'warm': False, 'steps': {}, 'pid': None}
+
+# Probes may come every second from each balancer; reuse a check this recent
+READY_CHECK_SECONDS = 2.0
+_last_check = {'at': None, 'pid': None, 'databases': None}
+
+
+def populate(resolver):
+    """Build the reverse lookup tables of a resolver and every resolver below it"""
+    resolver.reverse_dict
+    count = 1
+    for pattern in resolver.url_patterns:
+        if isinstance(pattern, URLResolver):
+            count += populate(pattern)
+    return count
+
+
+def warm_urls():
+    """Import the URLconf (and with it every view module) and build its resolvers"""
+    return populate(get_resolver())
+
+
+def app_templates(engine):
+    """Names of the templates the polls app ships"""
+    names = set()
+    for directory in engine.template_dirs:
+        for path in Path(directory, 'polls').glob('*.html'):
+            names.add(f'polls/{path.name}')
+    return sorted(names)
+
+
+def warm_templates():
+    """
+    Compile every app template and the admin ones into the cached loader,
+    so no request pays for parsing them
+    """
+    compiled = 0
+    for engine in engines.all():
+        for name in app_templates(engine) + ADMIN_TEMPLATES:
+            engine.get_template(name)
+            compiled += 1
+    return compiled
+
+
+def check_databases(aliases=None):
+    """Run SELECT 1 on every database (or those given); {alias: 'ok' or the error}"""
+    results = {}
+    for alias in aliases or connections:
+        try:
+            with connections[alias].cursor() as cursor:
+                cursor.execute('SELECT 1')
+            results[alias] = 'ok'
+        except Exception as e:
+            results[alias] = f'{type(e).__name__}: {e}'
+    return results
+
+
+def warm_up():
+    """
+    Do what the first requests of a fresh worker would otherwise pay for:
+    URL resolvers, compiled templates, a round trip to each database.
+
+    Connections are closed again afterwards, because under gunicorn's
+    preload_app this runs in the master and a connection (an open SQLite
+    file included) must not be shared by forked workers; after_fork() opens
+    one per worker instead.
+    """
+    steps = {}
+    started = time.perf_counter()
+    for name, step in (('urls', warm_urls), ('templates', warm_templates), ('databases', check_databases)):
+        step_started = time.perf_counter()
+        result = step()
+        steps[name] = round(time.perf_counter() - step_started, 4)
+        if name == 'databases' and any(status != 'ok' for status in result.values()):
+            logger.warning('Warm-up database check failed: %s', result)
+    connections.close_all()
+
+    _state.update(warm=True, steps=steps, pid=os.getpid())
+    logger.info('Warmed up in %.3fs: %s', time.perf_counter() - started, steps)
+    return steps
+
+
+def after_fork():
+    """Open this worker's own database connections (gunicorn post_fork hook)"""
+    for alias in connections:
+        try:
+            connections[alias].ensure_connection()
+        except Exception:
+            # The worker still starts; /ready/ reports the database as down
+            logger.exception('Could not connect to database %s after fork', alias)
+
+
+def readiness():
+    """
+    Whether this process is warm and can reach the default database. The
+    answer shards are left out so a probe costs one query at most, and the
+    check is reused for READY_CHECK_SECONDS.
+    """
+    now = time.monotonic()
+    if (_last_check['pid'] != os.getpid() or _last_check['at'] is None
+            or now - _last_check['at'] >= READY_CHECK_SECONDS):
+        _last_check.update(at=now, pid=os.getpid(), databases=check_databases([DEFAULT_DB_ALIAS]))
+    databases = _last_check['databases']
+    return {
+        'ready': _state['warm'] and all(status == 'ok' for status in databases.values()),
+        'warm': _state['warm'],
+        'warm_up_seconds': _state['steps'],
+        'warmed_in_pid': _state['pid'],
+        'pid': os.getpid(),
+        'databases': databases,
+    }
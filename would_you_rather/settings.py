@@ -49,11 +49,14 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    'polls.middleware.QueryInstrumentationMiddleware',
+    'polls.middleware.MetricsMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
     'django.middleware.csrf.CsrfViewMiddleware',
     'django.contrib.auth.middleware.AuthenticationMiddleware',
+    'polls.middleware.ProfilingMiddleware',
     'django.contrib.messages.middleware.MessageMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
 ]
@@ -134,6 +137,23 @@ STATIC_ROOT = BASE_DIR / 'staticfiles'
 MEDIA_URL = '/media/'
 MEDIA_ROOT = BASE_DIR / 'media'
 
+# Hashed filenames plus .gz/.br variants, built by collectstatic
+STORAGES = {
+    'default': {
+        'BACKEND': 'django.core.files.storage.FileSystemStorage',
+    },
+    'staticfiles': {
+        'BACKEND': 'polls.storage.CompressedManifestStaticFilesStorage',
+    },
+}
+
+# Serve STATIC_ROOT and MEDIA_ROOT from the WSGI layer (see polls/static_serving.py).
+# Turn off when a CDN or reverse proxy serves these paths.
+SERVE_STATIC_FILES = os.environ.get('SERVE_STATIC_FILES', '1') == '1'
+# Cache lifetime for unhashed files; hashed static files are cached for a year
+STATIC_FILES_MAX_AGE = 60
+MEDIA_FILES_MAX_AGE = 60 * 60
+
 # Default primary key field type
 DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'
 
@@ -143,4 +163,138 @@ AUTH_USER_MODEL = 'polls.User'
 # Login settings
 LOGIN_URL = '/'
 LOGIN_REDIRECT_URL = '/home/'
-LOGOUT_REDIRECT_URL = '/'
\ No newline at end of file
+LOGOUT_REDIRECT_URL = '/'
+
+
+# On-disk state for derived data (recommendations, indexes, analytics files)
+VAR_DIR = Path(os.environ.get('VAR_DIR', BASE_DIR / 'var'))
+
+# "Answer next" recommendations (see polls/recommender.py)
+RECOMMENDER_DIR = VAR_DIR / 'recommender'
+RECOMMENDATIONS_PER_USER = 20
+
+# Memory-mapped column files of all answers for analytics (see polls/columnar.py)
+COLUMNAR_DIR = VAR_DIR / 'columnar'
+
+# Near-duplicate question detection (see polls/dedup.py)
+DEDUP_INDEX_DIR = VAR_DIR / 'dedup'
+# 'reject' blocks near-duplicates, 'warn' saves them with a warning, 'off' disables
+DUPLICATE_QUESTION_MODE = os.environ.get('DUPLICATE_QUESTION_MODE', 'reject')
+# Estimated Jaccard similarity of option shingles above which questions count as duplicates
+DUPLICATE_QUESTION_THRESHOLD = 0.8
+
+# Hourly/daily vote rollups (see polls/rollups.py). Answers younger than this
+# are left for the next rollup_votes run so late commits aren't skipped.
+ROLLUP_LAG_SECONDS = 60
+
+# Trending tab (see polls/trending.py): a vote's weight halves every this many hours
+TRENDING_HALF_LIFE_HOURS = 6
+# Questions whose decayed vote count falls below this drop off the tab
+TRENDING_MIN_SCORE = 0.1
+
+# Answers on questions older than this are moved to the archive table by
+# archive_answers (see polls/archive.py)
+ARCHIVE_AFTER_DAYS = 180
+
+# Database-backed task queue (see polls/tasks.py), run with run_worker
+TASK_MAX_ATTEMPTS = 5
+# Retries back off exponentially from the base delay up to the max (seconds)
+TASK_RETRY_BASE_DELAY = 10
+TASK_RETRY_MAX_DELAY = 60 * 60
+# Running tasks locked longer than this are assumed lost and queued again
+TASK_LOCK_TIMEOUT = 10 * 60
+
+# "Players who think like you" bitsets (see polls/agreement.py)
+AGREEMENT_INDEX_DIR = VAR_DIR / 'agreement'
+# Players sharing fewer answered questions than this aren't ranked
+AGREEMENT_MIN_COMMON = 5
+# New votes reach the bitsets at most this many seconds later (a queued update)
+AGREEMENT_UPDATE_SECONDS = int(os.environ.get('AGREEMENT_UPDATE_SECONDS', '300'))
+
+# Cache backend for aggregates (see polls/caching.py). LocMemCache is per
+# process; a shared backend makes the recompute lock cover every worker.
+CACHES = {
+    'default': {
+        'BACKEND': os.environ.get('CACHE_BACKEND', 'django.core.cache.backends.locmem.LocMemCache'),
+        'LOCATION': os.environ.get('CACHE_LOCATION', ''),
+    }
+}
+AGGREGATE_CACHE = 'default'
+LEADERBOARD_CACHE_SECONDS = 60
+# Leaderboard rows cached; the rest of the board streams from the database
+LEADERBOARD_CACHE_ROWS = int(os.environ.get('LEADERBOARD_CACHE_ROWS', '100'))
+HOME_STATS_CACHE_SECONDS = 30
+# Expired aggregates are served this much longer while one request recomputes them
+CACHE_STALE_SECONDS = 5 * 60
+# Per-user compressed sets of answered question ids (see polls/answered.py)
+ANSWERED_SET_CACHE_SECONDS = 60 * 60
+
+# Staff-only request profiling (polls.middleware.ProfilingMiddleware): send
+# "X-Profile: 1" or add ?profile=1; profiles are listed at /admin/profiles/
+PROFILING_ENABLED = os.environ.get('PROFILING_ENABLED', '1') == '1'
+PROFILE_DIR = VAR_DIR / 'profiles'
+# Profiles started per minute at most (per process with LocMemCache)
+PROFILE_RATE_LIMIT = int(os.environ.get('PROFILE_RATE_LIMIT', '10'))
+PROFILE_SAMPLE_INTERVAL_MS = 5
+# Older profiles are deleted
+PROFILE_KEEP = 200
+
+# Build URL resolvers, compile templates and check the databases when the
+# WSGI/ASGI application is loaded (see polls/warmup.py); /ready/ reports 503
+# until a process is warm
+WARM_UP_ON_BOOT = os.environ.get('WARM_UP_ON_BOOT', '1') == '1'
+
+# Optional sharding of Answer rows by question across databases (see
+# polls/sharding.py). ANSWER_SHARDS=N adds SQLite databases answers_0..N-1
+# under ANSWER_SHARD_DIR, unless DATABASES already defines those aliases.
+# Run rebalance_answers after changing it; shards can be added, not removed.
+ANSWER_SHARDS = int(os.environ.get('ANSWER_SHARDS', '0'))
+ANSWER_SHARD_DIR = Path(os.environ.get('ANSWER_SHARD_DIR', VAR_DIR / 'shards'))
+ANSWER_SHARD_ALIASES = [f'answers_{i}' for i in range(ANSWER_SHARDS)]
+for alias in ANSWER_SHARD_ALIASES:
+    DATABASES.setdefault(alias, {
+        'ENGINE': 'django.db.backends.sqlite3',
+        'NAME': ANSWER_SHARD_DIR / f'{alias}.sqlite3',
+    })
+DATABASE_ROUTERS = ['polls.sharding.AnswerShardRouter']
+
+# Stream the leaderboard (polls/streaming.py) instead of rendering it in one piece
+LEADERBOARD_STREAMING = os.environ.get('LEADERBOARD_STREAMING', '1') == '1'
+# Users ranked on the leaderboard; unset ranks everyone
+LEADERBOARD_SIZE = int(os.environ['LEADERBOARD_SIZE']) if os.environ.get('LEADERBOARD_SIZE') else None
+
+# Request instrumentation (polls.middleware.QueryInstrumentationMiddleware).
+# Off by default; when off the middleware removes itself from the stack.
+REQUEST_INSTRUMENTATION = os.environ.get('REQUEST_INSTRUMENTATION', '0') == '1'
+# Fraction of requests to instrument (0.0 - 1.0)
+REQUEST_INSTRUMENTATION_SAMPLE_RATE = float(os.environ.get('REQUEST_INSTRUMENTATION_SAMPLE_RATE', '1.0'))
+SLOW_QUERY_MS = float(os.environ.get('SLOW_QUERY_MS', '100'))
+# Report a statement as a likely N+1 once it repeats this many times in one request
+DUPLICATE_QUERY_THRESHOLD = 5
+
+# Prometheus-style metrics served at /metrics/ (see polls/metrics.py)
+METRICS_ENABLED = os.environ.get('METRICS_ENABLED', '1') == '1'
+# Shared directory for per-worker metric files; set this when running several
+# gunicorn workers so a scrape sees the sum over all of them
+METRICS_MULTIPROC_DIR = os.environ.get('METRICS_MULTIPROC_DIR')
+# Seconds between per-worker file writes in multiprocess mode
+METRICS_FLUSH_INTERVAL = 5
+# When set, scrapes must send "Authorization: Bearer <token>"; when unset
+# only logged-in staff can read /metrics/
+METRICS_TOKEN = os.environ.get('METRICS_TOKEN')
+
+LOGGING = {
+    'version': 1,
+    'disable_existing_loggers': False,
+    'handlers': {
+        'console': {
+            'class': 'logging.StreamHandler',
+        },
+    },
+    'loggers': {
+        'polls': {
+            'handlers': ['console'],
+            'level': 'INFO',
+        },
+    },
+}
\ No newline at end of file
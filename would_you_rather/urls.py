@@ -21,6 +21,10 @@ from django.conf.urls.static import static
 from polls import views as polls_views
 
 urlpatterns = [
+    path('admin/analytics/', polls_views.answer_analytics_view, name='answer_analytics'),
+    path('admin/profiles/', polls_views.profile_list_view, name='profile_list'),
+    path('admin/profiles/<str:profile_id>/', polls_views.profile_detail_view, name='profile_detail'),
+    path('admin/profiles/<str:profile_id>/folded/', polls_views.profile_folded_view, name='profile_folded'),
     path('admin/', admin.site.urls),
     path('', include('polls.urls')),
 ]
@@ -28,7 +32,8 @@ urlpatterns = [
 # Custom 404 handler
 handler404 = 'polls.views.custom_404_view'
 
-# Serve media files in development
-if settings.DEBUG or True:
+# Serve media files in development. Under WSGI with SERVE_STATIC_FILES on,
+# polls/static_serving.py answers these paths before Django is reached.
+if settings.DEBUG:
     urlpatterns += static(settings.MEDIA_URL, document_root=settings.MEDIA_ROOT)
     urlpatterns += static(settings.STATIC_URL, document_root=settings.STATIC_ROOT)
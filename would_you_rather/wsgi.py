@@ -9,8 +9,18 @@ https://docs.djangoproject.com/en/6.0/howto/deployment/wsgi/
 
 import os
 
+from django.conf import settings
 from django.core.wsgi import get_wsgi_application
 
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'would_you_rather.settings')
 
 application = get_wsgi_application()
+
+if settings.SERVE_STATIC_FILES:
+    from polls.static_serving import StaticFilesApplication
+    application = StaticFilesApplication(application)
+
+# Under gunicorn --preload this runs once in the master, before fork
+if settings.WARM_UP_ON_BOOT:
+    from polls.warmup import warm_up
+    warm_up()